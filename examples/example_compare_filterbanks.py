@@ -1,5 +1,6 @@
 from spectralib.filterbank import *
 from spectralib.frb import *
+from spectralib.background import generate_noise_background
 
 tobs = 10
 tsamp = 0.001
@@ -19,7 +20,7 @@ metadata = {
     "tsamp": tsamp,
 }
 
-data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+data = generate_noise_background(nchans, nsamp, noisesigma)
 filename1 = "RFIoutput_test.fil"
 create_filterbank(data, filename1, metadata)
 
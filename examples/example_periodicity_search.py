@@ -0,0 +1,69 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from spectralib.pulsar import generate_solitary_pulsar
+from spectralib.dedisperse import dedisperse_filterbank_data_multi_dm
+from spectralib.search import periodicity_search
+from spectralib.background import generate_noise_background
+
+
+def main():
+    tobs = 60 # observation time in seconds
+    tsamp = 0.001 # sample time in seconds
+
+    metadata = {
+    "source_name": "spectralib_pulsar",
+    "machine_id": 0,
+    "telescope_id": 0,
+    "data_type": 0,
+    "fch1": 1500.0,
+    "foff": -2.0,
+    "nchans": 128,
+    "nbits": 8,
+    "tstart": 55555.0,
+    "tsamp": tsamp,
+    "nifs": 1,
+    "nbeams": 1,
+    "ibeam": 1
+    }
+
+    noisesigma = 18 #standard deviation of noise, value copied from some ASKAP data
+    nchans = metadata["nchans"]
+    nsamp = round(tobs/tsamp)
+    fch1 = metadata["fch1"]
+    foff = metadata["foff"]
+    data = generate_noise_background(nchans, nsamp, noisesigma)
+
+    # add a faint pulsar, whose single pulses are well below the noise
+    DM = 150  # Dispersion measure of the pulsar
+    rest_period = 0.0893  # Pulse period in seconds
+    pulse_params = {
+        'pulse_duration': 4,
+        'pulse_amplitude': 3
+    }
+    data = generate_solitary_pulsar(data, DM, tsamp, foff, fch1, rest_period, **pulse_params)
+
+    # Dedisperse over a grid of DM trials
+    DMs = np.arange(0, 300, 10)
+    dm_time = dedisperse_filterbank_data_multi_dm(data, DMs, tsamp, foff, fch1)
+
+    # FFT search every DM trial, summing up to 16 harmonics
+    candidates = periodicity_search(dm_time, tsamp, DMs=DMs, nharmonics=16)
+
+    print("Injected pulsar with period " + str(rest_period) + " s at DM " + str(DM))
+    for candidate in candidates[:10]:
+        print(f"DM: {candidate['DM']:.1f}  period: {candidate['period']:.6f} s  harmonics: {candidate['nharmonics']}  sigma: {candidate['sigma']:.1f}")
+
+    # Plot the candidates in the period-DM plane
+    plt.figure(figsize=(8, 4))
+    plt.scatter(candidates["period"], candidates["DM"], s=candidates["sigma"]*5, c=candidates["sigma"], cmap="plasma")
+    plt.colorbar(label="sigma")
+    plt.xscale("log")
+    plt.title("Periodicity candidates")
+    plt.xlabel("Period (s)")
+    plt.ylabel("DM (pc cm^-3)")
+    plt.tight_layout()
+    plt.show()
+
+if __name__ == "__main__":
+    main()
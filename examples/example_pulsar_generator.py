@@ -5,6 +5,7 @@ import random
 from spectralib.rfi import generate_rfi, add_wandering_baseline, sampleloguniform
 from spectralib.filterbank import create_filterbank, dedisperse_filterbank_data, dedisperse_filterbank_data_to_timeseries, read_filterbank
 from spectralib.pulsar import generate_binary_pulsar
+from spectralib.background import generate_noise_background
 
 
 def main():
@@ -33,7 +34,7 @@ def main():
     tsamp = metadata["tsamp"]
     fch1 = metadata["fch1"]
     foff = metadata["foff"]
-    data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+    data = generate_noise_background(nchans, nsamp, noisesigma)
     data0 = data.copy()
 
     print("Observation time of " + str(nsamp*tsamp) + " seconds")
@@ -2,8 +2,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import random
 
-from spectralib.rfi import generate_rfi, add_wandering_baseline, sampleloguniform
+from spectralib.rfi import generate_rfi_scene, add_wandering_baseline, sampleloguniform
 from spectralib.filterbank import create_filterbank, plot_and_save
+from spectralib.background import generate_noise_background
 
 
 def main():
@@ -32,7 +33,7 @@ def main():
     tsamp = metadata["tsamp"]
     fch1 = metadata["fch1"]
     foff = metadata["foff"]
-    data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+    data = generate_noise_background(nchans, nsamp, noisesigma)
     data0 = data.copy()
 
     print("Observation time of " + str(nsamp*tsamp) + " seconds")
@@ -53,71 +54,66 @@ def main():
     
     # add some narrowband RFI that is persistent
     persistent_narrowband_amount = 5
-    for i in range(persistent_narrowband_amount):
-        kwargs = {
-            'freqchanswidth': round(sampleloguniform(1, 20)),
-            'ispersistent': True,
-            'doesrepeat': False,
-            'RFIamplitude': random.uniform(20, 200)
-        }
-        data = generate_rfi(data, **kwargs)
+    events = [{
+        'freqchanswidth': round(sampleloguniform(1, 20)),
+        'ispersistent': True,
+        'doesrepeat': False,
+        'RFIamplitude': random.uniform(20, 200)
+    } for i in range(persistent_narrowband_amount)]
+    data = generate_rfi_scene(data, events)
 
     data2 = data.copy()
 
     # and some narrowband RFI that repeats
     repeating_narrowband_amount = 10
-    for i in range(repeating_narrowband_amount):
-        kwargs = {
-            'freqchanswidth': round(sampleloguniform(1, 20)),
-            'onlength': round(sampleloguniform(1, 1000)),
-            'dutycycle': sampleloguniform(1, 100),
-            'doesrepeat': True,
-            'numrepeats': round(sampleloguniform(100, 10000)),
-            'RFIamplitude': random.uniform(20, 200)
-        }
-        data = generate_rfi(data, **kwargs)
+    events = [{
+        'freqchanswidth': round(sampleloguniform(1, 20)),
+        'onlength': round(sampleloguniform(1, 1000)),
+        'dutycycle': sampleloguniform(1, 100),
+        'doesrepeat': True,
+        'numrepeats': round(sampleloguniform(100, 10000)),
+        'RFIamplitude': random.uniform(20, 200)
+    } for i in range(repeating_narrowband_amount)]
+    data = generate_rfi_scene(data, events)
 
     data3 = data.copy()
 
     # and some narrowband RFI that is impulsive
     impulsive_narrowband_amount = 10
-    for i in range(impulsive_narrowband_amount):
-        kwargs = {
-            'freqchanswidth': round(sampleloguniform(1, 20)),
-            'onlength': round(sampleloguniform(1, 10000)),
-            'ispersistent': False,
-            'doesrepeat': False,
-            'RFIamplitude': random.uniform(20, 200)
-        }
-        data = generate_rfi(data, **kwargs)
+    events = [{
+        'freqchanswidth': round(sampleloguniform(1, 20)),
+        'onlength': round(sampleloguniform(1, 10000)),
+        'ispersistent': False,
+        'doesrepeat': False,
+        'RFIamplitude': random.uniform(20, 200)
+    } for i in range(impulsive_narrowband_amount)]
+    data = generate_rfi_scene(data, events)
 
     data4 = data.copy()
 
     # and some broadband RFI that repeats
     broadband_repeating_amount = 3
-    for i in range(broadband_repeating_amount):
-        kwargs = {
-            'freqchanswidth': nchans,
-            'onlength': round(sampleloguniform(1, 1000)),
-            'dutycycle': sampleloguniform(1, 10),
-            'doesrepeat': True,
-            'numrepeats': round(sampleloguniform(10, 10000)),
-            'RFIamplitude': random.uniform(20, 200)
-        }
-        data = generate_rfi(data, **kwargs)
+    events = [{
+        'freqchanswidth': nchans,
+        'onlength': round(sampleloguniform(1, 1000)),
+        'dutycycle': sampleloguniform(1, 10),
+        'doesrepeat': True,
+        'numrepeats': round(sampleloguniform(10, 10000)),
+        'RFIamplitude': random.uniform(20, 200)
+    } for i in range(broadband_repeating_amount)]
+    data = generate_rfi_scene(data, events)
 
     data5 = data.copy()
 
     broadband_impulsive_amount = 10
-    for i in range(broadband_impulsive_amount):
-        kwargs = {
-            'freqchanswidth': nchans,
-            'onlength': round(sampleloguniform(1, 1000)),
-            'ispersistent': False,
-            'doesrepeat': False,
-            'RFIamplitude': random.uniform(70, 200)
-        }
-        data = generate_rfi(data, **kwargs)
+    events = [{
+        'freqchanswidth': nchans,
+        'onlength': round(sampleloguniform(1, 1000)),
+        'ispersistent': False,
+        'doesrepeat': False,
+        'RFIamplitude': random.uniform(70, 200)
+    } for i in range(broadband_impulsive_amount)]
+    data = generate_rfi_scene(data, events)
 
 
     # add an FRB
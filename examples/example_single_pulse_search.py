@@ -0,0 +1,68 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from spectralib.frb import generate_pulse
+from spectralib.dedisperse import dedisperse_filterbank_data_multi_dm
+from spectralib.search import single_pulse_search
+from spectralib.background import generate_noise_background
+
+
+def main():
+    tobs = 10 # observation time in seconds
+    tsamp = 0.001 # sample time in seconds
+
+    metadata = {
+    "source_name": "spectralib_FRB",
+    "machine_id": 0,
+    "telescope_id": 0,
+    "data_type": 0,
+    "fch1": 1500.0,
+    "foff": -0.5,
+    "nchans": 500,
+    "nbits": 8,
+    "tstart": 55555.0,
+    "tsamp": tsamp,
+    "nifs": 1,
+    "nbeams": 1,
+    "ibeam": 1
+    }
+
+    noisesigma = 18 #standard deviation of noise, value copied from some ASKAP data
+    nchans = metadata["nchans"]
+    nsamp = round(tobs/tsamp)
+    fch1 = metadata["fch1"]
+    foff = metadata["foff"]
+    data = generate_noise_background(nchans, nsamp, noisesigma)
+
+    # add a faint FRB
+    DM = 500  # Dispersion measure of the FRB
+    pulse_params = {
+        'pulse_start_index': 4000,
+        'pulse_duration': 10,
+        'pulse_amplitude': 10
+    }
+    data = generate_pulse(data, DM, tsamp, foff, fch1, **pulse_params)
+
+    # Dedisperse over a grid of DM trials
+    DMs = np.arange(0, 1000, 5)
+    dm_time = dedisperse_filterbank_data_multi_dm(data, DMs, tsamp, foff, fch1)
+
+    # Search every DM trial with boxcars of 1 to 256 samples
+    candidates = single_pulse_search(dm_time, DMs, tsamp, threshold=8)
+
+    print("Found " + str(len(candidates)) + " candidates")
+    for candidate in candidates[:10]:
+        print(f"DM: {candidate['DM']:.1f}  time: {candidate['time']:.3f} s  width: {candidate['width']}  S/N: {candidate['snr']:.1f}  members: {candidate['members']}")
+
+    # Plot the DM-time plane with the candidates on top
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.imshow(dm_time, aspect="auto", cmap="plasma", origin="lower", extent=[0, nsamp*tsamp, DMs[0], DMs[-1]])
+    ax.scatter(candidates["time"], candidates["DM"], s=candidates["snr"]*5, facecolors="none", edgecolors="white")
+    ax.set_title("DM-time plane with single pulse candidates")
+    plt.xlabel("Time (s)")
+    plt.ylabel("DM (pc cm^-3)")
+    plt.tight_layout()
+    plt.show()
+
+if __name__ == "__main__":
+    main()
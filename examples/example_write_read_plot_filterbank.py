@@ -6,6 +6,7 @@ from spectralib.rfi import *
 from spectralib.filterbank import *
 from spectralib.frb import *
 from spectralib.pulsar import *
+from spectralib.background import generate_noise_background
 
 
 def main():
@@ -34,7 +35,7 @@ def main():
     tsamp = metadata["tsamp"]
     fch1 = metadata["fch1"]
     foff = metadata["foff"]
-    data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+    data = generate_noise_background(nchans, nsamp, noisesigma)
 
     print("Observation time of " + str(nsamp*tsamp) + " seconds")
 
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+def noise_seed_sequence(rng=None):
+    """
+    Turn a seed, SeedSequence or np.random.Generator into the SeedSequence that the noise
+    blocks are spawned from.
+    """
+    if isinstance(rng, np.random.SeedSequence):
+        return rng
+    if isinstance(rng, np.random.Generator):
+        return np.random.SeedSequence(int(rng.integers(2**63)))
+    return np.random.SeedSequence(rng)
+
+def fill_noise_block(out, seed_sequence, noisesigma=18, mean=127):
+    """
+    Fill one (nchans, nsamp) block with Gaussian noise from its own Generator.
+
+    Floating point blocks are drawn in their own dtype and scaled in place. Integer blocks
+    are rounded to the nearest integer and clipped to the range of their dtype.
+
+    :param out: The (nchans, nsamp) block to fill.
+    :param seed_sequence: The SeedSequence of this block.
+    :param noisesigma: Standard deviation of the noise.
+    :param mean: Mean of the noise.
+    :return: The filled block.
+    """
+    generator = np.random.Generator(np.random.PCG64(seed_sequence))
+    if np.issubdtype(out.dtype, np.floating) and out.flags.c_contiguous:
+        generator.standard_normal(out=out, dtype=out.dtype)
+        out *= noisesigma
+        out += mean
+        return out
+
+    dtype = out.dtype if np.issubdtype(out.dtype, np.floating) else np.float32
+    block = generator.standard_normal(out.shape, dtype=dtype)
+    block *= noisesigma
+    block += mean
+    if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        np.rint(block, out=block)
+        np.clip(block, info.min, info.max, out=block)
+    np.copyto(out, block, casting='unsafe')
+    return out
+
+def generate_noise_background(nchans, nsamp, noisesigma=18, mean=127, dtype=np.float32, rng=None, out=None, block_nsamp=65536, nthreads=None):
+    """
+    Generate a Gaussian noise background directly into a preallocated buffer.
+
+    The buffer is filled in blocks of block_nsamp time samples. Each block draws from its own
+    Generator, spawned from one SeedSequence, and the blocks are filled by a thread pool.
+    The output depends only on the seed and block_nsamp, not on the number of threads.
+
+    :param nchans: Number of frequency channels.
+    :param nsamp: Number of time samples.
+    :param noisesigma: Standard deviation of the noise.
+    :param mean: Mean of the noise.
+    :param dtype: Output dtype. float32 (default) or float64, or an integer dtype such as
+                  np.uint8, which is rounded to the nearest integer and clipped to its range.
+    :param rng: A seed, SeedSequence or np.random.Generator.
+    :param out: Optional (nchans, nsamp) array to fill instead of allocating one.
+    :param block_nsamp: Number of time samples per block.
+    :param nthreads: Number of threads. Defaults to the number of CPUs.
+    :return: The (nchans, nsamp) noise array.
+    """
+    if out is None:
+        out = np.empty((nchans, nsamp), dtype=dtype)
+    elif out.shape != (nchans, nsamp):
+        raise ValueError(f"out has shape {out.shape}, expected {(nchans, nsamp)}")
+
+    starts = range(0, nsamp, block_nsamp)
+    seed_sequences = noise_seed_sequence(rng).spawn(len(starts))
+    if nthreads is None:
+        nthreads = os.cpu_count() or 1
+
+    def fill(block):
+        start, seed_sequence = block
+        fill_noise_block(out[:, start:start + block_nsamp], seed_sequence, noisesigma, mean)
+
+    if nthreads <= 1 or len(starts) <= 1:
+        for block in zip(starts, seed_sequences):
+            fill(block)
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(fill, zip(starts, seed_sequences)))
+    return out
+
+def noise_background_blocks(nchans, nsamp, noisesigma=18, mean=127, dtype=np.float32, rng=None, block_nsamp=65536):
+    """
+    Stream a Gaussian noise background one block at a time, for generating observations that
+    do not fit in memory. The blocks are identical to the same samples of
+    generate_noise_background with the same seed and block_nsamp.
+
+    :return: A generator of (start_sample, block) tuples, block having shape (nchans, block_nsamp)
+             except for the last one.
+    """
+    starts = range(0, nsamp, block_nsamp)
+    seed_sequences = noise_seed_sequence(rng).spawn(len(starts))
+    for start, seed_sequence in zip(starts, seed_sequences):
+        block = np.empty((nchans, min(block_nsamp, nsamp - start)), dtype=dtype)
+        yield start, fill_noise_block(block, seed_sequence, noisesigma, mean)
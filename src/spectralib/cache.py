@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from spectralib.dataset import generate_background_scene, to_json
+from spectralib.filterbank import create_filterbank, read_filterbank_header, FilterbankMemmap
+from spectralib.quantise import finalise
+
+def scene_cache_key(params, metadata, seed):
+    """
+    Content address of a background scene: the sha256 of its parameters, metadata and seed.
+
+    :return: Hexadecimal key.
+    """
+    description = json.dumps(to_json({"params": params, "metadata": metadata, "seed": seed}), sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+class SceneCache:
+    """
+    On-disk cache of finished background scenes (noise, wandering baseline and RFI).
+
+    Each scene is generated once with generate_background_scene, clipped, written with
+    create_filterbank under its content address, and reopened memory-mapped in copy-on-write
+    mode. Signals can then be injected into a private view of a cached scene without
+    regenerating or rereading it, and without changing the file. When the cache directory grows
+    beyond max_bytes, the least recently used scenes are deleted.
+
+    :param cache_dir: The cache directory.
+    :param max_bytes: Maximum total size of the cached scenes in bytes. Default is None, no limit.
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".fil")
+
+    def get(self, params, metadata, seed):
+        """
+        Return the cached scene as a copy-on-write FilterbankMemmap, generating it on a miss.
+
+        :param params: Dictionary with the nsamp (or tobs), noisesigma, mean, wandering_baseline
+                       and rfi keys of a dataset job, see generate_dataset.
+        :param metadata: Filterbank metadata of the scene.
+        :param seed: Integer seed of the scene. It is part of the cache key, so it must be given
+                     explicitly: a scene drawn from OS entropy could not be looked up again.
+        :return: A FilterbankMemmap opened in mode 'c'.
+        """
+        if not isinstance(seed, (int, np.integer)) or isinstance(seed, bool):
+            raise ValueError(f"SceneCache needs an explicit integer seed, got {seed!r}")
+        seed = int(seed)
+        key = scene_cache_key(params, metadata, seed)
+        path = self.path(key)
+        if os.path.exists(path):
+            # Mark the scene as recently used
+            os.utime(path)
+        else:
+            data, _ = generate_background_scene(params, metadata, np.random.SeedSequence(seed))
+            finalise(data, metadata.get("nbits", 8))
+            # Write under a temporary name so a partly written scene is never picked up
+            temporary_path = path + ".%d.tmp" % os.getpid()
+            create_filterbank(data, temporary_path, metadata)
+            os.replace(temporary_path, path)
+            self.evict(keep=path)
+
+        header_params, header_len = read_filterbank_header(path)
+        return FilterbankMemmap(path, header_params, header_len, mode="c")
+
+    def load(self, params, metadata, seed):
+        """
+        Return a private (nchans, nsamp) view of the cached scene and its header.
+
+        Writes to the view, e.g. generate_pulse(data, ..., out=data), only touch private
+        copies of the pages they change, never the cached file.
+        """
+        scene = self.get(params, metadata, seed)
+        return scene.map_samples(0, scene.nsamples).T, scene.header_params
+
+    def size(self):
+        """
+        Total size of the cached scenes in bytes.
+        """
+        return sum(os.path.getsize(path) for path, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".fil"):
+                path = os.path.join(self.cache_dir, name)
+                entries.append((path, os.path.getmtime(path)))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used scenes until the cache fits in max_bytes.
+
+        :param keep: Optional path of a scene that is never deleted.
+        """
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(os.path.getsize(path) for path, _ in entries)
+        for path, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
@@ -0,0 +1,178 @@
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from spectralib.background import generate_noise_background
+from spectralib.filterbank import FilterbankWriter
+from spectralib.frb import generate_pulse, calculate_dispersion_offsets
+from spectralib.pulsar import binary_pulse_arrival_indices, solitary_pulse_arrival_indices, add_variable_pulse_train
+from spectralib.quantise import finalise
+from spectralib.rfi import compile_rfi_scene, apply_rfi_scene, WanderingBaselineGenerator
+
+def to_json(value):
+    """
+    Convert numpy arrays and scalars nested in dictionaries and lists to plain python types.
+    """
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def generate_background_scene(params, metadata, seed_sequence):
+    """
+    Generate the noise, wandering baseline and RFI of a file, without clipping.
+
+    :param params: Dictionary with the nsamp (or tobs), noisesigma, mean, wandering_baseline
+                   and rfi keys of a dataset job, see generate_dataset.
+    :param metadata: Filterbank metadata.
+    :param seed_sequence: SeedSequence from which every random draw is made.
+    :return: A tuple of the (nchans, nsamp) float32 data and the compiled RFI table.
+    """
+    nchans = metadata["nchans"]
+    nsamp = params.get("nsamp", round(params.get("tobs", 10) / metadata["tsamp"]))
+
+    noise_seed, baseline_seed, rfi_seed = seed_sequence.spawn(3)
+    data = generate_noise_background(nchans, nsamp, params.get("noisesigma", 18), params.get("mean", 127), rng=noise_seed, nthreads=1)
+
+    # Every injection adds into data in place, and the whole file is clipped once at the end
+    baseline = params.get("wandering_baseline")
+    if baseline is not None:
+        generator = WanderingBaselineGenerator(baseline.get("wanderingbaselineamplitude", 1), baseline.get("wanderingbaselineperiod", 100), rng=baseline_seed)
+        data += generator.next_block(nsamp)[np.newaxis, :]
+
+    rfi_table = compile_rfi_scene(params.get("rfi", []), nchans, nsamp, rng=np.random.default_rng(rfi_seed))
+    apply_rfi_scene(data, rfi_table)
+    return data, rfi_table
+
+def generate_dataset_job(job, metadata, output_dir, seed_sequence):
+    """
+    Generate one synthetic filterbank of a dataset and return its ground truth.
+
+    :param job: Dictionary of parameters of the file, see generate_dataset.
+    :param metadata: Filterbank metadata shared by every file, updated with job["metadata"].
+    :param output_dir: Directory the filterbank is written to.
+    :param seed_sequence: SeedSequence of this job, from which every random draw is made.
+    :return: Manifest entry describing the file and everything injected into it.
+    """
+    metadata = dict(metadata, **job.get("metadata", {}))
+    nchans = metadata["nchans"]
+    tsamp = metadata["tsamp"]
+    fch1 = metadata["fch1"]
+    foff = metadata["foff"]
+    nbits = metadata.get("nbits", 8)
+
+    background_seed, pulsar_seed = seed_sequence.spawn(2)
+    data, rfi_table = generate_background_scene(job, metadata, background_seed)
+    nsamp = data.shape[1]
+
+    frbs = []
+    for frb in job.get("frbs", []):
+        pulse_params = {key: value for key, value in frb.items() if key != "DM"}
+        generate_pulse(data, frb["DM"], tsamp, foff, fch1, out=data, **pulse_params)
+        offsets = calculate_dispersion_offsets(frb["DM"], fch1, foff, nchans, tsamp)
+        start = frb.get("pulse_start_index", 0)
+        frbs.append(dict(frb, first_sample=start + int(offsets.min()), last_sample=start + int(offsets.max()) + frb.get("pulse_duration", 100)))
+
+    pulsars = []
+    pulsar_rngs = [np.random.default_rng(child) for child in pulsar_seed.spawn(len(job.get("pulsars", [])))]
+    for pulsar, rng in zip(job.get("pulsars", []), pulsar_rngs):
+        pulse_params = {key: value for key, value in pulsar.items() if key not in ("DM", "rest_period", "binary_params", "variability")}
+        offsets = calculate_dispersion_offsets(pulsar["DM"], fch1, foff, nchans, tsamp)
+        if pulsar.get("binary_params") is not None:
+            arrival_indices = binary_pulse_arrival_indices(pulsar["binary_params"], tsamp, -max(offsets), nsamp)
+        else:
+            arrival_indices = solitary_pulse_arrival_indices(pulsar["rest_period"], tsamp, -max(offsets), nsamp)
+        pulses = {}
+        add_variable_pulse_train(data, pulsar["DM"], tsamp, foff, fch1, arrival_indices, pulsar.get("variability"), rng, record=pulses, **pulse_params)
+        # Only the pulses that were added are ground truth, at their jittered arrival index
+        injected = ~pulses["nulled"]
+        pulsars.append(dict(pulsar, arrival_indices=pulses["arrival_indices"][injected], amplitudes=pulses["amplitudes"][injected],
+                            modes=pulses["modes"][injected], nulled_arrival_indices=pulses["arrival_indices"][pulses["nulled"]]))
+
+    finalise(data, nbits)
+
+    name = job.get("name", "spectralib_" + "_".join(str(entropy) for entropy in seed_sequence.spawn_key))
+    file_path = os.path.join(output_dir, name + ".fil")
+    with FilterbankWriter(file_path, metadata) as writer:
+        writer.write_block(data)
+
+    return to_json({
+        "name": name,
+        "file_path": file_path,
+        "spawn_key": seed_sequence.spawn_key,
+        "nsamp": nsamp,
+        "metadata": metadata,
+        "rfi": [dict(zip(rfi_table.dtype.names, event)) for event in rfi_table.tolist()],
+        "wandering_baseline": job.get("wandering_baseline"),
+        "frbs": frbs,
+        "pulsars": pulsars,
+    })
+
+def generate_dataset(jobs, metadata, output_dir, seed=None, nworkers=None, max_pending=None, manifest_name="manifest.json"):
+    """
+    Generate a dataset of synthetic filterbanks from a table of parameter sets, spread over a
+    process pool, and write a JSON manifest of what was injected where.
+
+    Each job is a dictionary with the keys:
+     - name: Output file name without extension. Defaults to one derived from the job seed.
+     - nsamp or tobs: Length of the file in samples or seconds.
+     - metadata: Optional metadata overriding the shared metadata.
+     - noisesigma, mean: Gaussian noise background.
+     - wandering_baseline: Optional keyword arguments of add_wandering_baseline.
+     - rfi: List of RFI events with the keyword arguments of generate_rfi.
+     - frbs: List of dictionaries with a DM and the pulse_params of generate_pulse.
+     - pulsars: List of dictionaries with a DM, a rest_period or binary_params, an optional
+                variability and the pulse_params of the pulsar generators.
+
+    The manifest entry of each pulsar lists the arrival_indices of the pulses that were added,
+    after jitter, with the amplitude (scale factor of pulse_amplitude) and profile mode of each,
+    and the nulled_arrival_indices of the pulses that were nulled.
+
+    Every job draws its random numbers from its own SeedSequence, spawned from seed, so the
+    dataset is reproducible for any number of workers.
+
+    :param jobs: List of job dictionaries.
+    :param metadata: Filterbank metadata shared by every file.
+    :param output_dir: Directory the filterbanks and manifest are written to.
+    :param seed: Seed of the whole dataset.
+    :param nworkers: Number of worker processes. Defaults to the number of CPUs, 1 runs serially.
+    :param max_pending: Maximum number of jobs in flight at once, which bounds the memory used.
+                        Defaults to nworkers.
+    :param manifest_name: File name of the manifest in output_dir.
+    :return: The manifest dictionary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    seed_sequence = np.random.SeedSequence(seed)
+    job_seeds = seed_sequence.spawn(len(jobs))
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = nworkers
+
+    entries = [None] * len(jobs)
+    if nworkers <= 1 or len(jobs) <= 1:
+        for index, (job, job_seed) in enumerate(zip(jobs, job_seeds)):
+            entries[index] = generate_dataset_job(job, metadata, output_dir, job_seed)
+    else:
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            pending = {}
+            for index, (job, job_seed) in enumerate(zip(jobs, job_seeds)):
+                # Only keep max_pending jobs, and so their data, in flight at once
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        entries[pending.pop(future)] = future.result()
+                pending[executor.submit(generate_dataset_job, job, metadata, output_dir, job_seed)] = index
+            for future in wait(pending).done:
+                entries[pending[future]] = future.result()
+
+    manifest = {"seed": seed_sequence.entropy, "metadata": to_json(metadata), "files": entries}
+    with open(os.path.join(output_dir, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,340 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from spectralib.frb import calculate_dispersion_delay_table
+
+def add_circular_slice(out, src, start):
+    """
+    Add len(out) samples of src, starting at sample start and wrapping around the end, into out.
+
+    This is the slice of np.roll(src, -start) that lines up with out, without copying src.
+    """
+    n = src.shape[-1]
+    length = out.shape[-1]
+    start %= n
+    end = start + length
+    if end <= n:
+        out += src[..., start:end]
+    else:
+        # The requested samples wrap around the end of src, possibly several times for short inputs
+        first = n - start
+        out[..., :first] += src[..., start:]
+        add_circular_slice(out[..., first:], src, 0)
+
+def dedisperse_filterbank_data_multi_dm(data, DMs, tsamp, foff, fch1, block_size=16384, nthreads=None):
+    """
+    Brute-force dedisperse filterbank data at many DM trials into a DM-time plane.
+
+    Shifted channel slices are accumulated straight into the output, one time block at a time,
+    so no shifted copy of the data is ever made. Row i is equal (up to float32 rounding) to
+    dedisperse_filterbank_data_to_timeseries(data, DMs[i], tsamp, foff, fch1). The DM trials are
+    split across a thread pool, which runs in parallel because NumPy releases the GIL in the adds.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param DMs: 1D array of DM trials.
+    :param tsamp: Sampling time in seconds.
+    :param foff: Frequency offset between two adjacent channels in MHz.
+    :param fch1: Frequency of the first channel in MHz.
+    :param block_size: Number of time samples processed per block.
+    :param nthreads: Number of worker threads. Defaults to the number of CPUs.
+    :return: float32 array of shape (nDM, nsamp).
+    """
+    nchans, nsamp = data.shape
+    delay_table = calculate_dispersion_delay_table(DMs, fch1, foff, nchans, tsamp)
+    nDM = delay_table.shape[0]
+    plane = np.zeros((nDM, nsamp), dtype=np.float32)
+
+    def dedisperse_trials(dm_indices):
+        for block_start in range(0, nsamp, block_size):
+            block_end = min(block_start + block_size, nsamp)
+            for i in dm_indices:
+                out = plane[i, block_start:block_end]
+                for chan in range(nchans):
+                    add_circular_slice(out, data[chan], block_start + delay_table[i, chan])
+
+    if nthreads is None:
+        nthreads = os.cpu_count() or 1
+    nthreads = max(1, min(nthreads, nDM))
+
+    if nthreads == 1:
+        dedisperse_trials(range(nDM))
+    else:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            # list() re-raises any exception from the workers
+            list(executor.map(dedisperse_trials, np.array_split(np.arange(nDM), nthreads)))
+
+    return plane
+
+def dedisperse_filterbank_data_fdmt(data, max_DM, tsamp, foff, fch1):
+    """
+    Dedisperse filterbank data with the Fast Dispersion Measure Transform (Zackay & Ofek 2017).
+
+    Adjacent sub-bands are merged pairwise, log2(nchans) times, reusing the partial sums of
+    each half at every trial delay. This costs O(nsamp * ndelays * log2(nchans)) instead of the
+    O(nsamp * nDM * nchans) of brute-force shift-and-add. Delays are circular, as in
+    dedisperse_filterbank_data, and referenced to fch1.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param max_DM: Maximum dispersion measure to search.
+    :param tsamp: Sampling time in seconds.
+    :param foff: Frequency offset between two adjacent channels in MHz.
+    :param fch1: Frequency of the first channel in MHz.
+    :return: A tuple of the float32 DM-time plane of shape (ndelays, nsamp), one row per
+             integer delay across the band, and the DM of each row.
+    """
+    nchans, nsamp = data.shape
+    freqs = fch1 + np.arange(nchans) * foff
+
+    # Always merge from the highest to the lowest frequency
+    flipped = foff > 0
+    if flipped:
+        data = data[::-1]
+        freqs = freqs[::-1]
+
+    band_inverse_square = freqs[-1] ** -2 - freqs[0] ** -2
+    delay_per_DM = 4148.741601 * band_inverse_square / tsamp
+    max_delay = int(np.ceil(max_DM * delay_per_DM))
+
+    def max_subband_delay(f_top, f_bottom):
+        return min(max_delay, int(np.ceil(max_delay * (f_bottom ** -2 - f_top ** -2) / band_inverse_square)))
+
+    def merge(upper, lower):
+        upper_top, upper_bottom, upper_plane = upper
+        lower_top, lower_bottom, lower_plane = lower
+        span = lower_bottom ** -2 - upper_top ** -2
+        ndelays = max_subband_delay(upper_top, lower_bottom) + 1
+        plane = np.empty((ndelays, nsamp), dtype=np.float32)
+        for delay in range(ndelays):
+            # Split the delay across the sub-band into the delay across each half and the delay
+            # between the top of the sub-band and the top of the lower half
+            upper_delay = min(int(round(delay * (upper_bottom ** -2 - upper_top ** -2) / span)), upper_plane.shape[0] - 1)
+            lower_start = int(round(delay * (lower_top ** -2 - upper_top ** -2) / span))
+            lower_delay = min(delay - lower_start, lower_plane.shape[0] - 1)
+            plane[delay] = upper_plane[upper_delay]
+            add_circular_slice(plane[delay], lower_plane[lower_delay], lower_start)
+        return upper_top, lower_bottom, plane
+
+    # Each sub-band is (top frequency, bottom frequency, plane of its partial sums per delay)
+    subbands = [(freqs[chan], freqs[chan], data[chan][np.newaxis, :].astype(np.float32)) for chan in range(nchans)]
+    while len(subbands) > 1:
+        merged = [merge(subbands[i], subbands[i + 1]) for i in range(0, len(subbands) - 1, 2)]
+        if len(subbands) % 2:
+            merged.append(subbands[-1])
+        subbands = merged
+
+    plane = subbands[0][2]
+    if plane.shape[0] < max_delay + 1:
+        # Only possible for a single channel, where every delay gives the same series
+        plane = np.repeat(plane[:1], max_delay + 1, axis=0)
+
+    if flipped:
+        # Reference the delays to fch1, which is the bottom of the band
+        for delay in range(1, plane.shape[0]):
+            plane[delay] = np.roll(plane[delay], delay)
+
+    DMs = np.arange(plane.shape[0]) / delay_per_DM if delay_per_DM > 0 else np.zeros(plane.shape[0])
+    return plane, DMs
+
+def subband_nominal_DM_step(tsamp, foff, fch1, nchans, nsubbands, max_smearing=None):
+    """
+    Largest spacing of the nominal DMs of subband dedispersion that keeps the smearing within
+    every subband below max_smearing seconds (default tsamp) for DMs up to half a step away.
+    """
+    if max_smearing is None:
+        max_smearing = tsamp
+    freqs = fch1 + np.arange(nchans) * foff
+    edges = np.linspace(0, nchans, nsubbands + 1).astype(np.int64)
+    subband_inverse_square = max(abs(freqs[end - 1] ** -2 - freqs[start] ** -2) for start, end in zip(edges[:-1], edges[1:]))
+    if subband_inverse_square == 0:
+        return np.inf
+    return 2 * max_smearing / (4148.741601 * subband_inverse_square)
+
+def subband_nominal_DMs(DMs, step):
+    """
+    Coarse grid of nominal DMs with the given spacing, centred on the range of the DM trials.
+    """
+    DMs = np.asarray(DMs, dtype=np.float64).reshape(-1)
+    if np.isfinite(step) and DMs.max() > DMs.min():
+        return np.arange(DMs.min() + step / 2, DMs.max() + step / 2, step)
+    return np.array([DMs.mean()])
+
+def dedisperse_filterbank_data_subband(data, DMs, tsamp, foff, fch1, nsubbands, nominal_DMs=None):
+    """
+    Two-stage subband dedispersion.
+
+    The channels are first dedispersed within nsubbands groups at a coarse grid of nominal DMs.
+    Each fine DM trial then shifts and sums the subbands of its nearest nominal DM, so most of the
+    work is done once per nominal DM instead of once per DM trial.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param DMs: 1D array of DM trials.
+    :param tsamp: Sampling time in seconds.
+    :param foff: Frequency offset between two adjacent channels in MHz.
+    :param fch1: Frequency of the first channel in MHz.
+    :param nsubbands: Number of subbands.
+    :param nominal_DMs: The coarse DM grid. Defaults to the widest grid that keeps the smearing
+                        within each subband below one sample.
+    :return: float32 array of shape (nDM, nsamp).
+    """
+    nchans, nsamp = data.shape
+    DMs = np.asarray(DMs, dtype=np.float64).reshape(-1)
+    nsubbands = max(1, min(nsubbands, nchans))
+    edges = np.linspace(0, nchans, nsubbands + 1).astype(np.int64)
+
+    if nominal_DMs is None:
+        nominal_DMs = subband_nominal_DMs(DMs, subband_nominal_DM_step(tsamp, foff, fch1, nchans, nsubbands))
+    nominal_DMs = np.asarray(nominal_DMs, dtype=np.float64).reshape(-1)
+
+    nominal_delays = calculate_dispersion_delay_table(nominal_DMs, fch1, foff, nchans, tsamp)
+    fine_delays = calculate_dispersion_delay_table(DMs, fch1, foff, nchans, tsamp)
+
+    # Stage 1: dedisperse each subband at the nominal DMs, relative to its first channel
+    subband_planes = np.zeros((len(nominal_DMs), nsubbands, nsamp), dtype=np.float32)
+    for i in range(len(nominal_DMs)):
+        for subband, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+            for chan in range(start, end):
+                add_circular_slice(subband_planes[i, subband], data[chan], nominal_delays[i, chan] - nominal_delays[i, start])
+
+    # Stage 2: shift the subbands of the nearest nominal DM by the delay of the fine DM
+    nearest = np.argmin(np.abs(nominal_DMs[np.newaxis, :] - DMs[:, np.newaxis]), axis=1)
+    plane = np.zeros((len(DMs), nsamp), dtype=np.float32)
+    for i in range(len(DMs)):
+        for subband, start in enumerate(edges[:-1]):
+            add_circular_slice(plane[i], subband_planes[nearest[i], subband], fine_delays[i, start])
+
+    return plane
+
+def downsample_filterbank_data(data, factor):
+    """
+    Average every factor adjacent time samples. Trailing samples that do not fill a full
+    block are dropped.
+
+    :return: float32 array of shape (nchans, nsamp // factor).
+    """
+    nchans, nsamp = data.shape
+    if factor == 1:
+        return data.astype(np.float32)
+    nout = nsamp // factor
+    return data[:, :nout * factor].reshape(nchans, nout, factor).mean(axis=2, dtype=np.float32)
+
+def generate_dm_plan(tsamp, foff, fch1, nchans, max_DM, min_DM=0.0, pulse_width=0.0, tolerance=1.25, max_downsample=64):
+    """
+    Generate a dedispersion plan: the DM step, time downsampling and subband count to use in each DM range.
+
+    The DM step is chosen so that dedispersing half a step away from the true DM broadens a
+    pulse by at most a factor tolerance, given the effective width from the (downsampled) sample
+    time, the intra-channel dispersion smearing and the intrinsic pulse_width. The downsampling
+    doubles each time the intra-channel smearing exceeds twice the downsampled sample time. The
+    subband count is the power of two that minimises the number of operations of
+    dedisperse_filterbank_data_subband for the range.
+
+    :param tsamp: Sampling time in seconds.
+    :param foff: Frequency offset between two adjacent channels in MHz.
+    :param fch1: Frequency of the first channel in MHz.
+    :param nchans: Number of channels.
+    :param max_DM: Maximum DM of the plan.
+    :param min_DM: Minimum DM of the plan.
+    :param pulse_width: Intrinsic pulse width in seconds.
+    :param tolerance: Maximum broadening of the effective width due to the DM step.
+    :param max_downsample: Maximum time downsampling factor.
+    :return: A list of dictionaries, one per DM range, with the keys DM_start, DM_end, DM_step,
+             downsample, nsubbands, DMs and nominal_DMs, the coarse DM grid the subband count
+             was costed for.
+    """
+    freqs = fch1 + np.arange(nchans) * foff
+    band_inverse_square = abs(freqs.min() ** -2 - freqs.max() ** -2)
+    centre_frequency_GHz = np.mean(freqs) / 1000
+    # Intra-channel dispersion smearing in seconds per unit DM
+    channel_smearing_per_DM = 8.3e-6 * abs(foff) / centre_frequency_GHz ** 3
+    smearing_budget = np.sqrt(tolerance ** 2 - 1)
+
+    plan = []
+    DM_start = min_DM
+    downsample = 1
+    while DM_start < max_DM:
+        # Move on to the next downsampling factor once the channel smearing is large enough
+        DM_end = max_DM
+        if downsample < max_downsample and channel_smearing_per_DM > 0:
+            DM_end = min(max_DM, 2 * downsample * tsamp / channel_smearing_per_DM)
+        if DM_end <= DM_start:
+            downsample *= 2
+            continue
+
+        effective_width = np.sqrt((downsample * tsamp) ** 2 + (channel_smearing_per_DM * DM_start) ** 2 + pulse_width ** 2)
+        DM_step = 2 * effective_width * smearing_budget / (4148.741601 * band_inverse_square)
+        DMs = np.arange(DM_start, DM_end, DM_step)
+
+        # Pick the number of subbands that minimises the total number of adds
+        nsamp_ratio = 1 / downsample
+        best_cost, nsubbands, nominal_DMs = np.inf, 1, None
+        subband_count = 1
+        while subband_count <= nchans:
+            nominal_step = subband_nominal_DM_step(downsample * tsamp, foff, fch1, nchans, subband_count, effective_width * smearing_budget)
+            candidate_DMs = subband_nominal_DMs(DMs, nominal_step)
+            cost = nsamp_ratio * (nchans * len(candidate_DMs) + subband_count * len(DMs))
+            if cost < best_cost:
+                best_cost, nsubbands, nominal_DMs = cost, subband_count, candidate_DMs
+            subband_count *= 2
+
+        plan.append({
+            "DM_start": float(DM_start),
+            "DM_end": float(DM_end),
+            "DM_step": float(DM_step),
+            "downsample": downsample,
+            "nsubbands": nsubbands,
+            "DMs": DMs,
+            "nominal_DMs": nominal_DMs,
+        })
+        DM_start = DM_end
+        downsample *= 2
+
+    return plan
+
+def dedisperse_filterbank_data_with_plan(data, plan, tsamp, foff, fch1):
+    """
+    Dedisperse filterbank data following a plan from generate_dm_plan.
+
+    :return: A list of (DMs, plane, downsample) tuples, one per DM range, where plane is the
+             float32 DM-time plane of shape (nDM, nsamp // downsample).
+    """
+    results = []
+    for dm_range in plan:
+        downsample = dm_range["downsample"]
+        downsampled = downsample_filterbank_data(data, downsample)
+        plane = dedisperse_filterbank_data_subband(downsampled, dm_range["DMs"], tsamp * downsample, foff, fch1, dm_range["nsubbands"], dm_range.get("nominal_DMs"))
+        results.append((dm_range["DMs"], plane, downsample))
+    return results
+
+def dedisperse_filterbank_data_to_dm_time(data, DMs, tsamp, foff, fch1, method="brute", **kwargs):
+    """
+    Dedisperse filterbank data at many DM trials with the selected backend.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param DMs: 1D array of DM trials.
+    :param tsamp: Sampling time in seconds.
+    :param foff: Frequency offset between two adjacent channels in MHz.
+    :param fch1: Frequency of the first channel in MHz.
+    :param method: 'brute' for dedisperse_filterbank_data_multi_dm, 'fdmt' for
+                   dedisperse_filterbank_data_fdmt, which returns the nearest FDMT delay for each DM,
+                   or 'subband' for dedisperse_filterbank_data_subband (needs nsubbands).
+    :param kwargs: Additional keyword arguments passed to the backend: block_size and nthreads
+                   for 'brute', nsubbands and nominal_DMs for 'subband', none for 'fdmt'.
+    :return: float32 array of shape (nDM, nsamp).
+    """
+    DMs = np.asarray(DMs, dtype=np.float64).reshape(-1)
+    backend_kwargs = {"brute": ("block_size", "nthreads"), "fdmt": (), "subband": ("nsubbands", "nominal_DMs")}
+    if method not in backend_kwargs:
+        raise ValueError(f"Unknown dedispersion method: {method}")
+    unsupported = sorted(set(kwargs) - set(backend_kwargs[method]))
+    if unsupported:
+        raise TypeError(f"Dedispersion method '{method}' does not accept the keyword arguments: {', '.join(unsupported)}")
+
+    if method == "brute":
+        return dedisperse_filterbank_data_multi_dm(data, DMs, tsamp, foff, fch1, **kwargs)
+    elif method == "fdmt":
+        plane, fdmt_DMs = dedisperse_filterbank_data_fdmt(data, DMs.max(), tsamp, foff, fch1, **kwargs)
+        # Pick the FDMT delay closest to each DM trial
+        rows = np.argmin(np.abs(fdmt_DMs[np.newaxis, :] - DMs[:, np.newaxis]), axis=1)
+        return plane[rows]
+    else:
+        return dedisperse_filterbank_data_subband(data, DMs, tsamp, foff, fch1, **kwargs)
@@ -2,7 +2,9 @@ import struct
 import numpy as np
 import matplotlib.pyplot as plt
 import os
-from spectralib.frb import calculate_dispersion_offsets
+import shutil
+from spectralib.frb import calculate_dispersion_offsets, SparsePulse
+from spectralib.quantise import nbits_to_dtype, saturate
 
 def plot_and_save(data, title, file_name):
     fig, ax = plt.subplots(figsize=(8, 6))
@@ -33,63 +35,124 @@ def dedisperse_filterbank_data(data, DM, tsamp, foff, fch1):
     return dedispersed_data
 
 
+def write_filterbank_header(f, metadata):
+    """
+    Write a sigproc header with the given metadata to an open binary file.
+
+    :param f: The file object to write to.
+    :param metadata: The metadata to be included in the filterbank header.
+    """
+    # Write the header start marker
+    # Use '<I' for little-endian unsigned int encoding
+    f.write(struct.pack('<I', len('HEADER_START')))
+    f.write(b'HEADER_START')
+
+    # Write metadata key-value pairs
+    for key, value in metadata.items():
+        #print("Writing key: '", key, "' value: '", value, "' to file.")
+        # Encode and write the length of the metadata key
+        f.write(struct.pack('<I', len(key)))
+        # Encode and write the metadata key as bytes
+        f.write(key.encode())
+
+        # Check the type of the metadata value and encode it accordingly
+        if isinstance(value, str):
+            # Encode and write the length of the string value
+            f.write(struct.pack('<I', len(value)))
+            # Encode and write the string value as bytes
+            f.write(value.encode())
+        elif isinstance(value, int):
+            # Encode and write the integer value as little-endian signed int
+            f.write(struct.pack('<i', value))
+        elif isinstance(value, float):
+            # Encode and write the float value as little-endian double precision float
+            f.write(struct.pack('<d', value))
+        else:
+            raise ValueError(f"Unsupported data type for key '{key}': {type(value)}")
+
+    # Write the header end marker
+    f.write(struct.pack('<I', len('HEADER_END')))
+    f.write(b'HEADER_END')
+
+class FilterbankWriter:
+    """
+    Write a filterbank file incrementally, one time block at a time.
+
+    The header is written once when the writer is created. Each block passed to write_block
+    is quantised and transposed into a small reusable buffer before being appended to the
+    file, so the full observation never has to be held in memory. Samples are rounded to the
+    nearest integer and clipped to the nbits range, so the file holds the same samples as
+    quantise.quantise(data, nbits).
+
+    :param output_filename: The output filterbank file path.
+    :param metadata: The metadata to be included in the filterbank file.
+    :param buffer_nsamp: The number of time samples quantised per write.
+    """
+    def __init__(self, output_filename, metadata, buffer_nsamp=4096):
+        self.output_filename = output_filename
+        self.metadata = metadata
+        self.nchans = metadata["nchans"]
+        self.dtype = nbits_to_dtype(metadata.get("nbits", 8))
+        self.nsamples_written = 0
+
+        # Time-major buffer matching the on-disk layout
+        self._buffer = np.empty((buffer_nsamp, self.nchans), dtype=self.dtype)
+
+        self._file = open(output_filename, 'wb')
+        write_filterbank_header(self._file, metadata)
+
+    def write_block(self, block):
+        """
+        Append a block of data to the file.
+
+        :param block: A (nchans, nsamp) array of data.
+        """
+        nchans, nsamp = block.shape
+        if nchans != self.nchans:
+            raise ValueError(f"Block has {nchans} channels, expected {self.nchans}")
+
+        buffer_nsamp = self._buffer.shape[0]
+        for start in range(0, nsamp, buffer_nsamp):
+            end = min(start + buffer_nsamp, nsamp)
+            buffer = self._buffer[:end - start]
+            chunk = block[:, start:end].transpose()
+            if chunk.dtype != self.dtype:
+                # Round and clip to the nbits range like quantise.quantise, instead of truncating and wrapping
+                chunk = saturate(chunk, self.dtype)
+            np.copyto(buffer, chunk, casting='unsafe')
+            buffer.tofile(self._file)
+
+        self.nsamples_written += nsamp
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 def create_filterbank(data,output_filename, metadata):
     """
     Create a filterbank file with the given data and metadata.
 
+    The samples are written in the dtype of metadata["nbits"] (uint8, uint16 or uint32,
+    default 8), and any other nbits raises a ValueError. Older versions always wrote uint8.
+
     :param output_filename: The output filterbank file path.
     :param data: The data to be included in the filterbank file.
     :param metadata: The metadata to be included in the filterbank file.
     """
     print(output_filename)
-    with open(output_filename, 'wb') as f:
-        # Write the header start marker
-        # Use '<I' for little-endian unsigned int encoding
-        f.write(struct.pack('<I', len('HEADER_START')))
-        f.write(b'HEADER_START')
-        
-        # Write metadata key-value pairs
-        for key, value in metadata.items():
-            #print("Writing key: '", key, "' value: '", value, "' to file.")
-            # Encode and write the length of the metadata key
-            f.write(struct.pack('<I', len(key)))
-            # Encode and write the metadata key as bytes
-            f.write(key.encode())
-            
-            # Check the type of the metadata value and encode it accordingly
-            if isinstance(value, str):
-                # Encode and write the length of the string value
-                f.write(struct.pack('<I', len(value)))
-                # Encode and write the string value as bytes
-                f.write(value.encode())
-            elif isinstance(value, int):
-                # Encode and write the integer value as little-endian signed int
-                f.write(struct.pack('<i', value))
-            elif isinstance(value, float):
-                # Encode and write the float value as little-endian double precision float
-                f.write(struct.pack('<d', value))
-            else:
-                raise ValueError(f"Unsupported data type for key '{key}': {type(value)}")
-                
-        # Write the header end marker
-        f.write(struct.pack('<I', len('HEADER_END')))
-        f.write(b'HEADER_END')
-        
-        # Write the signal data
-        # tofile() writes the array to a binary file in a machine-specific format
-        data = data.astype(np.uint8)
-        data = data.transpose()
-        #data = np.fliplr(data)
-        #data = np.flipud(data)
-        data.tofile(f)
+    with FilterbankWriter(output_filename, metadata) as writer:
+        writer.write_block(data)
 
 def read_filterbank_data(file_path, header_params, header_len):
     nchans = header_params["nchans"]
     nbits = header_params["nbits"]
-
-    # Validate that the data format is supported
-    if nbits not in [8, 16, 32]:
-        raise ValueError(f"Unsupported data format: {nbits}-bit")
+    dtype = nbits_to_dtype(nbits)
 
     # Calculate the size of one sample in bytes
     sample_size = nbits // 8
@@ -99,7 +162,7 @@ def read_filterbank_data(file_path, header_params, header_len):
         file.seek(header_len)
 
         # Read the entire file into a 1D NumPy array
-        data = np.fromfile(file, dtype=np.uint8 if nbits == 8 else (np.uint16 if nbits == 16 else np.uint32))
+        data = np.fromfile(file, dtype=dtype)
 
     # Calculate the number of time samples
     nsamples = len(data) // (nchans * sample_size)
@@ -131,6 +194,12 @@ def read_filterbank_header(file_path):
     def read_double(file):
         return struct.unpack("<d", file.read(8))[0], 8
 
+    string_params = ["rawdatafile", "source_name"]
+    double_params = ["az_start", "za_start", "src_raj", "src_dej", "tstart", "tsamp", "period", "fch1", "foff"]
+    int_params = ["nchans", "telescope_id", "machine_id", "data_type", "ibeam", "nbeams", "nbits", "barycentric", "pulsarcentric", "nbins", "nifs", "npuls", "refdm", "nsamples"]
+    # Encoded names of the known parameters, to resume parsing after an unknown one
+    known_names = [struct.pack("<i", len(name)) + name.encode() for name in string_params + double_params + int_params + ["HEADER_END"]]
+
     header_params = {}
 
     with open(file_path, "rb") as file:
@@ -149,27 +218,228 @@ def read_filterbank_header(file_path):
             if param_name == "HEADER_END":
                 break
 
-            if param_name in ["rawdatafile", "source_name"]:
+            if param_name in string_params:
                 string_value, nbytes_read = get_string(file)
                 header_params[param_name] = string_value
                 totalbytes += nbytes_read
 
-            elif param_name in ["az_start", "za_start", "src_raj", "src_dej", "tstart", "tsamp", "period", "fch1", "foff", "nchans", "telescope_id", "machine_id", "data_type", "ibeam", "nbeams", "nbits", "barycentric", "pulsarcentric", "nbins", "nifs", "npuls", "refdm"]:
-                value, nbytes_read = read_double(file) if param_name in ["az_start", "za_start", "src_raj", "src_dej", "tstart", "tsamp", "period", "fch1", "foff"] else read_int(file)
+            elif param_name in double_params + int_params:
+                value, nbytes_read = read_double(file) if param_name in double_params else read_int(file)
                 header_params[param_name] = value
                 totalbytes += nbytes_read
 
             else:
                 print(f"Unknown parameter: {param_name}")
-                return header_params, totalbytes
+                # The size of an unknown value is not known, so skip to the next known parameter
+                position = file.tell()
+                following = file.read(65536)
+                matches = [index for index in (following.find(name) for name in known_names) if index >= 0]
+                if not matches:
+                    raise ValueError(f"Cannot skip unknown header parameter '{param_name}' in {file_path}: no known parameter or HEADER_END follows it")
+                totalbytes += min(matches)
+                file.seek(position + min(matches))
 
     return header_params, totalbytes
 
-def read_filterbank(file_path):
+class FilterbankMemmap:
+    """
+    Lazy, memory-mapped view of the data in a filterbank file.
+
+    Indexing with [channels, samples] returns a (nchans, nsamp) array in the same
+    orientation as read_filterbank. The sample range is turned into a byte offset
+    into the file, so only the pages holding the requested spectra are mapped and read.
+
+    :param file_path: The filterbank file path.
+    :param header_params: The header dictionary returned by read_filterbank_header.
+    :param header_len: The header length in bytes returned by read_filterbank_header.
+    :param mode: The np.memmap mode, 'r' (read only), 'r+' (read/write) or 'c' (copy-on-write).
+    """
+    def __init__(self, file_path, header_params, header_len, mode="r"):
+        self.file_path = file_path
+        self.header_params = header_params
+        self.header_len = header_len
+        self.mode = mode
+
+        self.nchans = header_params["nchans"]
+        self.nbits = header_params["nbits"]
+        self.dtype = np.dtype(nbits_to_dtype(self.nbits))
+        self.tsamp = header_params.get("tsamp")
+
+        # The data are stored time major, one spectrum of nchans values per time sample
+        self.spectrum_nbytes = self.nchans * self.dtype.itemsize
+        self.nsamples = (os.path.getsize(file_path) - header_len) // self.spectrum_nbytes
+
+    @property
+    def shape(self):
+        return (self.nchans, self.nsamples)
+
+    def byte_range(self, samp_start, samp_end):
+        """
+        Return the (start, end) byte offsets in the file of the samples [samp_start, samp_end).
+        """
+        start = self.header_len + samp_start * self.spectrum_nbytes
+        end = self.header_len + samp_end * self.spectrum_nbytes
+        return start, end
+
+    def map_samples(self, samp_start, samp_end):
+        """
+        Memory map the samples [samp_start, samp_end) as a (nsamp, nchans) array.
+
+        The returned array is the raw time-major view on the file, so writes go
+        straight to disk when the reader was opened with mode 'r+'.
+        """
+        samp_start = max(0, samp_start)
+        samp_end = min(self.nsamples, samp_end)
+        if samp_end <= samp_start:
+            return np.empty((0, self.nchans), dtype=self.dtype)
+        offset, _ = self.byte_range(samp_start, samp_end)
+        return np.memmap(self.file_path, dtype=self.dtype, mode=self.mode, offset=offset,
+                         shape=(samp_end - samp_start, self.nchans))
+
+    def read(self, chan_start=0, chan_end=None, samp_start=0, samp_end=None):
+        """
+        Read channels [chan_start, chan_end) and samples [samp_start, samp_end) into memory.
+
+        :return: A (nchans, nsamp) array.
+        """
+        if chan_end is None:
+            chan_end = self.nchans
+        if samp_end is None:
+            samp_end = self.nsamples
+        return self[chan_start:chan_end, samp_start:samp_end]
+
+    def read_time(self, time_start, time_end, chan_start=0, chan_end=None):
+        """
+        Read the samples between time_start and time_end (in seconds from the start of the file).
+
+        :return: A (nchans, nsamp) array.
+        """
+        if self.tsamp is None:
+            raise ValueError(f"The header of {self.file_path} has no tsamp, use read() with sample indices instead")
+        samp_start = int(np.floor(time_start / self.tsamp))
+        samp_end = int(np.ceil(time_end / self.tsamp))
+        return self.read(chan_start, chan_end, samp_start, samp_end)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        chan_key, samp_key = key
+
+        squeeze = isinstance(samp_key, (int, np.integer))
+        if squeeze:
+            if samp_key < 0:
+                samp_key += self.nsamples
+            if not 0 <= samp_key < self.nsamples:
+                raise IndexError(f"Sample index {samp_key} out of range for {self.nsamples} samples")
+            samp_key = slice(samp_key, samp_key + 1)
+
+        samples = range(*samp_key.indices(self.nsamples))
+        if len(samples) == 0:
+            data = np.empty((0, self.nchans), dtype=self.dtype)[:, chan_key]
+        else:
+            samp_start = min(samples[0], samples[-1])
+            samp_end = max(samples[0], samples[-1]) + 1
+            mapped = self.map_samples(samp_start, samp_end)
+            if samples.step != 1:
+                mapped = mapped[np.asarray(samples) - samp_start]
+            data = mapped[:, chan_key]
+
+        # Put the sample axis last, as for read_filterbank
+        # Copy out of the map so that the file can be closed once the view is dropped
+        data = np.ascontiguousarray(data.transpose())
+        if squeeze:
+            data = data[..., 0]
+        return data
+
+def read_filterbank(file_path, mmap=False, dtype=None):
+    """
+    Read a filterbank file.
+
+    :param file_path: The filterbank file path.
+    :param mmap: If True, return a lazy FilterbankMemmap instead of reading the whole file.
+    :param dtype: Optional dtype to convert the data to, e.g. np.float32 before injecting signals.
+                  Default is None, which keeps the on-disk dtype. Ignored when mmap is True.
+    :return: A tuple of the (nchans, nsamp) data (or FilterbankMemmap) and the header dictionary.
+    """
     header_params, header_len = read_filterbank_header(file_path)
-    data = read_filterbank_data(file_path, header_params, header_len)
+    if mmap:
+        data = FilterbankMemmap(file_path, header_params, header_len)
+    else:
+        data = read_filterbank_data(file_path, header_params, header_len)
+        if dtype is not None:
+            data = data.astype(dtype)
     return data, dict(header_params)
 
+def read_filterbank_blocks(file_path, block_size, overlap=None, DM=None):
+    """
+    Iterate over a filterbank file in fixed-size time blocks without loading the whole file.
+
+    Each block starts block_size samples after the previous one and is extended by overlap
+    samples into the next block, so that dispersion sweeps crossing a block edge are complete
+    in at least one block. Only the last block(s) can be shorter than block_size + overlap.
+
+    :param file_path: The filterbank file path.
+    :param block_size: The number of new time samples per block.
+    :param overlap: The number of extra samples appended to each block. Defaults to the
+                    maximum dispersion delay at DM (or 0 if DM is not given).
+    :param DM: Dispersion measure used to compute the default overlap.
+    :return: A generator of (start_sample, block) tuples, block having shape (nchans, nsamp).
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+
+    data, header_params = read_filterbank(file_path, mmap=True)
+
+    if overlap is None:
+        overlap = 0
+        if DM is not None:
+            offsets = calculate_dispersion_offsets(DM, header_params["fch1"], header_params["foff"], data.nchans, header_params["tsamp"])
+            overlap = int(np.max(np.abs(offsets)))
+
+    for start in range(0, data.nsamples, block_size):
+        yield start, data[:, start:start + block_size + overlap]
+
+
+def pulse_sample_window(DM, fch1, foff, nchans, tsamp, pulse_start_index=0, pulse_duration=100):
+    """
+    Return the [start, end) range of time samples touched by a dispersed pulse.
+    """
+    pulse = SparsePulse.from_params(DM, tsamp, foff, fch1, nchans, pulse_start_index=pulse_start_index, pulse_duration=pulse_duration)
+    return pulse.window()
+
+def inject_pulse_into_filterbank(file_path, DM, output_path=None, **pulse_params):
+    """
+    Inject a dispersed pulse into an existing filterbank file without reading the whole file.
+
+    The file is memory mapped read/write, and only the time window touched by the dispersed
+    pulse is read, modified and written back. The header is left byte for byte as it is, so
+    unknown header fields are kept. Sums are rounded and saturated at the range of the
+    file's nbits.
+
+    :param file_path: The filterbank file path.
+    :param DM: Dispersion measure of the pulse.
+    :param output_path: Optional path of a patched copy. Default is None, which modifies
+                        file_path in place.
+    :param pulse_params: The pulse parameters of generate_pulse.
+    :return: The [start, end) range of time samples that was modified.
+    """
+    if output_path is not None:
+        shutil.copyfile(file_path, output_path)
+        file_path = output_path
+
+    header_params, header_len = read_filterbank_header(file_path)
+    data = FilterbankMemmap(file_path, header_params, header_len, mode="r+")
+    pulse = SparsePulse.from_params(DM, header_params["tsamp"], header_params["foff"], header_params["fch1"], data.nchans, **pulse_params)
+    window_start, window_end = pulse.window()
+    window_start, window_end = max(window_start, 0), min(window_end, data.nsamples)
+    if window_end <= window_start:
+        return window_start, window_start
+
+    # Writes to the (nchans, nsamp) view go straight to the mapped pages of the window
+    window = data.map_samples(window_start, window_end)
+    pulse.add_to(window.T, sample_offset=window_start)
+    window.flush()
+    return window_start, window_end
 
 def show_filterbank(data, title='Filterbank'):
     """
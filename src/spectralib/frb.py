@@ -1,12 +1,16 @@
 import numpy as np
+from functools import lru_cache
+from spectralib.quantise import clip_to_nbits, inject_into, saturate
 
-def generate_high_resolution_pulse(data, DM, tsamp, foff, fch1, freq_upsample_factor, **pulse_params):
+def generate_high_resolution_pulse(data, DM, tsamp, foff, fch1, freq_upsample_factor, out=None, **pulse_params):
     pulse_start_index = pulse_params.get('pulse_start_index', 0)
     pulse_duration = pulse_params.get('pulse_duration', 100)
     pulse_amplitude = pulse_params.get('pulse_amplitude', 200)
     time_profile = pulse_params.get('time_profile', None)
     freq_profile = pulse_params.get('freq_profile', None)
 
+    # With out given, inject into out and leave the clipping to a final quantise.finalise call
+    data = inject_into(data, out)
     nchans, nsamp = data.shape
 
     if time_profile is None:
@@ -20,27 +24,43 @@ def generate_high_resolution_pulse(data, DM, tsamp, foff, fch1, freq_upsample_fa
     freq_profile_hr = np.interp(np.linspace(0, nchans - 1, nchans * freq_upsample_factor),
                                 np.arange(nchans), freq_profile)
 
-    # Calculate high-resolution dispersion offsets
+    # Calculate high-resolution dispersion offsets, in units of the high-resolution sample time
+    nsubbands = nchans * freq_upsample_factor
     foff_hr = foff / freq_upsample_factor
-    fch1_hr = np.array([fch1 + i * foff for i in range(nchans * freq_upsample_factor)])
-    sub_band_offsets = calculate_dispersion_offsets(DM, fch1_hr, foff_hr, nchans * freq_upsample_factor, tsamp)
+    tsamp_hr = tsamp / freq_upsample_factor
+    sub_band_offsets = calculate_dispersion_offsets(DM, fch1, foff_hr, nsubbands, tsamp_hr)
 
-    for i in range(nchans * freq_upsample_factor):
-        for j in range(pulse_duration * freq_upsample_factor):
-            time_index = round((pulse_start_index * freq_upsample_factor) + j + sub_band_offsets[i])
-            if 0 <= time_index < nsamp * freq_upsample_factor:
-                data[i // freq_upsample_factor, time_index] += pulse_amplitude * time_profile_hr[j] * freq_profile_hr[i]
+    # High-resolution time index of every (sub-band, pulse sample) pair
+    time_index_hr = np.rint((pulse_start_index * freq_upsample_factor) + np.arange(pulse_duration * freq_upsample_factor)[np.newaxis, :] + sub_band_offsets[:, np.newaxis]).astype(np.int64)
+    chan_index = np.broadcast_to((np.arange(nsubbands) // freq_upsample_factor)[:, np.newaxis], time_index_hr.shape)
+    # Each output cell collects freq_upsample_factor**2 high-resolution cells, so normalise to keep the pulse amplitude
+    values = pulse_amplitude * time_profile_hr[np.newaxis, :] * freq_profile_hr[:, np.newaxis] / freq_upsample_factor**2
 
-    data = np.clip(data, 0, 255)
+    inside = (time_index_hr >= 0) & (time_index_hr < nsamp * freq_upsample_factor)
+    if np.any(inside):
+        chan_index = chan_index[inside]
+        time_index = time_index_hr[inside] // freq_upsample_factor
+        values = values[inside]
+
+        # Reduce the sub-bands back into channels, only over the cells the pulse touches
+        cells, inverse = np.unique(chan_index * nsamp + time_index, return_inverse=True)
+        cell_values = np.bincount(inverse, weights=values, minlength=len(cells))
+        chan_index, time_index = np.divmod(cells, nsamp)
+        data[chan_index, time_index] = saturate(data[chan_index, time_index] + cell_values, data.dtype)
+
+    if out is None:
+        data = clip_to_nbits(data, pulse_params.get('nbits', 8))
     return data
 
-def generate_pulse(data, DM, tsamp, foff, fch1, **pulse_params):
+def generate_pulse(data, DM, tsamp, foff, fch1, out=None, **pulse_params):
     pulse_start_index = pulse_params.get('pulse_start_index', 0)
     pulse_duration = pulse_params.get('pulse_duration', 100)
     pulse_amplitude = pulse_params.get('pulse_amplitude', 200)
     time_profile = pulse_params.get('time_profile', None)
     freq_profile = pulse_params.get('freq_profile', None)
 
+    # With out given, inject into out and leave the clipping to a final quantise.finalise call
+    data = inject_into(data, out)
     nchans, nsamp = data.shape
 
     if time_profile is None:
@@ -50,26 +70,326 @@ def generate_pulse(data, DM, tsamp, foff, fch1, **pulse_params):
 
     offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
 
-    for i in range(nchans):
-        for j in range(pulse_duration):
-            time_index = round(pulse_start_index + j + offsets[i])
-            if 0 <= time_index < nsamp:
-                data[i, time_index] += pulse_amplitude * time_profile[j] * freq_profile[i]
+    # Broadcast grid of the time index of every (channel, pulse sample) pair
+    time_index = np.rint(pulse_start_index + np.arange(pulse_duration)[np.newaxis, :] + offsets[:, np.newaxis]).astype(np.int64)
+    chan_index = np.broadcast_to(np.arange(nchans)[:, np.newaxis], time_index.shape)
+    values = pulse_amplitude * np.asarray(time_profile)[np.newaxis, :pulse_duration] * np.asarray(freq_profile)[:nchans, np.newaxis]
+
+    # Mask out the parts of the pulse that fall outside the data
+    inside = (time_index >= 0) & (time_index < nsamp)
 
-    data = np.clip(data, 0, 255)
+    # A pulse never hits the same (channel, time) cell twice, so a fancy-indexed update is a safe scatter
+    # Integer data is rounded and saturated to its dtype, not truncated and wrapped around
+    chan_index, time_index = chan_index[inside], time_index[inside]
+    data[chan_index, time_index] = saturate(data[chan_index, time_index] + values[inside], data.dtype)
+
+    if out is None:
+        data = clip_to_nbits(data, pulse_params.get('nbits', 8))
+    return data
+
+def dispersed_pulse_spans(DM, tsamp, foff, fch1, nchans, **pulse_params):
+    """
+    Render a dispersed pulse once as per-channel spans, for injecting it many times.
+
+    The pulse parameters are the same as for generate_pulse, except pulse_start_index which is
+    given when the spans are added with add_pulse_train.
+
+    :return: A tuple (starts, values), where starts is an integer array of shape (nchans,) with
+             the offset of the first pulse sample of each channel from the pulse start index,
+             and values has shape (nchans, pulse_duration).
+    """
+    pulse_duration = pulse_params.get('pulse_duration', 100)
+    pulse_amplitude = pulse_params.get('pulse_amplitude', 200)
+    time_profile = pulse_params.get('time_profile', None)
+    freq_profile = pulse_params.get('freq_profile', None)
+
+    if time_profile is None:
+        time_profile = np.ones(pulse_duration)
+    if freq_profile is None:
+        freq_profile = np.ones(nchans)
+
+    starts = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp).astype(np.int64)
+    values = pulse_amplitude * np.asarray(time_profile)[np.newaxis, :pulse_duration] * np.asarray(freq_profile)[:nchans, np.newaxis]
+    return starts, values
+
+class SparsePulse:
+    """
+    A dispersed pulse stored as one span of pulse_duration samples per channel.
+
+    At high DM the pulse sweeps over a long time range, but each channel only holds
+    pulse_duration samples of it, so the spans are much smaller than a dense array of the
+    window the pulse touches. A pulse can be added to a whole observation, to a streamed
+    block of one, or to a memory-mapped window of a file.
+
+    :param starts: Integer array of shape (nchans,), the sample of the first pulse sample of each
+                   channel relative to pulse_start_index.
+    :param values: Array of shape (nchans, pulse_duration) with the pulse of each channel.
+    :param pulse_start_index: Sample index of the pulse start.
+    """
+    def __init__(self, starts, values, pulse_start_index=0):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.values = np.asarray(values)
+        self.pulse_start_index = int(pulse_start_index)
+
+    @classmethod
+    def from_params(cls, DM, tsamp, foff, fch1, nchans, **pulse_params):
+        """
+        Render a dispersed pulse from the pulse parameters of generate_pulse.
+        """
+        starts, values = dispersed_pulse_spans(DM, tsamp, foff, fch1, nchans, **pulse_params)
+        return cls(starts, values, pulse_params.get('pulse_start_index', 0))
+
+    @property
+    def nchans(self):
+        return self.values.shape[0]
+
+    @property
+    def pulse_duration(self):
+        return self.values.shape[1]
+
+    @property
+    def spans(self):
+        """
+        The (starts, values) tuple used by add_pulse_train.
+        """
+        return self.starts, self.values
+
+    def window(self):
+        """
+        Return the [start, end) range of time samples touched by the pulse.
+        """
+        if self.nchans == 0:
+            return self.pulse_start_index, self.pulse_start_index
+        return self.pulse_start_index + int(self.starts.min()), self.pulse_start_index + int(self.starts.max()) + self.pulse_duration
+
+    def add_to(self, data, sample_offset=0):
+        """
+        Add the pulse to a block of data, in place and without clipping. Sums stored in integer
+        arrays are rounded and saturated.
+
+        :param data: Array of shape (nchans, nsamp), modified in place.
+        :param sample_offset: Sample index of the first column of data, e.g. the start of a
+                              streamed block or of a file window.
+        :return: The data array.
+        """
+        nsamp = data.shape[1]
+        time_index = self.pulse_start_index - sample_offset + self.starts[:, np.newaxis] + np.arange(self.pulse_duration)[np.newaxis, :]
+        chan_index = np.broadcast_to(np.arange(self.nchans)[:, np.newaxis], time_index.shape)
+        inside = (time_index >= 0) & (time_index < nsamp)
+        if not np.any(inside):
+            return data
+
+        # Every (channel, time) cell is hit at most once, so a fancy-indexed update is a safe scatter
+        chan_index, time_index = chan_index[inside], time_index[inside]
+        data[chan_index, time_index] = saturate(data[chan_index, time_index] + self.values[inside], data.dtype)
+        return data
+
+    def to_dict(self):
+        """
+        Serialise the pulse to a compact, JSON compatible ground truth record.
+        """
+        return {
+            'pulse_start_index': self.pulse_start_index,
+            'window': list(self.window()),
+            'starts': self.starts.tolist(),
+            'values': self.values.astype(np.float32).tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        Rebuild a pulse serialised with to_dict.
+        """
+        values = np.asarray(record['values'], dtype=np.float32).reshape(len(record['starts']), -1)
+        return cls(record['starts'], values, record['pulse_start_index'])
+
+def intra_channel_smearing_times(DM, fch1, foff, nchans):
+    """
+    Dispersion delay across the width of each channel, in seconds.
+    """
+    freqs = fch1 + np.arange(nchans) * foff
+    half_width = abs(foff) / 2
+    return 4148.741601 * DM * ((1 / (freqs - half_width) ** 2) - (1 / (freqs + half_width) ** 2))
+
+def scattering_times(fch1, foff, nchans, scattering_time, scattering_index=-4.0, reference_frequency=None):
+    """
+    Exponential scattering time of each channel, in seconds.
+
+    :param scattering_time: Scattering time at the reference frequency in seconds.
+    :param scattering_index: Power law index of the scattering time with frequency.
+    :param reference_frequency: Reference frequency in MHz. Defaults to fch1.
+    """
+    if reference_frequency is None:
+        reference_frequency = fch1
+    freqs = fch1 + np.arange(nchans) * foff
+    return scattering_time * (freqs / reference_frequency) ** scattering_index
+
+def smearing_kernels(DM, tsamp, foff, fch1, nchans, scattering_time=0.0, scattering_index=-4.0, reference_frequency=None, scattering_length=8):
+    """
+    Time domain kernels of the intra-channel dispersion smearing and of the scattering tail.
+
+    The smearing kernel of each channel is a boxcar as wide as the dispersion delay across the
+    channel, with fractional edge samples, and the scattering kernel is a one-sided exponential
+    integrated over each sample and truncated after scattering_length scattering times. Both are
+    normalised to unit sum, so convolving with them keeps the fluence of the pulse.
+
+    :return: A tuple (boxcars, tails) of arrays of shape (nchans, nboxcar) and (nchans, ntail).
+    """
+    widths = np.maximum(intra_channel_smearing_times(DM, fch1, foff, nchans) / tsamp, 1e-9)
+    nboxcar = max(1, int(np.ceil(widths.max())))
+    boxcars = np.clip(widths[:, np.newaxis] - np.arange(nboxcar)[np.newaxis, :], 0, 1) / widths[:, np.newaxis]
+
+    taus = scattering_times(fch1, foff, nchans, scattering_time, scattering_index, reference_frequency) / tsamp
+    ntail = max(1, int(np.ceil(scattering_length * taus.max())))
+    edges = np.arange(ntail + 1)[np.newaxis, :] / np.maximum(taus, 1e-9)[:, np.newaxis]
+    tails = -np.diff(np.exp(-edges), axis=1)
+    tails /= tails.sum(axis=1, keepdims=True)
+    return boxcars, tails
+
+def smeared_sparse_pulse(DM, tsamp, foff, fch1, nchans, **pulse_params):
+    """
+    Render a dispersed pulse convolved with the intra-channel smearing and scattering kernels
+    of each channel, an analytic alternative to generate_high_resolution_pulse.
+
+    The time profile of every channel is convolved with its kernels by multiplying real FFTs,
+    computed for all channels at once.
+
+    :param pulse_params: The pulse parameters of generate_pulse, plus:
+        - scattering_time (float): Scattering time at the reference frequency in seconds. Default is 0.
+        - scattering_index (float): Power law index of the scattering time with frequency. Default is -4.
+        - reference_frequency (float): Reference frequency of the scattering time in MHz. Default is fch1.
+    :return: A SparsePulse.
+    """
+    pulse_start_index = pulse_params.get('pulse_start_index', 0)
+    pulse_duration = pulse_params.get('pulse_duration', 100)
+    pulse_amplitude = pulse_params.get('pulse_amplitude', 200)
+    time_profile = pulse_params.get('time_profile', None)
+    freq_profile = pulse_params.get('freq_profile', None)
+
+    if time_profile is None:
+        time_profile = np.ones(pulse_duration)
+    if freq_profile is None:
+        freq_profile = np.ones(nchans)
+
+    boxcars, tails = smearing_kernels(DM, tsamp, foff, fch1, nchans, pulse_params.get('scattering_time', 0.0),
+                                      pulse_params.get('scattering_index', -4.0), pulse_params.get('reference_frequency', None))
+
+    # Linear convolution of the profile with both kernels, as one batched product of spectra
+    length = pulse_duration + boxcars.shape[1] + tails.shape[1] - 2
+    spectrum = np.fft.rfft(np.asarray(time_profile, dtype=np.float64)[:pulse_duration], n=length)[np.newaxis, :]
+    spectrum = spectrum * np.fft.rfft(boxcars, n=length, axis=1) * np.fft.rfft(tails, n=length, axis=1)
+    profiles = np.fft.irfft(spectrum, n=length, axis=1)
+
+    values = pulse_amplitude * np.asarray(freq_profile)[:nchans, np.newaxis] * profiles
+    # Centre the smearing boxcar on the arrival time at the channel frequency
+    widths = intra_channel_smearing_times(DM, fch1, foff, nchans) / tsamp
+    starts = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp).astype(np.int64) - np.floor(widths / 2).astype(np.int64)
+    return SparsePulse(starts, values, pulse_start_index)
+
+def generate_smeared_pulse(data, DM, tsamp, foff, fch1, out=None, **pulse_params):
+    """
+    Add a dispersed pulse with analytic intra-channel smearing and scattering, see smeared_sparse_pulse.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param out: Optional array to add the pulse into, without clipping. Can be data itself.
+    :return: The data array with the pulse added.
+    """
+    data = inject_into(data, out)
+    pulse = smeared_sparse_pulse(DM, tsamp, foff, fch1, data.shape[0], **pulse_params)
+    data = pulse.add_to(data)
+
+    if out is None:
+        data = clip_to_nbits(data, pulse_params.get('nbits', 8))
+    return data
+
+def add_pulse_train(data, spans, arrival_indices, amplitudes=None, block_size=1 << 22):
+    """
+    Add a pulse rendered by dispersed_pulse_spans at every arrival index, in place and without clipping.
+
+    The (channel, sample) indices of all channels and pulses are added with one fancy-indexed
+    update per block of at most block_size samples. Pulses closer than pulse_duration are split
+    into interleaved groups in which no two pulses overlap, and coincident pulses are summed
+    with np.bincount first. Integer data is rounded and saturated to its range.
+
+    :param data: Input data array of shape (nchans, nsamp), modified in place.
+    :param spans: The (starts, values) tuple returned by dispersed_pulse_spans.
+    :param arrival_indices: Integer array of pulse start indices.
+    :param amplitudes: Optional array of per-pulse scale factors.
+    :param block_size: Maximum number of pulse samples added by one update, which bounds the
+                       memory used for long pulse trains.
+    :return: The data array.
+    """
+    starts, values = spans
+    nchans, nsamp = data.shape
+    pulse_duration = values.shape[1]
+    arrival_indices = np.asarray(arrival_indices, dtype=np.int64)
+    order = np.argsort(arrival_indices, kind="stable")
+    arrival_indices = arrival_indices[order]
+    if amplitudes is None:
+        amplitudes = np.ones(len(arrival_indices))
+    else:
+        amplitudes = np.asarray(amplitudes, dtype=np.float64)[order]
+    if len(arrival_indices) == 0 or pulse_duration == 0:
+        return data
+
+    sample = np.arange(pulse_duration)
+    channels = np.arange(nchans)[:, np.newaxis, np.newaxis]
+
+    def scatter(group_arrivals, group_amplitudes, coincident=False):
+        # Indices ordered by channel, then pulse, then pulse sample, so the update walks
+        # through data in memory order
+        samples = starts[:, np.newaxis, np.newaxis] + group_arrivals[np.newaxis, :, np.newaxis] + sample[np.newaxis, np.newaxis, :]
+        pulse_values = values[:, np.newaxis, :] * group_amplitudes[np.newaxis, :, np.newaxis]
+        if coincident or group_arrivals[0] + starts.min() < 0 or group_arrivals[-1] + starts.max() + pulse_duration > nsamp:
+            # Only keep the samples inside the data, and sum coincident pulses
+            inside = (samples >= 0) & (samples < nsamp)
+            index = (samples + channels * nsamp)[inside]
+            pulse_values = pulse_values[inside]
+            if coincident:
+                index, inverse = np.unique(index, return_inverse=True)
+                pulse_values = np.bincount(inverse, weights=pulse_values, minlength=len(index))
+            index = np.divmod(index, nsamp)
+        else:
+            index = (channels, samples)
+        data[index] = saturate(data[index] + pulse_values, data.dtype)
+
+    # Every channel is shifted by the same amount, so pulses overlap within a channel only if
+    # their arrivals are closer than the pulse duration
+    min_separation = np.min(np.diff(arrival_indices)) if len(arrival_indices) > 1 else pulse_duration
+    # Pulses stride apart are at least pulse_duration samples apart, so they never overlap
+    stride = 1 if min_separation == 0 else int(np.ceil(pulse_duration / min_separation))
+    npulses = max(1, block_size // values.size)
+    for group in range(stride):
+        group_arrivals = arrival_indices[group::stride]
+        group_amplitudes = amplitudes[group::stride]
+        for first in range(0, len(group_arrivals), npulses):
+            scatter(group_arrivals[first:first + npulses], group_amplitudes[first:first + npulses], coincident=min_separation == 0)
     return data
 
 def calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp):
-    freqs = np.zeros(nchans)
-    for i in range(nchans):
-        freqs[i] = fch1 + i * foff
-
-    delays = np.zeros(nchans)
-    for i in range(nchans):
-        delays[i] = 4148.741601 * DM * ((1 / (freqs[i] ** 2)) - (1 / (freqs[0] ** 2)))
-
-    offsets = np.zeros(nchans)
-    for i in range(nchans):
-        offsets[i] = round(delays[i] / tsamp)
-    
-    return offsets
\ No newline at end of file
+    # The offsets are recomputed for every injected pulse, so they are memoised on the arguments.
+    # A copy is returned so that callers can't modify the cached array.
+    return _cached_dispersion_offsets(float(DM), float(fch1), float(foff), int(nchans), float(tsamp)).copy()
+
+@lru_cache(maxsize=256)
+def _cached_dispersion_offsets(DM, fch1, foff, nchans, tsamp):
+    freqs = fch1 + np.arange(nchans) * foff
+    delays = 4148.741601 * DM * ((1 / (freqs ** 2)) - (1 / (freqs[0] ** 2)))
+    offsets = np.rint(delays / tsamp)
+    offsets.flags.writeable = False
+    return offsets
+
+def calculate_dispersion_delay_table(DMs, fch1, foff, nchans, tsamp):
+    """
+    Calculate the dispersion offsets of every channel for a whole grid of DMs.
+
+    Row i is equal to calculate_dispersion_offsets(DMs[i], fch1, foff, nchans, tsamp),
+    so dedispersion and injection code can share a single table.
+
+    :param DMs: 1D array of dispersion measures.
+    :return: Integer array of shape (nDM, nchans) with the delay of each channel in samples.
+    """
+    DMs = np.asarray(DMs, dtype=np.float64).reshape(-1)
+    freqs = fch1 + np.arange(nchans) * foff
+    delays = 4148.741601 * DMs[:, np.newaxis] * ((1 / (freqs ** 2)) - (1 / (freqs[0] ** 2)))[np.newaxis, :]
+    return np.rint(delays / tsamp).astype(np.int64)
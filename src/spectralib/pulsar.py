@@ -1,5 +1,6 @@
-from spectralib.frb import generate_pulse, calculate_dispersion_offsets
+from spectralib.frb import calculate_dispersion_offsets, dispersed_pulse_spans, add_pulse_train
 import numpy as np
+from spectralib.quantise import clip_to_nbits, inject_into
 
 def apparent_pulse_period(binary_params, time):
     # heavily influenced by sigproc's fake, Duncan Lorimer, and Mike Keith's implementation in C
@@ -21,12 +22,14 @@ def apparent_pulse_period(binary_params, time):
     mass_function = (mass_companion * np.sin(inclination))**3 / (mass_companion + mass_pulsar)**2
     asini = (G * M_SUN * mass_function * orbital_period**2 / (4 * np.pi**2))**(1/3)
 
-    mean_anomaly = omega_b * (time - t0)
+    # time can be a scalar or an array, every step below is elementwise
+    mean_anomaly = omega_b * (np.asarray(time, dtype=np.float64) - t0)
     eccentric_anomaly = mean_anomaly
 
+    # Newton iterations for Kepler's equation, until every element has converged
     for _ in range(10):
         e_next = eccentric_anomaly - (eccentric_anomaly - eccentricity * np.sin(eccentric_anomaly) - mean_anomaly) / (1 - eccentricity * np.cos(eccentric_anomaly))
-        if abs(e_next - eccentric_anomaly) < 1e-10:
+        if np.all(np.abs(e_next - eccentric_anomaly) < 1e-10):
             break
         eccentric_anomaly = e_next
 
@@ -36,7 +39,123 @@ def apparent_pulse_period(binary_params, time):
 
     return p_apparent
 
-def generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, **pulse_params):
+def binary_pulse_arrival_indices(binary_params, tsamp, start_index, nsamp, time_resolution=None):
+    """
+    Compute the sample index of every pulse of a binary pulsar up front.
+
+    The pulse phase is integrated from the apparent pulse period on a time grid that resolves
+    the orbit, and the arrival times are the times at which the phase crosses an integer,
+    starting with a pulse at start_index and ending before sample nsamp.
+
+    :param binary_params: Dictionary of binary parameters, see apparent_pulse_period.
+    :param tsamp: Sampling time in seconds.
+    :param start_index: Sample index of the first pulse, can be negative.
+    :param nsamp: Number of samples in the data.
+    :param time_resolution: Step of the integration grid in seconds. Defaults to 1/4096 of
+                            the orbital period.
+    :return: Integer array of pulse start indices.
+    """
+    start_time = start_index * tsamp
+    end_time = nsamp * tsamp
+    if time_resolution is None:
+        time_resolution = binary_params["orbital_period"] / 4096
+    npoints = max(2, int(np.ceil((end_time - start_time) / time_resolution)) + 1)
+    times = np.linspace(start_time, end_time, npoints)
+
+    # Trapezoidal integration of the pulse frequency gives the pulse phase on the grid
+    frequency = 1 / apparent_pulse_period(binary_params, times)
+    phase = np.concatenate(([0], np.cumsum((frequency[1:] + frequency[:-1]) / 2 * np.diff(times))))
+
+    pulse_times = np.interp(np.arange(np.floor(phase[-1]) + 1), phase, times)
+    pulse_times = pulse_times[pulse_times < end_time]
+    # Truncate towards zero like int()
+    return (pulse_times / tsamp).astype(np.int64)
+
+def draw_pulse_variability(npulses, rng=None, amplitude_modulation=0.0, jitter=0.0, nulling_probability=0.0, mode_probabilities=None):
+    """
+    Draw the pulse-to-pulse variability of every pulse in one vectorised step.
+
+    :param npulses: Number of pulses.
+    :param rng: A np.random.Generator, or a seed for one.
+    :param amplitude_modulation: Fractional rms of the log-normal, unit-mean amplitude of each pulse.
+    :param jitter: Rms of the Gaussian arrival time jitter in samples.
+    :param nulling_probability: Probability that a pulse is nulled.
+    :param mode_probabilities: Probability of each profile mode. Default is a single mode.
+    :return: Dictionary of arrays of length npulses with keys 'amplitudes' (zero for nulled pulses),
+             'jitter' (integer samples), 'nulled' (bool) and 'modes' (integer mode index).
+    """
+    rng = np.random.default_rng(rng)
+
+    if amplitude_modulation > 0:
+        sigma = np.sqrt(np.log1p(amplitude_modulation**2))
+        amplitudes = rng.lognormal(-sigma**2 / 2, sigma, npulses)
+    else:
+        amplitudes = np.ones(npulses)
+    if jitter > 0:
+        jitter_samples = np.rint(rng.normal(0, jitter, npulses)).astype(np.int64)
+    else:
+        jitter_samples = np.zeros(npulses, dtype=np.int64)
+    nulled = rng.random(npulses) < nulling_probability
+    if mode_probabilities is None:
+        modes = np.zeros(npulses, dtype=np.int64)
+    else:
+        mode_probabilities = np.asarray(mode_probabilities, dtype=np.float64)
+        modes = rng.choice(len(mode_probabilities), size=npulses, p=mode_probabilities / mode_probabilities.sum())
+
+    amplitudes[nulled] = 0
+    return {'amplitudes': amplitudes, 'jitter': jitter_samples, 'nulled': nulled, 'modes': modes}
+
+def add_variable_pulse_train(data, DM, tsamp, foff, fch1, arrival_indices, variability=None, rng=None, record=None, **pulse_params):
+    """
+    Add a pulse at every arrival index with pulse-to-pulse variability, in place and without clipping.
+
+    The variability of all pulses is drawn at once with draw_pulse_variability, and the pulses of
+    each profile mode are added in a single batched add_pulse_train call.
+
+    :param variability: Dictionary with the keyword arguments of draw_pulse_variability, and optionally
+                        'mode_time_profiles', a list with the time profile of each mode. Default is None,
+                        which adds identical pulses.
+    :param rng: A np.random.Generator, or a seed for one.
+    :param record: Optional dictionary that receives what was drawn for every pulse, as arrays with
+                   the keys 'arrival_indices' (after jitter), 'amplitudes' (scale factors of
+                   pulse_amplitude), 'nulled' and 'modes'.
+    :return: The data array.
+    """
+    nchans = data.shape[0]
+    arrival_indices = np.asarray(arrival_indices, dtype=np.int64)
+    if variability is None:
+        npulses = len(arrival_indices)
+        pulses = {'amplitudes': np.ones(npulses), 'jitter': np.zeros(npulses, dtype=np.int64),
+                  'nulled': np.zeros(npulses, dtype=bool), 'modes': np.zeros(npulses, dtype=np.int64)}
+        mode_time_profiles = None
+    else:
+        variability = dict(variability)
+        mode_time_profiles = variability.pop('mode_time_profiles', None)
+        if mode_time_profiles is not None and 'mode_probabilities' not in variability:
+            variability['mode_probabilities'] = np.ones(len(mode_time_profiles))
+        pulses = draw_pulse_variability(len(arrival_indices), rng=rng, **variability)
+
+    arrival_indices = arrival_indices + pulses['jitter']
+    if record is not None:
+        record.update(arrival_indices=arrival_indices, amplitudes=pulses['amplitudes'], nulled=pulses['nulled'], modes=pulses['modes'])
+    if variability is None:
+        spans = dispersed_pulse_spans(DM, tsamp, foff, fch1, nchans, **pulse_params)
+        return add_pulse_train(data, spans, arrival_indices)
+
+    for mode in np.unique(pulses['modes']):
+        selected = (pulses['modes'] == mode) & ~pulses['nulled']
+        if not np.any(selected):
+            continue
+        mode_params = dict(pulse_params)
+        if mode_time_profiles is not None:
+            mode_params['time_profile'] = mode_time_profiles[mode]
+            mode_params['pulse_duration'] = len(mode_time_profiles[mode])
+        spans = dispersed_pulse_spans(DM, tsamp, foff, fch1, nchans, **mode_params)
+        add_pulse_train(data, spans, arrival_indices[selected], pulses['amplitudes'][selected])
+    return data
+
+def generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, variability=None, rng=None, out=None, **pulse_params):
+    data = inject_into(data, out)
     nchans, nsamp = data.shape
     
     # Use calculate_dispersion_offsets from frb.py to calculate the maximum offset, and subtract it from 0 to get the start index
@@ -44,44 +163,42 @@ def generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, **pulse_p
     offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
     start_index = -max(offsets)
 
-    #pulse = 0
-    #pulse_start_time = start_index*tsamp
-    #while pulse_start_time < nsamp*tsamp:
-    #    pulse_start_time = start_index*tsamp + pulse * binary_params["rest_period"]
-    #    app_pulse_period = apparent_pulse_period(binary_params, pulse_start_time)
-    #    print("At time : ",pulse_start_time," apparent pulse period: ", app_pulse_period)
-    #    frb_start_time = pulse_start_time + app_pulse_period
-    #    pulse_start_index = int(frb_start_time / tsamp)
-
-    #    data = generate_pulse(data, DM, tsamp, foff, fch1, pulse_start_index=pulse_start_index, **pulse_params)
-    #    pulse+=1
-        
-    t = start_index*tsamp
-    while t < nsamp*tsamp:
-        t_index = int(t / tsamp)
-        data = generate_pulse(data, DM, tsamp, foff, fch1, pulse_start_index=t_index, **pulse_params)
-        app_pulse_period = apparent_pulse_period(binary_params, t)
-        print("At time : ",t," apparent pulse period: ", app_pulse_period)
-        t += app_pulse_period
-        
+    # Render the dispersed pulse once and add it at every arrival, clipping once at the end
+    arrival_indices = binary_pulse_arrival_indices(binary_params, tsamp, start_index, nsamp)
+    data = add_variable_pulse_train(data, DM, tsamp, foff, fch1, arrival_indices, variability, rng, **pulse_params)
+
+    if out is None:
+        data = clip_to_nbits(data, pulse_params.get('nbits', 8))
     return data
 
-def generate_solitary_pulsar(data, DM, tsamp, foff, fch1, rest_period, **pulse_params):
-    nchans, nsamp = data.shape
-    pulse_duration = pulse_params.get("pulse_duration", 100)
+def solitary_pulse_arrival_indices(rest_period, tsamp, start_index, nsamp):
+    """
+    Compute the sample index of every pulse of a solitary pulsar, starting with a pulse at
+    start_index and continuing one rest period at a time until the pulses pass the end of the data.
 
+    :return: Integer array of pulse start indices.
+    """
+    start_time = start_index * tsamp
+    npulses = int(np.ceil((nsamp * tsamp - start_time) / rest_period)) + 2
+    pulse_start_times = start_time + np.arange(npulses) * rest_period
+    # Every pulse up to and including the first one starting at or after the end of the data
+    keep = np.concatenate(([True], pulse_start_times[:-1] < nsamp * tsamp))
+    # Truncate towards zero like int()
+    return (pulse_start_times[keep] / tsamp).astype(np.int64)
+
+def generate_solitary_pulsar(data, DM, tsamp, foff, fch1, rest_period, variability=None, rng=None, out=None, **pulse_params):
+    data = inject_into(data, out)
+    nchans, nsamp = data.shape
 
     # Use calculate_dispersion_offsets from frb.py to calculate the maximum offset, and subtract it from 0 to get the start index
     # this ensures the pulsar signal is present in the entire data array, rather than missing from the bottom left corner
     offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
     start_index = -max(offsets)
-    pulse = 0
-    pulse_start_time = start_index*tsamp
-    while pulse_start_time < nsamp*tsamp:
-        pulse_start_time = start_index*tsamp + pulse * rest_period
-        pulse_start_index = int(pulse_start_time / tsamp)
 
-        data = generate_pulse(data, DM, tsamp, foff, fch1, pulse_start_index=pulse_start_index, **pulse_params)
-        pulse+=1
+    # Render the dispersed pulse once and add it at every arrival, clipping once at the end
+    arrival_indices = solitary_pulse_arrival_indices(rest_period, tsamp, start_index, nsamp)
+    data = add_variable_pulse_train(data, DM, tsamp, foff, fch1, arrival_indices, variability, rng, **pulse_params)
 
-    return data
\ No newline at end of file
+    if out is None:
+        data = clip_to_nbits(data, pulse_params.get('nbits', 8))
+    return data
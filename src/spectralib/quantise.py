@@ -0,0 +1,91 @@
+import numpy as np
+
+def nbits_to_dtype(nbits):
+    # Validate that the data format is supported
+    if nbits not in [8, 16, 32]:
+        raise ValueError(f"Unsupported data format: {nbits}-bit")
+    return np.uint8 if nbits == 8 else (np.uint16 if nbits == 16 else np.uint32)
+
+def nbits_range(nbits):
+    """
+    Range of values that can be stored in a filterbank file with nbits bits per sample.
+
+    :param nbits: Number of bits per sample, 8, 16 or 32.
+    :return: A tuple (minimum, maximum).
+    """
+    info = np.iinfo(nbits_to_dtype(nbits))
+    return int(info.min), int(info.max)
+
+def clip_to_nbits(data, nbits=8):
+    """
+    Clip data to the range that can be stored with nbits bits per sample, keeping its dtype.
+
+    :param data: Input data array.
+    :param nbits: Number of bits per sample of the output filterbank. Default is 8, i.e. 0 to 255.
+    :return: The clipped data array.
+    """
+    low, high = nbits_range(nbits)
+    return np.clip(data, low, high)
+
+def inject_into(data, out):
+    """
+    Select the array an injection writes into: data itself when out is None, otherwise out,
+    after copying data into it unless out is data.
+
+    :param data: Input data array.
+    :param out: Optional output array of the same shape.
+    :return: The array to inject into.
+    """
+    if out is None or out is data:
+        return data
+    if out.shape != data.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {data.shape}")
+    np.copyto(out, data, casting='unsafe')
+    return out
+
+def saturate(values, dtype):
+    """
+    Prepare values for storing in an array of dtype: integer dtypes are rounded to the nearest
+    integer and clipped to their range instead of wrapping around, floats are unchanged.
+
+    :param values: Array of values.
+    :param dtype: The dtype of the array the values are stored in.
+    :return: The values to store.
+    """
+    if not np.issubdtype(dtype, np.integer):
+        return values
+    info = np.iinfo(dtype)
+    return np.clip(np.rint(values), info.min, info.max)
+
+def finalise(data, nbits=8):
+    """
+    Clip data to the nbits range in place, as the last step of a chain of in-place injections.
+
+    :param data: Input data array, modified in place.
+    :param nbits: Number of bits per sample of the output filterbank.
+    :return: The data array.
+    """
+    low, high = nbits_range(nbits)
+    return np.clip(data, low, high, out=data)
+
+def quantise(data, nbits=8, out=None, block_nsamp=65536):
+    """
+    Round data to the nearest integer and convert it to the nbits filterbank dtype, clipping
+    to the nbits range. The conversion runs in blocks of time samples, so no full-size
+    floating point temporary is allocated.
+
+    :param data: Input (nchans, nsamp) data array.
+    :param nbits: Number of bits per sample of the output filterbank.
+    :param out: Optional array of the nbits dtype to write into.
+    :param block_nsamp: The number of time samples converted at once.
+    :return: The quantised data array.
+    """
+    low, high = nbits_range(nbits)
+    if out is None:
+        out = np.empty(data.shape, dtype=nbits_to_dtype(nbits))
+    nsamp = data.shape[-1]
+    for start in range(0, nsamp, block_nsamp):
+        block = np.rint(data[..., start:start + block_nsamp])
+        np.clip(block, low, high, out=block)
+        np.copyto(out[..., start:start + block_nsamp], block, casting='unsafe')
+    return out
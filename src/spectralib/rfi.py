@@ -1,17 +1,25 @@
 import numpy as np
+from spectralib.quantise import clip_to_nbits, inject_into, saturate
 import math
 import random
 
-def generate_rfi(data, **kwargs):
-    """
-    Generate synthetic RFI data and save it as a filterbank file.
+RFI_EVENT_DTYPE = np.dtype([
+    ("chan_start", np.int64),
+    ("chan_end", np.int64),
+    ("first", np.int64),
+    ("width", np.int64),
+    ("period", np.int64),
+    ("count", np.int64),
+    ("amplitude", np.float64),
+])
 
-    :param data: The input data to add RFI to.
-    :param kwargs: Additional keyword arguments.
+def rfi_kwargs(nchans, **kwargs):
     """
-    nchans, nsamp = data.shape
+    Fill in the defaults of the RFI keyword arguments accepted by generate_rfi.
 
-    # Set default values for the keyword arguments
+    :param nchans: Number of frequency channels.
+    :return: Dictionary of RFI keyword arguments.
+    """
     default_kwargs = {
         'freqchanswidth': nchans,
         'onlength': 10,
@@ -19,84 +27,180 @@ def generate_rfi(data, **kwargs):
         'doesrepeat': False,
         'numrepeats': 0,
         'dutycycle': 50,  # Added default value for duty cycle
-        'RFIamplitude': 200
+        'RFIamplitude': 200,
+        'nbits': 8
     }
 
     # Update default values with provided keyword arguments
     default_kwargs.update(kwargs)
+    return default_kwargs
+
+def compile_rfi_event(nchans, nsamp, rng=None, **kwargs):
+    """
+    Compile one RFI event, described by the keyword arguments of generate_rfi, into a record
+    of RFI_EVENT_DTYPE: a channel range and count intervals of width samples, one period apart,
+    starting at sample first.
 
-    # Unpack the updated keyword arguments
-    freqchanswidth = default_kwargs['freqchanswidth']
-    onlength = default_kwargs['onlength']
-    ispersistent = default_kwargs['ispersistent']
-    doesrepeat = default_kwargs['doesrepeat']
-    numrepeats = default_kwargs['numrepeats']
-    dutycycle = default_kwargs['dutycycle']  # Unpacked duty cycle
-    RFIamplitude = default_kwargs['RFIamplitude']
+    :param nchans: Number of frequency channels.
+    :param nsamp: Number of time samples.
+    :param rng: A np.random.Generator used to place the event. Default is None, which uses np.random.
+    :return: A record of RFI_EVENT_DTYPE.
+    """
+    kwargs = rfi_kwargs(nchans, **kwargs)
+    randint = np.random.randint if rng is None else rng.integers
+
+    freqchanswidth = kwargs['freqchanswidth']
+    onlength = kwargs['onlength']
+    ispersistent = kwargs['ispersistent']
+    doesrepeat = kwargs['doesrepeat']
+    numrepeats = kwargs['numrepeats']
+    dutycycle = kwargs['dutycycle']
 
     # Compute offlength based on the provided onlength and dutycycle
     offlength = round(onlength * (100 - dutycycle) / dutycycle)
+    period = onlength + offlength
 
     startfreqindex = 0
-    if nchans == freqchanswidth:
+    if nchans != freqchanswidth:
+        startfreqindex = int(randint(0, nchans))
+    endfreqindex = min(startfreqindex + freqchanswidth, nchans)
+
+    if not ispersistent:
+        starttimeindex = int(randint(0, nsamp)) - round(onlength/2)
+        endtimeindex = min(starttimeindex + onlength, nsamp)
+        starttimeindex = max(starttimeindex, 0)
+    else:
+        starttimeindex = 0
+        endtimeindex = onlength if doesrepeat else nsamp
+    width = max(endtimeindex - starttimeindex, 0)
+
+    if doesrepeat and period > 0:
+        if ispersistent:
+            # Every interval that ends before the last sample
+            first = 0
+            count = max(-(-(nsamp - onlength) // period), 0)
+        else:
+            # Every repeat that lies entirely within the data
+            low = max(-round(numrepeats/2), -(starttimeindex // period))
+            high = min(round(numrepeats/2) - 1, (nsamp - endtimeindex) // period)
+            first = starttimeindex + low * period
+            count = max(high - low + 1, 0)
+    else:
+        first = starttimeindex
+        period = max(width, 1)
+        count = 1 if width > 0 else 0
+
+    return np.array((startfreqindex, endfreqindex, first, width, period, count, kwargs['RFIamplitude']), dtype=RFI_EVENT_DTYPE)
+
+def compile_rfi_scene(events, nchans, nsamp, rng=None):
+    """
+    Compile a list of RFI events into a table of RFI_EVENT_DTYPE records.
+
+    :param events: List of dictionaries with the keyword arguments of generate_rfi.
+    :param nchans: Number of frequency channels.
+    :param nsamp: Number of time samples.
+    :param rng: A np.random.Generator used to place the events. Default is None, which uses np.random.
+    :return: Structured array of RFI_EVENT_DTYPE with one record per event.
+    """
+    table = np.zeros(len(events), dtype=RFI_EVENT_DTYPE)
+    for i, event in enumerate(events):
+        table[i] = compile_rfi_event(nchans, nsamp, rng=rng, **event)
+    return table
+
+def apply_rfi_scene(data, table):
+    """
+    Add a compiled table of RFI events to the data, in place and without clipping.
+
+    Every repeating event is added as a single strided view of its intervals, so the cost is
+    proportional to the number of samples covered by RFI rather than the number of repeats.
+    Integer data is rounded and saturated to the range of its dtype instead of wrapping around.
+
+    :param data: Input data array of shape (nchans, nsamp), modified in place.
+    :param table: Structured array of RFI_EVENT_DTYPE, e.g. from compile_rfi_scene.
+    :return: The data array.
+    """
+    nsamp = data.shape[1]
+    for chan_start, chan_end, first, width, period, count, amplitude in np.atleast_1d(table).tolist():
+        if count <= 0 or width <= 0 or chan_end <= chan_start:
+            continue
+        # The whole periods that fit in the data are a reshaped view, the last interval may not
+        nfull = min(count, (nsamp - first) // period)
+        if nfull > 0:
+            region = data[chan_start:chan_end, first:first + nfull * period]
+            intervals = region.reshape(chan_end - chan_start, nfull, period)[:, :, :width]
+            intervals[...] = saturate(intervals + amplitude, data.dtype)
+        for start in range(first + nfull * period, first + count * period, period):
+            interval = data[chan_start:chan_end, start:start + width]
+            interval[...] = saturate(interval + amplitude, data.dtype)
+    return data
+
+def generate_rfi_scene(data, events, rng=None, nbits=8, out=None):
+    """
+    Add a whole RFI environment to the data in one pass, clipping once at the end.
+
+    :param data: Input data array of shape (nchans, nsamp).
+    :param events: List of dictionaries with the keyword arguments of generate_rfi, or a table
+                   of RFI_EVENT_DTYPE returned by compile_rfi_scene.
+    :param rng: A np.random.Generator used to place the events. Default is None, which uses np.random.
+    :param nbits: Number of bits per sample of the output, which sets the clipping range.
+    :param out: Optional array to add the RFI into, without clipping. Can be data itself.
+    :return: The data array with RFI added.
+    """
+    data = inject_into(data, out)
+    nchans, nsamp = data.shape
+    if not isinstance(events, np.ndarray):
+        events = compile_rfi_scene(events, nchans, nsamp, rng=rng)
+    data = apply_rfi_scene(data, events)
+
+    if out is None:
+        data = clip_to_nbits(data, nbits)
+    return data
+
+def generate_rfi(data, out=None, **kwargs):
+    """
+    Generate synthetic RFI data and save it as a filterbank file.
+
+    :param data: The input data to add RFI to.
+    :param out: Optional array to add the RFI into, without clipping. Can be data itself.
+    :param kwargs: Additional keyword arguments.
+    """
+    data = inject_into(data, out)
+    nchans, nsamp = data.shape
+    kwargs = rfi_kwargs(nchans, **kwargs)
+
+    ispersistent = kwargs['ispersistent']
+    doesrepeat = kwargs['doesrepeat']
+
+    if nchans == kwargs['freqchanswidth']:
         print("Adding broadband ", end="")
     else:
         print("Adding narrowband ", end="")
-        startfreqindex = np.random.randint(0, nchans)
 
     if ispersistent and not doesrepeat:
         print("persistent RFI")
     elif not ispersistent and doesrepeat:
-        print("repeating RFI, nrepeat = " + str(numrepeats))
+        print("repeating RFI, nrepeat = " + str(kwargs['numrepeats']))
     elif not ispersistent and not doesrepeat:
         print("impulse RFI")
     elif ispersistent and doesrepeat:
         print("persistent periodic RFI")
 
-    endfreqindex = startfreqindex + freqchanswidth
-
-    if ispersistent == False:
-        starttimeindex = np.random.randint(0, nsamp)
-        starttimeindex = starttimeindex - round(onlength/2)
-        endtimeindex = starttimeindex + onlength
-        if starttimeindex < 0:
-            starttimeindex = 0
-        if endtimeindex > nsamp:
-            endtimeindex = nsamp
-    else:
-        starttimeindex = 0
-        if doesrepeat:
-            endtimeindex = starttimeindex + onlength
-        else:
-            endtimeindex = nsamp
-
-    if doesrepeat:
-        if ispersistent:
-            while endtimeindex < nsamp:
-                data[startfreqindex:endfreqindex, starttimeindex:endtimeindex] += RFIamplitude
-                starttimeindex += onlength + offlength
-                endtimeindex += onlength + offlength
-        else:
-            for i in range(-round(numrepeats/2),round(numrepeats/2),1):
-                offset = i * (onlength + offlength)
-                if starttimeindex + offset < 0:
-                    continue
-                if endtimeindex + offset > nsamp:
-                    continue
-                data[startfreqindex:endfreqindex, starttimeindex+offset:endtimeindex+offset] += RFIamplitude
-    else:
-        data[startfreqindex:endfreqindex, starttimeindex:endtimeindex] += RFIamplitude
+    event = compile_rfi_event(nchans, nsamp, **kwargs)
+    data = apply_rfi_scene(data, event)
 
-    data = np.clip(data, 0, 255)
+    if out is None:
+        data = clip_to_nbits(data, kwargs['nbits'])
     return data
 
-def add_wandering_baseline(data, **kwargs):
+def add_wandering_baseline(data, out=None, **kwargs):
     # A function to add a slowly varying random signal to all channels
+    # With out given, the signal is added into out and the clipping is left to quantise.finalise
 
     default_kwargs = {
         'wanderingbaselineamplitude': 1,
         'wanderingbaselineperiod': 100,
-        'custom_baseline': None
+        'custom_baseline': None,
+        'nbits': 8
     }
     default_kwargs.update(kwargs)
 
@@ -104,6 +208,7 @@ def add_wandering_baseline(data, **kwargs):
     wanderingbaselineperiod = default_kwargs['wanderingbaselineperiod']
     custom_baseline = default_kwargs['custom_baseline']
 
+    data = inject_into(data, out)
     nchans, nsamp = data.shape
 
     if custom_baseline is None:
@@ -113,23 +218,67 @@ def add_wandering_baseline(data, **kwargs):
         # Lowpass filter the signal
         # This is to simulate the effect of a slowly varying baseline
         # The filter is a simple moving average
-        filteredwanderingbaseline = np.zeros(nsamp)
-        for i in range(nsamp):
-            filteredwanderingbaseline[i] = np.mean(wanderingbaseline[i:i + wanderingbaselineperiod])
+        filteredwanderingbaseline = moving_average(wanderingbaseline, wanderingbaselineperiod)[:nsamp]
     else:
         # Use the custom provided baseline
         assert len(custom_baseline) == nsamp, "Custom baseline must have the same length as the data"
         filteredwanderingbaseline = custom_baseline
 
 
-    # Add the filtered signal to each channel
-    for i in range(nchans):
-        data[i, :] += filteredwanderingbaseline
+    filteredwanderingbaseline = np.asarray(filteredwanderingbaseline)
+    if np.issubdtype(data.dtype, np.floating):
+        # Add the filtered signal to every channel at once, in place
+        data += filteredwanderingbaseline[np.newaxis, :]
+    else:
+        # Saturate integer data one channel at a time, so the temporary is a single channel
+        for chan in range(nchans):
+            data[chan] = saturate(data[chan] + filteredwanderingbaseline, data.dtype)
 
-    data = np.clip(data, 0, 255)
+    if out is None:
+        data = clip_to_nbits(data, default_kwargs['nbits'])
 
     return data
 
+def moving_average(signal, window):
+    """
+    Moving average of every complete window of a signal, from a cumulative sum.
+
+    :param signal: 1D input signal.
+    :param window: Window length in samples.
+    :return: Array of length len(signal) - window + 1, where element i is the mean of signal[i:i + window].
+    """
+    cumulative = np.concatenate(([0], np.cumsum(signal, dtype=np.float64)))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+class WanderingBaselineGenerator:
+    """
+    Stateful wandering baseline for streaming generation, block by block.
+
+    The baseline is the same moving average of Gaussian noise as add_wandering_baseline, and
+    the last window of noise is carried from one block to the next, so consecutive blocks
+    join into one continuous baseline. Add a block of it to the data with
+    add_wandering_baseline(block, custom_baseline=generator.next_block(block.shape[1])).
+    """
+
+    def __init__(self, wanderingbaselineamplitude=1, wanderingbaselineperiod=100, rng=None):
+        """
+        :param wanderingbaselineamplitude: Standard deviation of the noise before filtering.
+        :param wanderingbaselineperiod: Length of the moving average in samples.
+        :param rng: A np.random.Generator, or a seed for one.
+        """
+        self.amplitude = wanderingbaselineamplitude
+        self.period = wanderingbaselineperiod
+        self.rng = np.random.default_rng(rng)
+        self._noise = self.rng.normal(0, self.amplitude, self.period - 1)
+
+    def next_block(self, nsamp):
+        """
+        Return the next nsamp samples of the baseline.
+        """
+        noise = np.concatenate((self._noise, self.rng.normal(0, self.amplitude, nsamp)))
+        self._noise = noise[nsamp:]
+        return moving_average(noise, self.period)
+
 
 def sampleloguniform(lower,upper):
     lowerlog = math.log(lower)
@@ -1,9 +1,552 @@
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+SINGLE_PULSE_CANDIDATE_DTYPE = np.dtype([
+    ("DM", np.float32),
+    ("DM_index", np.int32),
+    ("sample", np.int64),
+    ("time", np.float64),
+    ("width", np.int32),
+    ("snr", np.float32),
+    ("members", np.int32),
+])
+
+PERIODICITY_CANDIDATE_DTYPE = np.dtype([
+    ("DM", np.float32),
+    ("DM_index", np.int32),
+    ("frequency", np.float64),
+    ("period", np.float64),
+    ("bin", np.float64),
+    ("nharmonics", np.int32),
+    ("power", np.float32),
+    ("sigma", np.float32),
+])
+
+ACCELERATION_CANDIDATE_DTYPE = np.dtype(PERIODICITY_CANDIDATE_DTYPE.descr + [
+    ("acceleration", np.float64),
+    ("acceleration_index", np.int32),
+])
+
+FFA_PERIODOGRAM_DTYPE = np.dtype([
+    ("period", np.float64),
+    ("snr", np.float32),
+    ("width", np.int32),
+    ("phase", np.int32),
+    ("downsample", np.int32),
+])
+
+SPEED_OF_LIGHT = 299792458
 
 def boxcar_filter(time_series, boxcar_width):
     boxcar = np.ones(boxcar_width) / boxcar_width
     filtered_series = np.convolve(time_series, boxcar, mode='valid')
     return filtered_series
 
+def running_baseline_and_rms(time_series, window):
+    """
+    Robust running baseline and rms of one or more time series.
+
+    The median and the rms estimated from the median absolute deviation are computed in blocks
+    of window samples along the last axis and linearly interpolated between the block centres.
+
+    :param time_series: Array of shape (..., nsamp).
+    :param window: Block length in samples.
+    :return: A tuple of the baseline and rms arrays, both with the same shape as time_series.
+    """
+    time_series = np.asarray(time_series, dtype=np.float32)
+    nsamp = time_series.shape[-1]
+    window = max(1, min(window, nsamp))
+    nblocks = nsamp // window
+
+    blocks = time_series[..., :nblocks * window].reshape(time_series.shape[:-1] + (nblocks, window))
+    block_median = np.median(blocks, axis=-1)
+    block_rms = 1.4826 * np.median(np.abs(blocks - block_median[..., np.newaxis]), axis=-1)
+    # Avoid dividing by zero for constant stretches of data
+    block_rms[block_rms == 0] = 1
+
+    # Linear interpolation between block centres, constant beyond the first and last centres
+    position = np.clip((np.arange(nsamp) - (window - 1) / 2) / window, 0, nblocks - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, nblocks - 1)
+    weight = (position - lower).astype(np.float32)
+    baseline = block_median[..., lower] * (1 - weight) + block_median[..., upper] * weight
+    rms = block_rms[..., lower] * (1 - weight) + block_rms[..., upper] * weight
+    return baseline, rms
+
+def cluster_candidates(samples, DM_indices, time_tolerance, DM_tolerance=1):
+    """
+    Friends-of-friends clustering of candidates in time and DM.
+
+    Two candidates are friends if they are within time_tolerance samples and DM_tolerance DM
+    trials of each other, and clusters are the connected groups of friends.
+
+    :return: An integer cluster label for each candidate.
+    """
+    samples = np.asarray(samples)
+    DM_indices = np.asarray(DM_indices)
+    ncands = len(samples)
+    order = np.argsort(samples, kind="stable")
+    sorted_samples = samples[order]
+    sorted_DM_indices = DM_indices[order]
+
+    # Sweep over the candidates sorted in time: the neighbours of each candidate in time are the
+    # window of candidates up to time_tolerance samples later, found with one binary search
+    window_end = np.searchsorted(sorted_samples, sorted_samples + time_tolerance, side="right")
+    counts = window_end - np.arange(ncands) - 1
+    first = np.repeat(np.arange(ncands), counts)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+    friends = np.abs(sorted_DM_indices[second] - sorted_DM_indices[first]) <= DM_tolerance
+    first = first[friends]
+    second = second[friends]
+
+    labels = np.arange(ncands)
+    if len(first):
+        # Propagate the smallest label through each connected group
+        while True:
+            smallest = np.minimum(labels[first], labels[second])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, first, smallest)
+            np.minimum.at(new_labels, second, smallest)
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+
+    cluster_labels = np.empty(ncands, dtype=np.int64)
+    cluster_labels[order] = labels
+    return cluster_labels
+
+def single_pulse_search(dm_time, DMs, tsamp, widths=None, threshold=6.0, baseline_window=None, time_tolerance=None, DM_tolerance=1):
+    """
+    Search a DM-time plane for single pulses with a bank of boxcar filters.
+
+    Each DM trial is normalised by a robust running baseline and rms, then every boxcar width
+    is computed from a single prefix sum. Samples above threshold at their best width are
+    clustered across DM and time, and each cluster is reported once at its brightest member
+    and the width of that member.
+
+    :param dm_time: Dedispersed time series, of shape (nDM, nsamp) or (nsamp,).
+    :param DMs: The DM of each row of dm_time.
+    :param tsamp: Sampling time in seconds.
+    :param widths: Boxcar widths in samples. Defaults to powers of two up to 256. Widths longer
+                   than the time series are skipped, and if none is left no candidate is returned.
+    :param threshold: Detection threshold in S/N.
+    :param baseline_window: Block length of the running baseline in samples. Defaults to
+                            8 times the largest width.
+    :param time_tolerance: Maximum separation in samples of clustered candidates. Defaults to
+                           the largest width.
+    :param DM_tolerance: Maximum separation in DM trials of clustered candidates.
+    :return: A structured array with SINGLE_PULSE_CANDIDATE_DTYPE, sorted by decreasing S/N.
+    """
+    dm_time = np.atleast_2d(np.asarray(dm_time, dtype=np.float32))
+    DMs = np.atleast_1d(np.asarray(DMs, dtype=np.float64))
+    nDM, nsamp = dm_time.shape
+
+    if widths is None:
+        widths = [2 ** i for i in range(9)]
+    widths = [int(width) for width in widths if width <= nsamp]
+    if not widths:
+        return np.zeros(0, dtype=SINGLE_PULSE_CANDIDATE_DTYPE)
+    if baseline_window is None:
+        baseline_window = 8 * max(widths)
+    if time_tolerance is None:
+        time_tolerance = max(widths)
+
+    baseline, rms = running_baseline_and_rms(dm_time, baseline_window)
+    normalised = (dm_time - baseline) / rms
+
+    # Every boxcar is a difference of the same prefix sum
+    prefix_sum = np.zeros((nDM, nsamp + 1))
+    np.cumsum(normalised, axis=1, out=prefix_sum[:, 1:])
+
+    best_snr = np.full((nDM, nsamp), -np.inf, dtype=np.float32)
+    best_width = np.zeros((nDM, nsamp), dtype=np.int32)
+    for width in widths:
+        snr = (prefix_sum[:, width:] - prefix_sum[:, :-width]) / np.sqrt(width)
+        better = snr > best_snr[:, :nsamp - width + 1]
+        best_snr[:, :nsamp - width + 1][better] = snr[better]
+        best_width[:, :nsamp - width + 1][better] = width
+
+    DM_indices, samples = np.nonzero(best_snr >= threshold)
+    if len(samples) == 0:
+        return np.zeros(0, dtype=SINGLE_PULSE_CANDIDATE_DTYPE)
+
+    snrs = best_snr[DM_indices, samples]
+    labels = cluster_candidates(samples, DM_indices, time_tolerance, DM_tolerance)
+
+    # Report the brightest member of each cluster
+    order = np.lexsort((-snrs, labels))
+    cluster_ids, first, members = np.unique(labels[order], return_index=True, return_counts=True)
+    peaks = order[first]
+
+    candidates = np.zeros(len(peaks), dtype=SINGLE_PULSE_CANDIDATE_DTYPE)
+    candidates["DM"] = DMs[DM_indices[peaks]]
+    candidates["DM_index"] = DM_indices[peaks]
+    candidates["sample"] = samples[peaks]
+    candidates["time"] = samples[peaks] * tsamp
+    candidates["width"] = best_width[DM_indices[peaks], samples[peaks]]
+    candidates["snr"] = snrs[peaks]
+    candidates["members"] = members
+    return candidates[np.argsort(-candidates["snr"], kind="stable")]
+
+def whiten_power_spectrum(power, min_block=6, max_block=1000, growth=1.1):
+    """
+    Remove red noise from power spectra by normalising with a running median.
+
+    The median is taken in blocks that start min_block bins wide at low frequency, where red
+    noise changes fastest, and grow geometrically up to max_block bins. It is linearly
+    interpolated between block centres and scaled so that the whitened noise power has unit mean.
+
+    :param power: Power spectra of shape (..., nbins), with the DC term in bin 0.
+    :return: The whitened power spectra, with bin 0 set to zero.
+    """
+    power = np.asarray(power, dtype=np.float32)
+    nbins = power.shape[-1]
+
+    edges = [1]
+    width = min_block
+    while edges[-1] < nbins:
+        edges.append(min(nbins, edges[-1] + int(width)))
+        width = min(max_block, width * growth)
+    edges = np.array(edges)
+
+    medians = np.stack([np.median(power[..., start:end], axis=-1) for start, end in zip(edges[:-1], edges[1:])], axis=-1)
+    # The median of exponentially distributed noise power is ln(2) times its mean
+    medians = np.maximum(medians, np.finfo(np.float32).tiny) / np.log(2)
+    centres = (edges[:-1] + edges[1:] - 1) / 2
+
+    # Linear interpolation between the block centres, shared by all spectra
+    bins = np.arange(nbins)
+    upper = np.clip(np.searchsorted(centres, bins), 1, max(1, len(centres) - 1))
+    lower = upper - 1
+    if len(centres) > 1:
+        weight = np.clip((bins - centres[lower]) / (centres[upper] - centres[lower]), 0, 1).astype(np.float32)
+    else:
+        upper = lower = np.zeros(nbins, dtype=np.int64)
+        weight = np.zeros(nbins, dtype=np.float32)
+    running_median = medians[..., lower] * (1 - weight) + medians[..., upper] * weight
+
+    whitened = power / running_median
+    whitened[..., 0] = 0
+    return whitened
+
+def harmonic_sum(power, nharmonics=16):
+    """
+    Incoherently sum harmonics of whitened power spectra.
+
+    For each stage n = 1, 2, 4, ... up to nharmonics, element j of the summed spectrum is the sum
+    of the powers at harmonics h = 1..n of the fundamental frequency j / n bins, so the
+    fundamental is searched with a resolution of 1 / n bins.
+
+    :param power: Whitened power spectra of shape (..., nbins).
+    :param nharmonics: Maximum number of harmonics summed, rounded down to a power of two.
+    :return: A list of (n, summed) tuples, summed having the same shape as power.
+    """
+    nbins = power.shape[-1]
+    index = np.arange(nbins)
+    stages = []
+    n = 1
+    while n <= nharmonics:
+        summed = np.zeros_like(power)
+        for harmonic in range(1, n + 1):
+            summed += power[..., (index * harmonic + n // 2) // n]
+        stages.append((n, summed))
+        n *= 2
+    return stages
+
+def power_to_sigma(power, nharmonics):
+    """
+    Gaussian significance of a sum of nharmonics whitened powers, using the Wilson-Hilferty
+    approximation to the gamma distribution followed by noise.
+    """
+    power = np.asarray(power, dtype=np.float64)
+    return ((power / nharmonics) ** (1 / 3) - (1 - 1 / (9 * nharmonics))) / np.sqrt(1 / (9 * nharmonics))
+
+def search_power_spectra(power, nharmonics=16, threshold=6.0, min_bin=1):
+    """
+    Find the local maxima above threshold sigma in the harmonic sums of whitened power spectra.
+
+    :return: A tuple of arrays (row, fundamental bin, nharmonics, power, sigma), where row indexes
+             the leading axis of power and the fundamental bin can be fractional.
+    """
+    power = np.atleast_2d(power)
+    rows, fundamentals, harmonics, powers, sigmas = [], [], [], [], []
+    for n, summed in harmonic_sum(power, nharmonics):
+        sigma = power_to_sigma(summed, n).astype(np.float32)
+        # Fundamental frequencies below min_bin are dominated by residual red noise
+        sigma[:, :min_bin * n] = -np.inf
+        peaks = sigma >= threshold
+        peaks[:, 1:] &= sigma[:, 1:] >= sigma[:, :-1]
+        peaks[:, :-1] &= sigma[:, :-1] >= sigma[:, 1:]
+        row, j = np.nonzero(peaks)
+        rows.append(row)
+        fundamentals.append(j / n)
+        harmonics.append(np.full(len(j), n))
+        powers.append(summed[row, j])
+        sigmas.append(sigma[row, j])
+    return tuple(np.concatenate(values) for values in (rows, fundamentals, harmonics, powers, sigmas))
+
+def periodicity_search(time_series, tsamp, DMs=None, nharmonics=16, threshold=6.0, min_frequency=None, max_candidates=100, batch_size=32):
+    """
+    FFT periodicity search of dedispersed time series.
+
+    The time series are Fourier transformed in batches of DM trials with a single real FFT
+    call per batch. The power spectra are whitened with a running median, harmonics are
+    summed up to nharmonics, and the candidates above threshold are returned ranked by
+    significance. Only the most significant detection of each fundamental frequency bin is
+    kept across DM trials and harmonic sums.
+
+    :param time_series: Dedispersed time series of shape (nDM, nsamp) or (nsamp,).
+    :param tsamp: Sampling time in seconds.
+    :param DMs: The DM of each time series. Defaults to zeros.
+    :param nharmonics: Maximum number of harmonics summed (a power of two, e.g. 16 or 32).
+    :param threshold: Detection threshold in Gaussian sigma.
+    :param min_frequency: Lowest fundamental frequency searched in Hz. Defaults to 2 bins.
+    :param max_candidates: Maximum number of candidates returned.
+    :param batch_size: Number of DM trials transformed at once.
+    :return: A structured array with PERIODICITY_CANDIDATE_DTYPE, sorted by decreasing sigma.
+    """
+    time_series = np.atleast_2d(np.asarray(time_series, dtype=np.float32))
+    nDM, nsamp = time_series.shape
+    DMs = np.zeros(nDM) if DMs is None else np.atleast_1d(np.asarray(DMs, dtype=np.float64))
+    tobs = nsamp * tsamp
+    min_bin = 2 if min_frequency is None else max(1, int(np.ceil(min_frequency * tobs)))
+
+    results = []
+    for start in range(0, nDM, batch_size):
+        batch = time_series[start:start + batch_size]
+        spectra = np.fft.rfft(batch - batch.mean(axis=1, keepdims=True), axis=1)
+        power = whiten_power_spectrum(spectra.real ** 2 + spectra.imag ** 2)
+        rows, fundamentals, harmonics, powers, sigmas = search_power_spectra(power, nharmonics, threshold, min_bin)
+        results.append((rows + start, fundamentals, harmonics, powers, sigmas))
+
+    rows, fundamentals, harmonics, powers, sigmas = (np.concatenate(values) for values in zip(*results))
+    candidates = np.zeros(len(rows), dtype=PERIODICITY_CANDIDATE_DTYPE)
+    candidates["DM"] = DMs[rows]
+    candidates["DM_index"] = rows
+    candidates["bin"] = fundamentals
+    candidates["frequency"] = fundamentals / tobs
+    candidates["period"] = tobs / fundamentals
+    candidates["nharmonics"] = harmonics
+    candidates["power"] = powers
+    candidates["sigma"] = sigmas
+    return rank_periodicity_candidates(candidates, max_candidates)
+
+def rank_periodicity_candidates(candidates, max_candidates=100):
+    """
+    Keep the most significant candidate of each fundamental frequency bin and sort by decreasing sigma.
+    """
+    candidates = candidates[np.argsort(-candidates["sigma"], kind="stable")]
+    _, first = np.unique(np.rint(candidates["bin"]).astype(np.int64), return_index=True)
+    candidates = candidates[np.sort(first)]
+    return candidates[:max_candidates]
+
+def acceleration_resampling_indices(nsamp, tsamp, accelerations):
+    """
+    Index maps that resample a time series to remove a constant line-of-sight acceleration.
+
+    Sample i of the resampled series is sample indices[k, i] of the original one, where the
+    shift a * (t - T/2)**2 / (2c) is zero in the middle of the observation.
+
+    :param nsamp: Number of samples of the time series.
+    :param tsamp: Sampling time in seconds.
+    :param accelerations: 1D array of accelerations in m/s^2.
+    :return: Integer array of shape (nacc, nsamp).
+    """
+    accelerations = np.atleast_1d(np.asarray(accelerations, dtype=np.float64))
+    centred_time = np.arange(nsamp) * tsamp - nsamp * tsamp / 2
+    shift = accelerations[:, np.newaxis] * centred_time[np.newaxis, :] ** 2 / (2 * SPEED_OF_LIGHT * tsamp)
+    indices = np.arange(nsamp)[np.newaxis, :] + np.rint(shift).astype(np.int64)
+    return np.clip(indices, 0, nsamp - 1)
+
+def _acceleration_search_worker(time_series, tsamp, accelerations, nharmonics, threshold, min_bin):
+    # Resample at every trial acceleration with one gather, then FFT all of them in one call
+    indices = acceleration_resampling_indices(len(time_series), tsamp, accelerations)
+    resampled = time_series[indices]
+    spectra = np.fft.rfft(resampled - resampled.mean(axis=1, keepdims=True), axis=1)
+    power = whiten_power_spectrum(spectra.real ** 2 + spectra.imag ** 2)
+    return search_power_spectra(power, nharmonics, threshold, min_bin)
+
+def acceleration_search(time_series, tsamp, accelerations, DMs=None, nharmonics=8, threshold=6.0, min_frequency=None, max_candidates=100, batch_size=16, nworkers=None):
+    """
+    Time-domain resampling acceleration search of dedispersed time series.
+
+    Each time series is resampled at every trial acceleration to undo the Doppler drift of a
+    binary pulsar, then FFT searched as in periodicity_search. Batches of trial accelerations
+    are spread over a process pool.
+
+    :param time_series: Dedispersed time series of shape (nDM, nsamp) or (nsamp,).
+    :param tsamp: Sampling time in seconds.
+    :param accelerations: 1D array of trial accelerations in m/s^2.
+    :param DMs: The DM of each time series. Defaults to zeros.
+    :param nharmonics: Maximum number of harmonics summed.
+    :param threshold: Detection threshold in Gaussian sigma.
+    :param min_frequency: Lowest fundamental frequency searched in Hz. Defaults to 2 bins.
+    :param max_candidates: Maximum number of candidates returned.
+    :param batch_size: Number of trial accelerations resampled and transformed at once.
+    :param nworkers: Number of worker processes. Defaults to the number of CPUs, 1 runs serially.
+    :return: A structured array with ACCELERATION_CANDIDATE_DTYPE, sorted by decreasing sigma.
+    """
+    time_series = np.atleast_2d(np.asarray(time_series, dtype=np.float32))
+    nDM, nsamp = time_series.shape
+    DMs = np.zeros(nDM) if DMs is None else np.atleast_1d(np.asarray(DMs, dtype=np.float64))
+    accelerations = np.atleast_1d(np.asarray(accelerations, dtype=np.float64))
+    tobs = nsamp * tsamp
+    min_bin = 2 if min_frequency is None else max(1, int(np.ceil(min_frequency * tobs)))
+
+    jobs = [(DM_index, start) for DM_index in range(nDM) for start in range(0, len(accelerations), batch_size)]
+    job_args = [(time_series[DM_index], tsamp, accelerations[start:start + batch_size], nharmonics, threshold, min_bin) for DM_index, start in jobs]
+
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+    if nworkers == 1 or len(jobs) == 1:
+        results = [_acceleration_search_worker(*args) for args in job_args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(nworkers, len(jobs))) as executor:
+            results = list(executor.map(_acceleration_search_worker, *zip(*job_args)))
+
+    candidates = []
+    for (DM_index, start), (rows, fundamentals, harmonics, powers, sigmas) in zip(jobs, results):
+        batch = np.zeros(len(rows), dtype=ACCELERATION_CANDIDATE_DTYPE)
+        batch["DM"] = DMs[DM_index]
+        batch["DM_index"] = DM_index
+        batch["bin"] = fundamentals
+        batch["frequency"] = fundamentals / tobs
+        batch["period"] = tobs / fundamentals
+        batch["nharmonics"] = harmonics
+        batch["power"] = powers
+        batch["sigma"] = sigmas
+        batch["acceleration"] = accelerations[start + rows]
+        batch["acceleration_index"] = start + rows
+        candidates.append(batch)
+    return rank_periodicity_candidates(np.concatenate(candidates), max_candidates)
+
+def ffa_transform(folded):
+    """
+    Fast Folding Algorithm transform (Staelin 1969).
+
+    Row s of the output is the sum of the m rows of folded, each shifted so that a pulse drifting
+    by s phase bins over the m - 1 rows lines up, i.e. the profile folded at a period of
+    p + s / (m - 1) bins. The partial sums of the two halves are reused for every drift, so the
+    transform costs O(m p log m) instead of O(m^2 p).
+
+    :param folded: Time series folded at p bins, of shape (m, p).
+    :return: float32 array of shape (m, p).
+    """
+    folded = np.asarray(folded, dtype=np.float32)
+    m, p = folded.shape
+    if m == 1:
+        return folded.copy()
+
+    nhead = m // 2
+    ntail = m - nhead
+    head = ffa_transform(folded[:nhead])
+    tail = ffa_transform(folded[nhead:])
+
+    drift = np.arange(m)
+    head_row = np.rint(drift * (nhead - 1) / (m - 1)).astype(np.int64)
+    tail_row = np.rint(drift * (ntail - 1) / (m - 1)).astype(np.int64)
+    # Phase of the pulse at the first row of the tail
+    tail_shift = np.rint(drift * nhead / (m - 1)).astype(np.int64)
+    tail_phase = (np.arange(p)[np.newaxis, :] + tail_shift[:, np.newaxis]) % p
+    return head[head_row] + tail[tail_row[:, np.newaxis], tail_phase]
+
+def boxcar_profile_snr(profiles, nrows, widths):
+    """
+    Score folded profiles with a bank of circular boxcar matched filters.
+
+    :param profiles: Array of shape (nprofiles, p), each the sum of nrows rows of unit variance noise.
+    :param nrows: Number of rows summed in each profile.
+    :param widths: Boxcar widths in bins.
+    :return: A tuple of the best S/N, width and phase of each profile.
+    """
+    nprofiles, p = profiles.shape
+    widths = [width for width in widths if width < p]
+    profiles = profiles - profiles.mean(axis=1, keepdims=True)
+
+    # Circular prefix sum, long enough for the widest boxcar starting at any phase
+    wrapped = np.concatenate([profiles, profiles[:, :max(widths)]], axis=1)
+    prefix_sum = np.zeros((nprofiles, wrapped.shape[1] + 1))
+    np.cumsum(wrapped, axis=1, out=prefix_sum[:, 1:])
+
+    best_snr = np.full(nprofiles, -np.inf)
+    best_width = np.zeros(nprofiles, dtype=np.int32)
+    best_phase = np.zeros(nprofiles, dtype=np.int32)
+    for width in widths:
+        boxcar = prefix_sum[:, width:width + p] - prefix_sum[:, :p]
+        # Variance of a boxcar sum of a mean-subtracted profile
+        snr = boxcar / np.sqrt(nrows * width * (1 - width / p))
+        phase = np.argmax(snr, axis=1)
+        snr = snr[np.arange(nprofiles), phase]
+        better = snr > best_snr
+        best_snr[better] = snr[better]
+        best_width[better] = width
+        best_phase[better] = phase[better]
+    return best_snr, best_width, best_phase
+
+def ffa_search(time_series, tsamp, period_min, period_max, bins_min=64, widths=(1, 2, 3, 4, 6, 9, 13, 20, 30), baseline_window=None):
+    """
+    Fast Folding Algorithm search of a dedispersed time series for long-period pulsars.
+
+    The time series is normalised with a running median and rms, then folded with the FFA at
+    every trial period between period_min and period_max. The time series is progressively
+    downsampled by factors of two so that every trial is folded with between bins_min and
+    2 * bins_min phase bins. Each folded profile is scored with a bank of boxcar matched filters.
+
+    :param time_series: 1D dedispersed time series, e.g. from dedisperse_filterbank_data_to_timeseries.
+    :param tsamp: Sampling time in seconds.
+    :param period_min: Shortest trial period in seconds.
+    :param period_max: Longest trial period in seconds.
+    :param bins_min: Minimum number of phase bins per profile. period_min must be at least
+                     bins_min * tsamp, otherwise a ValueError is raised; lower bins_min to search
+                     shorter periods.
+    :param widths: Boxcar widths in phase bins.
+    :param baseline_window: Block length of the running baseline in samples. Defaults to
+                            4 times the longest period.
+    :return: A structured array with FFA_PERIODOGRAM_DTYPE, one entry per trial period, sorted by period.
+    """
+    if period_min < bins_min * tsamp:
+        raise ValueError(f"period_min of {period_min} s is shorter than bins_min * tsamp = {bins_min * tsamp} s, lower bins_min to search it")
+    time_series = np.asarray(time_series, dtype=np.float32)
+    nsamp = len(time_series)
+    if baseline_window is None:
+        baseline_window = int(4 * period_max / tsamp)
+    baseline, rms = running_baseline_and_rms(time_series, baseline_window)
+    normalised = (time_series - baseline) / rms
+
+    periodograms = []
+    downsample = max(1, int(period_min / tsamp / bins_min))
+    while downsample * bins_min * tsamp <= period_max:
+        # Summing downsample samples and dividing by sqrt(downsample) keeps unit variance noise
+        ndown = nsamp // downsample
+        downsampled = normalised[:ndown * downsample].reshape(ndown, downsample).sum(axis=1) / np.sqrt(downsample)
+        sample_time = downsample * tsamp
+
+        first_bins = max(bins_min, int(np.floor(period_min / sample_time)))
+        last_bins = min(2 * bins_min - 1, int(np.floor(period_max / sample_time)))
+        for nbins in range(first_bins, last_bins + 1):
+            nrows = ndown // nbins
+            if nrows < 2:
+                continue
+            transform = ffa_transform(downsampled[:nrows * nbins].reshape(nrows, nbins))
+            periods = (nbins + np.arange(nrows) / (nrows - 1)) * sample_time
+            keep = (periods >= period_min) & (periods <= period_max)
+            if not np.any(keep):
+                continue
+            snr, width, phase = boxcar_profile_snr(transform[keep], nrows, widths)
+
+            periodogram = np.zeros(np.count_nonzero(keep), dtype=FFA_PERIODOGRAM_DTYPE)
+            periodogram["period"] = periods[keep]
+            periodogram["snr"] = snr
+            periodogram["width"] = width
+            periodogram["phase"] = phase
+            periodogram["downsample"] = downsample
+            periodograms.append(periodogram)
+        downsample *= 2
 
+    if not periodograms:
+        return np.zeros(0, dtype=FFA_PERIODOGRAM_DTYPE)
+    periodogram = np.concatenate(periodograms)
+    return periodogram[np.argsort(periodogram["period"], kind="stable")]
@@ -7,6 +7,7 @@ from spectralib.filterbank import create_filterbank
 from spectralib.pulsar import generate_binary_pulsar
 from spectralib.frb import generate_pulse
 from spectralib.rfi import generate_rfi
+from spectralib.background import generate_noise_background
 
 def benchmark_filterbank():
     def run_create_filterbank():
@@ -32,7 +33,7 @@ def benchmark_filterbank():
         noisesigma = 18 #standard deviation of noise, value copied from some ASKAP data
         nchans = metadata["nchans"]
         nsamp = metadata["nsamples"]
-        data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+        data = generate_noise_background(nchans, nsamp, noisesigma)
         output_file = "benchmark_filterbank.fil"
         create_filterbank(data,output_file, metadata)
         if os.path.exists(output_file):
@@ -64,11 +65,12 @@ def benchmark_pulsar():
         noisesigma = 18 #standard deviation of noise, value copied from some ASKAP data
         nchans = metadata["nchans"]
         nsamp = metadata["nsamples"]
-        data = np.random.normal(0,noisesigma,size=(nchans, nsamp))+127
+        data = generate_noise_background(nchans, nsamp, noisesigma)
         DM = 10000  # Dispersion measure of the FRB
 
         # Binary pulsar parameters
         binary_params = {
+            "rest_period": 1.0,  # seconds
             "inclination": np.radians(45),
             "orbital_period": 200,
             "start_phase": 0,
@@ -78,9 +80,6 @@ def benchmark_pulsar():
             "omega": np.radians(90),
         }
 
-        # Rest pulse period of the pulsar
-        p_rest = 1.0  # seconds
-
         # FRB parameters
         pulse_params = {
             'pulse_duration': 100,
@@ -90,7 +89,7 @@ def benchmark_pulsar():
         }
 
         # Inject the binary pulsar signature
-        data = generate_binary_pulsar(data, DM, metadata['tsamp'], metadata['foff'], metadata['fch1'], p_rest, binary_params, **pulse_params)
+        data = generate_binary_pulsar(data, DM, metadata['tsamp'], metadata['foff'], metadata['fch1'], binary_params, **pulse_params)
 
         # Create the filterbank file
         output_filename = "RFIoutput_with_binary_pulsar.fil"
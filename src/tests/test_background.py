@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from spectralib.background import generate_noise_background, noise_background_blocks
+
+class TestBackground(unittest.TestCase):
+
+    def test_generate_noise_background(self):
+        data = generate_noise_background(64, 20000, noisesigma=18, mean=127, rng=1)
+        self.assertEqual(data.shape, (64, 20000))
+        self.assertEqual(data.dtype, np.float32)
+        self.assertAlmostEqual(float(np.mean(data)), 127, delta=0.1)
+        self.assertAlmostEqual(float(np.std(data)), 18, delta=0.1)
+        # The same seed gives the same background
+        np.testing.assert_array_equal(data, generate_noise_background(64, 20000, rng=1))
+
+    def test_generate_noise_background_into_buffer(self):
+        out = np.zeros((8, 100), dtype=np.float64)
+        data = generate_noise_background(8, 100, dtype=np.float32, rng=2, out=out)
+        self.assertIs(data, out)
+        self.assertEqual(data.dtype, np.float64)
+        self.assertGreater(np.std(out), 0)
+        with self.assertRaises(ValueError):
+            generate_noise_background(8, 101, out=out)
+
+    def test_generate_noise_background_is_independent_of_threads(self):
+        single = generate_noise_background(16, 10000, rng=3, block_nsamp=1000, nthreads=1)
+        threaded = generate_noise_background(16, 10000, rng=3, block_nsamp=1000, nthreads=4)
+        np.testing.assert_array_equal(single, threaded)
+        # Every block draws from its own stream
+        self.assertFalse(np.array_equal(single[:, :1000], single[:, 1000:2000]))
+
+    def test_noise_background_blocks_match_full_background(self):
+        full = generate_noise_background(8, 2500, rng=4, block_nsamp=1000)
+        blocks = list(noise_background_blocks(8, 2500, rng=4, block_nsamp=1000))
+        self.assertEqual([start for start, block in blocks], [0, 1000, 2000])
+        np.testing.assert_array_equal(np.concatenate([block for start, block in blocks], axis=1), full)
+
+    def test_generate_noise_background_uint8(self):
+        data = generate_noise_background(8, 3000, noisesigma=100, rng=5, dtype=np.uint8, block_nsamp=1000)
+        self.assertEqual(data.dtype, np.uint8)
+        reference = generate_noise_background(8, 3000, noisesigma=100, rng=5, block_nsamp=1000)
+        np.testing.assert_array_equal(data, np.clip(np.rint(reference), 0, 255))
+        self.assertTrue(np.any(data == 0) and np.any(data == 255))
+
+if __name__ == '__main__':
+    unittest.main()
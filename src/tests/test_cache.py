@@ -0,0 +1,83 @@
+import os
+import io
+import time
+import tempfile
+import contextlib
+import unittest
+import numpy as np
+from spectralib.cache import SceneCache, scene_cache_key
+from spectralib.frb import generate_pulse
+from spectralib.filterbank import read_filterbank
+
+class TestSceneCache(unittest.TestCase):
+
+    def setUp(self):
+        self.metadata = {
+            "source_name": "spectralib_cache",
+            "machine_id": 0,
+            "telescope_id": 0,
+            "data_type": 0,
+            "fch1": 1400.0,
+            "foff": -2.0,
+            "nchans": 16,
+            "nbits": 8,
+            "tstart": 55555.0,
+            "tsamp": 0.001,
+            "nifs": 1,
+            "nbeams": 1,
+            "ibeam": 1
+        }
+        self.params = {"nsamp": 1000, "rfi": [{"freqchanswidth": 2, "ispersistent": True, "RFIamplitude": 40}]}
+
+    def test_scene_cache_key(self):
+        key = scene_cache_key(self.params, self.metadata, 1)
+        self.assertEqual(key, scene_cache_key(dict(self.params), dict(self.metadata), 1))
+        self.assertNotEqual(key, scene_cache_key(self.params, self.metadata, 2))
+        self.assertNotEqual(key, scene_cache_key(dict(self.params, noisesigma=10), self.metadata, 1))
+
+    def test_cached_scene_is_reused_and_copy_on_write(self):
+        with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+            cache = SceneCache(cache_dir)
+            data, header = cache.load(self.params, self.metadata, seed=3)
+            self.assertEqual(data.shape, (16, 1000))
+            path = cache.path(scene_cache_key(self.params, self.metadata, 3))
+            original = read_filterbank(path)[0]
+            np.testing.assert_array_equal(data, original)
+
+            # Injecting into the private view leaves the cached file unchanged
+            generate_pulse(data, 50, 0.001, -2.0, 1400.0, out=data, pulse_start_index=100, pulse_duration=10, pulse_amplitude=300)
+            self.assertEqual(data[0, 100], 255)
+            np.testing.assert_array_equal(read_filterbank(path)[0], original)
+
+            modified = os.path.getmtime(path)
+            again, _ = cache.load(self.params, self.metadata, seed=3)
+            np.testing.assert_array_equal(again, original)
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(path)])
+            self.assertGreaterEqual(os.path.getmtime(path), modified)
+
+    def test_requires_an_integer_seed(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SceneCache(cache_dir)
+            for seed in [None, 1.5, "3"]:
+                with self.assertRaises(ValueError):
+                    cache.load(self.params, self.metadata, seed)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+            cache = SceneCache(cache_dir)
+            for seed in range(3):
+                cache.get(self.params, self.metadata, seed=seed)
+            scene_bytes = cache.size() // 3
+            paths = [cache.path(scene_cache_key(self.params, self.metadata, seed)) for seed in range(3)]
+            for age, path in enumerate(paths):
+                os.utime(path, (time.time() - 100 + age, time.time() - 100 + age))
+            # Using scene 0 makes scene 1 the least recently used
+            cache.get(self.params, self.metadata, seed=0)
+
+            cache.max_bytes = 2 * scene_bytes
+            cache.evict()
+            self.assertEqual(sorted(os.listdir(cache_dir)), sorted(os.path.basename(path) for path in (paths[0], paths[2])))
+
+if __name__ == '__main__':
+    unittest.main()
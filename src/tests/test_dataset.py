@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from spectralib.dataset import generate_dataset
+from spectralib.filterbank import read_filterbank
+from spectralib.frb import generate_pulse
+
+class TestDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.metadata = {
+            "source_name": "spectralib_dataset",
+            "machine_id": 0,
+            "telescope_id": 0,
+            "data_type": 0,
+            "fch1": 1400.0,
+            "foff": -2.0,
+            "nchans": 32,
+            "nbits": 8,
+            "tstart": 55555.0,
+            "tsamp": 0.001,
+            "nifs": 1,
+            "nbeams": 1,
+            "ibeam": 1
+        }
+        self.jobs = [
+            {"name": "frb", "nsamp": 2000, "frbs": [{"DM": 100, "pulse_start_index": 500, "pulse_duration": 10, "pulse_amplitude": 100}]},
+            {"nsamp": 2000, "rfi": [{"freqchanswidth": 4, "ispersistent": True, "RFIamplitude": 50}], "wandering_baseline": {"wanderingbaselineamplitude": 10, "wanderingbaselineperiod": 50}},
+            {"nsamp": 3000, "pulsars": [{"DM": 50, "rest_period": 0.1, "pulse_duration": 5, "pulse_amplitude": 20, "variability": {"nulling_probability": 0.5}}]},
+        ]
+
+    def test_generate_dataset_manifest(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest = generate_dataset(self.jobs, self.metadata, output_dir, seed=42, nworkers=1)
+            with open(os.path.join(output_dir, "manifest.json")) as f:
+                self.assertEqual(json.load(f), manifest)
+            self.assertEqual(len(manifest["files"]), 3)
+
+            frb = manifest["files"][0]
+            self.assertEqual(frb["name"], "frb")
+            data, header = read_filterbank(frb["file_path"])
+            self.assertEqual(data.shape, (32, 2000))
+            # The FRB is in the first channel where the manifest says it is
+            first_sample = frb["frbs"][0]["first_sample"]
+            self.assertGreater(data[0, first_sample:first_sample + 10].mean(), 200)
+
+            self.assertEqual(len(manifest["files"][1]["rfi"]), 1)
+            pulsar = manifest["files"][2]["pulsars"][0]
+            self.assertGreater(len(pulsar["arrival_indices"]) + len(pulsar["nulled_arrival_indices"]), 20)
+            self.assertEqual(len(pulsar["amplitudes"]), len(pulsar["arrival_indices"]))
+
+    def test_generate_dataset_manifest_matches_injected_pulses(self):
+        mode_time_profiles = [[1, 1, 1, 1, 1], [0.5, 1, 2, 1, 0.5, 0.2, 0.1]]
+        variability = {"amplitude_modulation": 0.5, "jitter": 2, "nulling_probability": 0.3, "mode_time_profiles": mode_time_profiles}
+        pulsar_params = {"DM": 50, "rest_period": 0.05, "pulse_duration": 5, "pulse_amplitude": 20, "variability": variability}
+        jobs = [{"nsamp": 3000, "noisesigma": 0, "mean": 50, "pulsars": [pulsar_params]}]
+        with tempfile.TemporaryDirectory() as output_dir:
+            entry = generate_dataset(jobs, self.metadata, output_dir, seed=5, nworkers=1)["files"][0]
+            data, _ = read_filterbank(entry["file_path"])
+
+        pulsar = entry["pulsars"][0]
+        self.assertGreater(len(pulsar["nulled_arrival_indices"]), 0)
+        self.assertGreater(len(set(pulsar["modes"])), 1)
+        # Rebuild the file from the manifest one pulse at a time
+        expected = np.full((32, 3000), 50.0)
+        for arrival_index, amplitude, mode in zip(pulsar["arrival_indices"], pulsar["amplitudes"], pulsar["modes"]):
+            generate_pulse(expected, 50, 0.001, -2.0, 1400.0, out=expected, pulse_start_index=arrival_index, pulse_amplitude=20 * amplitude,
+                           time_profile=np.array(mode_time_profiles[mode]), pulse_duration=len(mode_time_profiles[mode]))
+        np.testing.assert_array_equal(data, np.clip(np.rint(expected), 0, 255))
+
+    def test_generate_dataset_is_independent_of_workers(self):
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as parallel_dir:
+            serial = generate_dataset(self.jobs, self.metadata, serial_dir, seed=7, nworkers=1)
+            parallel = generate_dataset(self.jobs, self.metadata, parallel_dir, seed=7, nworkers=2, max_pending=1)
+            for serial_file, parallel_file in zip(serial["files"], parallel["files"]):
+                self.assertEqual(serial_file["name"], parallel_file["name"])
+                self.assertEqual(serial_file["rfi"], parallel_file["rfi"])
+                np.testing.assert_array_equal(read_filterbank(serial_file["file_path"])[0], read_filterbank(parallel_file["file_path"])[0])
+
+if __name__ == '__main__':
+    unittest.main()
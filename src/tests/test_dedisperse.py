@@ -0,0 +1,129 @@
+import unittest
+import numpy as np
+from spectralib.frb import generate_pulse, calculate_dispersion_offsets
+from spectralib.filterbank import dedisperse_filterbank_data_to_timeseries
+from spectralib.dedisperse import dedisperse_filterbank_data_multi_dm, dedisperse_filterbank_data_fdmt, dedisperse_filterbank_data_to_dm_time
+from spectralib.dedisperse import dedisperse_filterbank_data_subband, generate_dm_plan, dedisperse_filterbank_data_with_plan, downsample_filterbank_data
+
+class TestDedisperse(unittest.TestCase):
+
+    def setUp(self):
+        self.nchans, self.nsamp = 64, 4000
+        self.tsamp = 0.001
+        self.foff = -1.0
+        self.fch1 = 1400.0
+        self.data = np.random.normal(0, 18, size=(self.nchans, self.nsamp)) + 127
+
+    def test_multi_dm_matches_single_dm(self):
+        DMs = np.linspace(0, 800, 9)
+        plane = dedisperse_filterbank_data_multi_dm(self.data, DMs, self.tsamp, self.foff, self.fch1, block_size=1000, nthreads=3)
+        self.assertEqual(plane.shape, (9, self.nsamp))
+        self.assertEqual(plane.dtype, np.float32)
+        for i, DM in enumerate(DMs):
+            expected = dedisperse_filterbank_data_to_timeseries(self.data, DM, self.tsamp, self.foff, self.fch1)
+            np.testing.assert_allclose(plane[i], expected, rtol=1e-5)
+
+    def test_multi_dm_positive_foff(self):
+        data = self.data.astype(np.uint8)
+        DMs = [0, 250, 500]
+        plane = dedisperse_filterbank_data_multi_dm(data, DMs, self.tsamp, 1.0, 1336.0, nthreads=1)
+        for i, DM in enumerate(DMs):
+            expected = dedisperse_filterbank_data_to_timeseries(data, DM, self.tsamp, 1.0, 1336.0)
+            np.testing.assert_array_equal(plane[i], expected)
+
+    def test_multi_dm_recovers_pulse(self):
+        data = generate_pulse(self.data, 500, self.tsamp, self.foff, self.fch1, pulse_start_index=1000, pulse_duration=5, pulse_amplitude=100)
+        DMs = np.arange(0, 1000, 50)
+        plane = dedisperse_filterbank_data_multi_dm(data, DMs, self.tsamp, self.foff, self.fch1)
+        dm_index, sample = np.unravel_index(np.argmax(plane), plane.shape)
+        self.assertEqual(DMs[dm_index], 500)
+        self.assertTrue(1000 <= sample < 1005)
+
+    def test_fdmt_matches_brute_force_on_injected_pulse(self):
+        for foff, fch1 in [(self.foff, self.fch1), (1.0, 1337.0)]:
+            data = generate_pulse(np.zeros((self.nchans, self.nsamp)), 600, self.tsamp, foff, fch1, pulse_start_index=1500, pulse_duration=3, pulse_amplitude=10)
+            plane, DMs = dedisperse_filterbank_data_fdmt(data, 1000, self.tsamp, foff, fch1)
+            self.assertEqual(plane.shape[1], self.nsamp)
+            self.assertGreaterEqual(DMs[-1], 1000)
+
+            expected = dedisperse_filterbank_data_to_timeseries(data, 600, self.tsamp, foff, fch1)
+            row = int(abs(calculate_dispersion_offsets(600, fch1, foff, self.nchans, self.tsamp)[-1]))
+            self.assertAlmostEqual(DMs[row], 600, delta=DMs[1])
+            self.assertLessEqual(abs(np.argmax(plane[row]) - np.argmax(expected)), 2)
+            self.assertGreaterEqual(plane[row].max(), 0.9 * expected.max())
+
+    def test_fdmt_zero_delay_is_channel_sum(self):
+        plane, DMs = dedisperse_filterbank_data_fdmt(self.data, 200, self.tsamp, self.foff, self.fch1)
+        self.assertEqual(DMs[0], 0)
+        np.testing.assert_allclose(plane[0], np.sum(self.data, axis=0), rtol=1e-5)
+
+    def test_dm_time_backends(self):
+        data = generate_pulse(self.data, 400, self.tsamp, self.foff, self.fch1, pulse_start_index=2000, pulse_duration=5, pulse_amplitude=100)
+        DMs = np.arange(0, 800, 20)
+        for method in ["brute", "fdmt"]:
+            plane = dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method=method)
+            self.assertEqual(plane.shape, (len(DMs), self.nsamp))
+            dm_index, sample = np.unravel_index(np.argmax(plane), plane.shape)
+            self.assertAlmostEqual(DMs[dm_index], 400, delta=20)
+            self.assertLessEqual(abs(sample - 2002), 4)
+        with self.assertRaises(ValueError):
+            dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method="unknown")
+        # Backend specific keyword arguments are rejected by the other backends
+        np.testing.assert_allclose(dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method="brute", nthreads=2),
+                                   dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method="brute"))
+        with self.assertRaisesRegex(TypeError, "nthreads"):
+            dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method="fdmt", nthreads=2)
+        with self.assertRaisesRegex(TypeError, "block_size"):
+            dedisperse_filterbank_data_to_dm_time(data, DMs, self.tsamp, self.foff, self.fch1, method="subband", nsubbands=4, block_size=64)
+
+    def test_subband_matches_brute_force(self):
+        data = generate_pulse(np.zeros((self.nchans, self.nsamp)), 700, self.tsamp, self.foff, self.fch1, pulse_start_index=1200, pulse_duration=4, pulse_amplitude=100)
+        DMs = np.arange(0, 1000, 10)
+        brute = dedisperse_filterbank_data_multi_dm(data, DMs, self.tsamp, self.foff, self.fch1)
+        subband = dedisperse_filterbank_data_subband(data, DMs, self.tsamp, self.foff, self.fch1, nsubbands=8)
+        self.assertEqual(subband.shape, brute.shape)
+        subband_peak = np.unravel_index(np.argmax(subband), subband.shape)
+        brute_peak = np.unravel_index(np.argmax(brute), brute.shape)
+        self.assertLessEqual(abs(subband_peak[0] - brute_peak[0]), 2)
+        self.assertLessEqual(abs(subband_peak[1] - brute_peak[1]), 2)
+        self.assertGreaterEqual(subband.max(), 0.95 * brute.max())
+
+        # With one channel per subband the second stage is exactly brute force
+        exact = dedisperse_filterbank_data_subband(data, DMs, self.tsamp, self.foff, self.fch1, nsubbands=self.nchans)
+        np.testing.assert_allclose(exact, brute, rtol=1e-5)
+
+    def test_generate_dm_plan(self):
+        plan = generate_dm_plan(0.000128, -0.5, 1500.0, 500, 2000)
+        self.assertEqual(plan[0]["DM_start"], 0)
+        self.assertEqual(plan[-1]["DM_end"], 2000)
+        for previous, current in zip(plan[:-1], plan[1:]):
+            self.assertEqual(previous["DM_end"], current["DM_start"])
+            self.assertGreater(current["DM_step"], previous["DM_step"])
+            self.assertEqual(current["downsample"], 2 * previous["downsample"])
+        for dm_range in plan:
+            self.assertTrue(np.all(np.diff(dm_range["DMs"]) > 0))
+            self.assertTrue(1 <= dm_range["nsubbands"] <= 500)
+            # The nominal DMs the subband count was costed for cover the DM trials
+            nominal_DMs = dm_range["nominal_DMs"]
+            self.assertGreaterEqual(len(nominal_DMs), 1)
+            self.assertLessEqual(len(nominal_DMs), max(1, len(dm_range["DMs"])))
+            self.assertGreaterEqual(nominal_DMs.min(), dm_range["DMs"].min())
+            self.assertTrue(np.all(np.diff(nominal_DMs) > 0))
+
+    def test_dedisperse_with_plan_uses_plan_nominal_DMs(self):
+        data = generate_pulse(self.data, 300, self.tsamp, self.foff, self.fch1, pulse_start_index=1500, pulse_duration=6, pulse_amplitude=100)
+        plan = generate_dm_plan(self.tsamp, self.foff, self.fch1, self.nchans, 600)
+        results = dedisperse_filterbank_data_with_plan(data, plan, self.tsamp, self.foff, self.fch1)
+        for dm_range, (DMs, plane, downsample) in zip(plan, results):
+            downsampled = downsample_filterbank_data(data, downsample)
+            expected = dedisperse_filterbank_data_subband(downsampled, DMs, self.tsamp * downsample, self.foff, self.fch1, dm_range["nsubbands"], nominal_DMs=dm_range["nominal_DMs"])
+            np.testing.assert_array_equal(plane, expected)
+
+    def test_dedisperse_with_plan_recovers_pulse(self):
+        data = generate_pulse(self.data, 800, self.tsamp, self.foff, self.fch1, pulse_start_index=2500, pulse_duration=8, pulse_amplitude=100)
+        plan = generate_dm_plan(self.tsamp, self.foff, self.fch1, self.nchans, 1000)
+        best = max((plane.max(), DMs[np.unravel_index(np.argmax(plane), plane.shape)[0]]) for DMs, plane, downsample in dedisperse_filterbank_data_with_plan(data, plan, self.tsamp, self.foff, self.fch1))
+        self.assertAlmostEqual(best[1], 800, delta=30)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,13 @@
 import os
 import numpy as np
 import unittest
-from spectralib.filterbank import create_filterbank, read_filterbank, show_filterbank
+from spectralib.filterbank import create_filterbank, read_filterbank, show_filterbank, FilterbankMemmap, read_filterbank_blocks, FilterbankWriter
+from spectralib.filterbank import inject_pulse_into_filterbank, pulse_sample_window, read_filterbank_header, write_filterbank_header
+from spectralib.frb import generate_pulse
+from spectralib.quantise import quantise
+import io
+import contextlib
+from spectralib.frb import calculate_dispersion_offsets
 import matplotlib.pyplot as plt
 
 
@@ -42,6 +48,189 @@ class TestFilterbank(unittest.TestCase):
         except Exception as e:
             self.fail(f"show_filterbank() raised an exception: {e}")
 
+class TestFilterbankMemmap(unittest.TestCase):
+
+    def setUp(self):
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        self.output_file = os.path.join(current_dir, "test_filterbank_memmap.fil")
+        self.metadata = {
+            "source_name": "spectralib_test",
+            "fch1": 1500.0,
+            "foff": -0.5,
+            "nchans": 16,
+            "nbits": 8,
+            "tstart": 55555.0,
+            "tsamp": 0.001,
+            "nifs": 1,
+        }
+        self.data = np.random.randint(0, 256, size=(16, 1000)).astype(np.uint8)
+        create_filterbank(self.data, self.output_file, self.metadata)
+
+    def tearDown(self):
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+    def test_read_filterbank_mmap(self):
+        lazy, header = read_filterbank(self.output_file, mmap=True)
+        self.assertIsInstance(lazy, FilterbankMemmap)
+        self.assertEqual(lazy.shape, self.data.shape)
+        self.assertEqual(header["nchans"], 16)
+        np.testing.assert_array_equal(lazy[:, :], self.data)
+
+    def test_slicing(self):
+        lazy, _ = read_filterbank(self.output_file, mmap=True)
+        np.testing.assert_array_equal(lazy[2:9, 100:250], self.data[2:9, 100:250])
+        np.testing.assert_array_equal(lazy[:, 990:2000], self.data[:, 990:])
+        np.testing.assert_array_equal(lazy[3, 10:20], self.data[3, 10:20])
+        np.testing.assert_array_equal(lazy[:, 500], self.data[:, 500])
+        np.testing.assert_array_equal(lazy[:, 700:100:-3], self.data[:, 700:100:-3])
+        np.testing.assert_array_equal(lazy.read(4, 8, 10, 30), self.data[4:8, 10:30])
+        np.testing.assert_array_equal(lazy.read_time(0.1, 0.2), self.data[:, 100:200])
+        self.assertEqual(lazy[:, 400:400].shape, (16, 0))
+        self.assertEqual(lazy[2:5, 400:400].shape, (3, 0))
+        self.assertEqual(lazy[3, 400:400].shape, (0,))
+
+    def test_read_time_without_tsamp(self):
+        header = read_filterbank_header(self.output_file)[0]
+        del header["tsamp"]
+        lazy = FilterbankMemmap(self.output_file, header, read_filterbank_header(self.output_file)[1])
+        with self.assertRaises(ValueError):
+            lazy.read_time(0.1, 0.2)
+
+    def test_byte_range(self):
+        lazy, _ = read_filterbank(self.output_file, mmap=True)
+        start, end = lazy.byte_range(10, 20)
+        self.assertEqual(end - start, 10 * 16)
+        self.assertEqual(os.path.getsize(self.output_file), lazy.byte_range(0, lazy.nsamples)[1])
+
+    def test_read_filterbank_blocks(self):
+        blocks = list(read_filterbank_blocks(self.output_file, 300, overlap=50))
+        self.assertEqual([start for start, _ in blocks], [0, 300, 600, 900])
+        for start, block in blocks:
+            np.testing.assert_array_equal(block, self.data[:, start:start + 350])
+        self.assertEqual(blocks[-1][1].shape, (16, 100))
+
+    def test_read_filterbank_blocks_dm_overlap(self):
+        DM = 50
+        offsets = calculate_dispersion_offsets(DM, self.metadata["fch1"], self.metadata["foff"], 16, self.metadata["tsamp"])
+        start, block = next(read_filterbank_blocks(self.output_file, 200, DM=DM))
+        self.assertEqual(block.shape, (16, 200 + int(max(offsets))))
+
+    def test_filterbank_writer(self):
+        writer_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_writer.fil")
+        try:
+            with FilterbankWriter(writer_file, self.metadata, buffer_nsamp=64) as writer:
+                for start in range(0, 1000, 300):
+                    writer.write_block(self.data[:, start:start + 300].astype(np.float64))
+            self.assertEqual(writer.nsamples_written, 1000)
+
+            # Independent reference: the header followed by the time-major uint8 samples
+            header = io.BytesIO()
+            write_filterbank_header(header, self.metadata)
+            with open(writer_file, "rb") as f:
+                self.assertEqual(f.read(), header.getvalue() + self.data.astype(np.uint8).T.tobytes())
+        finally:
+            if os.path.exists(writer_file):
+                os.remove(writer_file)
+
+    def test_filterbank_writer_matches_quantise(self):
+        writer_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_writer_quantise.fil")
+        try:
+            data = np.random.normal(127, 100, size=(16, 1000)).astype(np.float32)
+            with FilterbankWriter(writer_file, self.metadata, buffer_nsamp=64) as writer:
+                writer.write_block(data)
+            np.testing.assert_array_equal(read_filterbank(writer_file)[0], quantise(data, 8))
+        finally:
+            if os.path.exists(writer_file):
+                os.remove(writer_file)
+
+    def test_filterbank_writer_nbits(self):
+        writer_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_writer_16.fil")
+        try:
+            metadata = dict(self.metadata, nbits=16)
+            with FilterbankWriter(writer_file, metadata) as writer:
+                writer.write_block(self.data.astype(np.float32) * 100)
+            header = io.BytesIO()
+            write_filterbank_header(header, metadata)
+            with open(writer_file, "rb") as f:
+                self.assertEqual(f.read(), header.getvalue() + (self.data.astype(np.uint16) * 100).T.tobytes())
+            with self.assertRaises(ValueError):
+                FilterbankWriter(writer_file, dict(self.metadata, nbits=4))
+        finally:
+            if os.path.exists(writer_file):
+                os.remove(writer_file)
+
+    def test_read_filterbank_header_unknown_parameter(self):
+        unknown_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_unknown.fil")
+        try:
+            metadata = dict(self.metadata, nsamples=1000, custom_field=7)
+            create_filterbank(self.data, unknown_file, metadata)
+            with contextlib.redirect_stdout(io.StringIO()):
+                header, header_len = read_filterbank_header(unknown_file)
+            self.assertEqual(header_len, os.path.getsize(unknown_file) - self.data.size)
+            self.assertEqual(header["nsamples"], 1000)
+            with contextlib.redirect_stdout(io.StringIO()):
+                np.testing.assert_array_equal(read_filterbank(unknown_file)[0], self.data)
+        finally:
+            if os.path.exists(unknown_file):
+                os.remove(unknown_file)
+
+    def test_read_filterbank_header_unknown_parameter_before_known_ones(self):
+        unknown_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_unknown_first.fil")
+        try:
+            metadata = dict(custom_field=7.5, custom_name="telescope", **self.metadata)
+            create_filterbank(self.data, unknown_file, metadata)
+            with contextlib.redirect_stdout(io.StringIO()):
+                header, header_len = read_filterbank_header(unknown_file)
+                lazy, _ = read_filterbank(unknown_file, mmap=True)
+            self.assertEqual(header, self.metadata)
+            self.assertEqual(header_len, os.path.getsize(unknown_file) - self.data.size)
+            np.testing.assert_array_equal(lazy[:, :], self.data)
+        finally:
+            if os.path.exists(unknown_file):
+                os.remove(unknown_file)
+
+    def test_read_filterbank_header_without_header_end(self):
+        truncated_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_truncated.fil")
+        try:
+            header = io.BytesIO()
+            write_filterbank_header(header, dict(self.metadata, custom_field=7))
+            with open(truncated_file, "wb") as f:
+                f.write(header.getvalue()[:-len("HEADER_END") - 4])
+                f.write(bytes(1000))
+            with contextlib.redirect_stdout(io.StringIO()), self.assertRaisesRegex(ValueError, "custom_field"):
+                read_filterbank_header(truncated_file)
+        finally:
+            if os.path.exists(truncated_file):
+                os.remove(truncated_file)
+
+    def test_inject_pulse_into_filterbank(self):
+        pulse_params = {'pulse_start_index': 200, 'pulse_duration': 10, 'pulse_amplitude': 50}
+        expected = generate_pulse(self.data.astype(np.float64), 500, 0.001, -0.5, 1500.0, **pulse_params)
+        with open(self.output_file, "rb") as f:
+            original = f.read()
+
+        copy_file = os.path.join(os.path.dirname(self.output_file), "test_filterbank_injected.fil")
+        try:
+            window = inject_pulse_into_filterbank(self.output_file, 500, output_path=copy_file, **pulse_params)
+            np.testing.assert_array_equal(read_filterbank(copy_file)[0], expected)
+            with open(self.output_file, "rb") as f:
+                self.assertEqual(f.read(), original)
+        finally:
+            if os.path.exists(copy_file):
+                os.remove(copy_file)
+
+        self.assertEqual(window, pulse_sample_window(500, 1500.0, -0.5, 16, 0.001, 200, 10))
+        self.assertEqual(inject_pulse_into_filterbank(self.output_file, 500, **pulse_params), window)
+        np.testing.assert_array_equal(read_filterbank(self.output_file)[0], expected)
+        # Only the bytes of the window were changed
+        with open(self.output_file, "rb") as f:
+            injected = f.read()
+        header_len = len(original) - self.data.size
+        changed = np.nonzero(np.frombuffer(injected, np.uint8) != np.frombuffer(original, np.uint8))[0]
+        self.assertGreater(len(changed), 0)
+        self.assertTrue(np.all((changed >= header_len + window[0] * 16) & (changed < header_len + window[1] * 16)))
+
 
 if __name__ == '__main__':
     unittest.main()
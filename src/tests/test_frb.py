@@ -1,6 +1,9 @@
 import unittest
 import numpy as np
-from spectralib.frb import generate_pulse, calculate_dispersion_offsets
+from spectralib.frb import generate_pulse, generate_high_resolution_pulse, calculate_dispersion_offsets, calculate_dispersion_delay_table
+from spectralib.frb import SparsePulse, smeared_sparse_pulse, smearing_kernels, intra_channel_smearing_times, generate_smeared_pulse
+import json
+import tracemalloc
 
 class TestFRB(unittest.TestCase):
     def test_calculate_dispersion_offsets(self):
@@ -13,6 +16,27 @@ class TestFRB(unittest.TestCase):
         offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
         self.assertEqual(len(offsets), nchans)
 
+    def test_calculate_dispersion_offsets_matches_reference_loop(self):
+        DM, tsamp, foff, fch1, nchans = 350.5, 0.000128, -0.5, 1500.0, 500
+        expected = np.zeros(nchans)
+        for i in range(nchans):
+            delay = 4148.741601 * DM * ((1 / ((fch1 + i * foff) ** 2)) - (1 / (fch1 ** 2)))
+            expected[i] = round(delay / tsamp)
+        np.testing.assert_array_equal(calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp), expected)
+
+    def test_calculate_dispersion_offsets_cache_is_not_shared(self):
+        offsets = calculate_dispersion_offsets(100, 1000, -0.1, 512, 0.001)
+        offsets[:] = -1
+        self.assertGreater(calculate_dispersion_offsets(100, 1000, -0.1, 512, 0.001)[-1], 0)
+
+    def test_calculate_dispersion_delay_table(self):
+        DMs = np.linspace(0, 2000, 17)
+        table = calculate_dispersion_delay_table(DMs, 1500.0, -0.5, 256, 0.000064)
+        self.assertEqual(table.shape, (17, 256))
+        self.assertTrue(np.issubdtype(table.dtype, np.integer))
+        for i, DM in enumerate(DMs):
+            np.testing.assert_array_equal(table[i], calculate_dispersion_offsets(DM, 1500.0, -0.5, 256, 0.000064))
+
     def test_generate_pulse(self):
         nchans, nsamp = 100, 10000
         data = np.random.normal(0,18,size=(nchans, nsamp))+127
@@ -32,5 +56,181 @@ class TestFRB(unittest.TestCase):
         self.assertEqual(data_with_frb.shape, data.shape)
         self.assertNotEqual(np.sum(datacopy), np.sum(data_with_frb))
 
+    def test_generate_pulse_rounds_and_saturates_integer_data(self):
+        data = np.zeros((2, 50), dtype=np.uint8)
+        data[0] = 200
+        data[1] = 10
+        result = generate_pulse(data, 0, 0.001, -1.0, 1400.0, out=data, pulse_start_index=5, pulse_duration=4, pulse_amplitude=100, freq_profile=np.array([1, 0.026]))
+        self.assertIs(result, data)
+        # 200 + 100 saturates at 255 rather than wrapping to 44, and 10 + 2.6 rounds to 13
+        self.assertEqual(data[0, 5:9].tolist(), [255] * 4)
+        self.assertEqual(data[1, 5:9].tolist(), [13] * 4)
+        self.assertEqual(data[0, 20], 200)
+
+    def test_generate_pulse_matches_reference_loop(self):
+        def reference_generate_pulse(data, DM, tsamp, foff, fch1, pulse_start_index, pulse_duration, pulse_amplitude, time_profile, freq_profile):
+            nchans, nsamp = data.shape
+            offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
+            for i in range(nchans):
+                for j in range(pulse_duration):
+                    time_index = round(pulse_start_index + j + offsets[i])
+                    if 0 <= time_index < nsamp:
+                        data[i, time_index] += pulse_amplitude * time_profile[j] * freq_profile[i]
+            return np.clip(data, 0, 255)
+
+        nchans, nsamp = 64, 2000
+        tsamp, foff, fch1 = 0.001, -1.0, 1400.0
+        for DM, pulse_start_index in [(0, 10), (500, -200), (300, 1900), (1000, 1500)]:
+            pulse_params = {
+                'pulse_start_index': pulse_start_index,
+                'pulse_duration': 30,
+                'pulse_amplitude': 70,
+                'time_profile': np.random.normal(1, 0.1, 30),
+                'freq_profile': np.random.normal(1, 0.1, nchans)
+            }
+            data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+            expected = reference_generate_pulse(data.copy(), DM, tsamp, foff, fch1, **pulse_params)
+            result = generate_pulse(data, DM, tsamp, foff, fch1, **pulse_params)
+            np.testing.assert_array_equal(result, expected)
+
+    def test_generate_high_resolution_pulse_matches_reference_loop(self):
+        def reference_generate_high_resolution_pulse(data, DM, tsamp, foff, fch1, freq_upsample_factor, pulse_start_index, pulse_duration, pulse_amplitude, time_profile, freq_profile):
+            nchans, nsamp = data.shape
+            time_profile_hr = np.interp(np.linspace(0, pulse_duration - 1, pulse_duration * freq_upsample_factor), np.arange(pulse_duration), time_profile)
+            freq_profile_hr = np.interp(np.linspace(0, nchans - 1, nchans * freq_upsample_factor), np.arange(nchans), freq_profile)
+            sub_band_offsets = calculate_dispersion_offsets(DM, fch1, foff / freq_upsample_factor, nchans * freq_upsample_factor, tsamp / freq_upsample_factor)
+            for i in range(nchans * freq_upsample_factor):
+                for j in range(pulse_duration * freq_upsample_factor):
+                    time_index = round((pulse_start_index * freq_upsample_factor) + j + sub_band_offsets[i])
+                    if 0 <= time_index < nsamp * freq_upsample_factor:
+                        data[i // freq_upsample_factor, time_index // freq_upsample_factor] += pulse_amplitude * time_profile_hr[j] * freq_profile_hr[i] / freq_upsample_factor**2
+            return np.clip(data, 0, 255)
+
+        nchans, nsamp = 32, 1000
+        tsamp, foff, fch1 = 0.001, -2.0, 400.0
+        for DM, pulse_start_index, freq_upsample_factor in [(0, 10, 2), (200, -100, 4), (600, 800, 3)]:
+            pulse_params = {
+                'pulse_start_index': pulse_start_index,
+                'pulse_duration': 20,
+                'pulse_amplitude': 80,
+                'time_profile': np.random.normal(1, 0.1, 20),
+                'freq_profile': np.random.normal(1, 0.1, nchans)
+            }
+            data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+            expected = reference_generate_high_resolution_pulse(data.copy(), DM, tsamp, foff, fch1, freq_upsample_factor, **pulse_params)
+            result = generate_high_resolution_pulse(data, DM, tsamp, foff, fch1, freq_upsample_factor, **pulse_params)
+            np.testing.assert_allclose(result, expected)
+
+    def test_generate_high_resolution_pulse_without_upsampling(self):
+        data = np.random.normal(0, 18, size=(32, 1000)) + 127
+        pulse_params = {
+            'pulse_start_index': 100,
+            'pulse_duration': 20,
+            'pulse_amplitude': 80,
+            'freq_profile': np.random.normal(1, 0.1, 32)
+        }
+        expected = generate_pulse(data.copy(), 300, 0.001, -2.0, 400.0, **pulse_params)
+        result = generate_high_resolution_pulse(data, 300, 0.001, -2.0, 400.0, 1, **pulse_params)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_generate_high_resolution_pulse_memory_scales_with_pulse(self):
+        # At high DM and low frequency the sweep covers the whole observation, but the pulse
+        # only touches a few cells of each channel
+        data = np.zeros((256, 100000), np.float32)
+        pulse_params = {'pulse_start_index': 0, 'pulse_duration': 20, 'pulse_amplitude': 10}
+        tracemalloc.start()
+        generate_high_resolution_pulse(data, 500, 0.0001, -0.2, 400.0, 4, out=data, **pulse_params)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, data.nbytes // 10)
+        np.testing.assert_allclose(data.sum(), 256 * 20 * 10, rtol=1e-4)
+
+    def test_generate_high_resolution_pulse_integer_out(self):
+        data = np.full((16, 800), 200, np.uint8)
+        pulse_params = {'pulse_start_index': 100, 'pulse_duration': 20, 'pulse_amplitude': 100}
+        expected = generate_high_resolution_pulse(data.astype(np.float64), 300, 0.001, -2.0, 400.0, 4, **pulse_params)
+        result = generate_high_resolution_pulse(data, 300, 0.001, -2.0, 400.0, 4, out=data, **pulse_params)
+        self.assertIs(result, data)
+        self.assertEqual(result.dtype, np.uint8)
+        # The pulse saturates at 255 instead of wrapping around
+        np.testing.assert_array_equal(result, np.clip(np.rint(expected), 0, 255))
+
+    def test_sparse_pulse_matches_generate_pulse(self):
+        nchans, nsamp = 64, 3000
+        pulse_params = {
+            'pulse_start_index': 700,
+            'pulse_duration': 20,
+            'pulse_amplitude': 30,
+            'time_profile': np.random.normal(1, 0.1, 20),
+            'freq_profile': np.random.normal(1, 0.1, nchans)
+        }
+        data = np.random.normal(127, 18, size=(nchans, nsamp))
+        expected = generate_pulse(data.copy(), 1000, 0.001, -1.0, 1400.0, **pulse_params)
+        pulse = SparsePulse.from_params(1000, 0.001, -1.0, 1400.0, nchans, **pulse_params)
+        np.testing.assert_allclose(np.clip(pulse.add_to(data.copy()), 0, 255), expected)
+
+        offsets = calculate_dispersion_offsets(1000, 1400.0, -1.0, nchans, 0.001)
+        self.assertEqual(pulse.window(), (700 + offsets.min(), 700 + offsets.max() + 20))
+        self.assertEqual(pulse.values.shape, (nchans, 20))
+
+        # Adding the pulse block by block gives the same result as adding it at once
+        blocks = data.copy()
+        for start in range(0, nsamp, 256):
+            pulse.add_to(blocks[:, start:start + 256], sample_offset=start)
+        np.testing.assert_allclose(blocks, pulse.add_to(data.copy()))
+
+    def test_sparse_pulse_saturates_integer_data(self):
+        pulse = SparsePulse.from_params(0, 0.001, -1.0, 1400.0, 4, pulse_duration=5, pulse_amplitude=200)
+        data = np.full((4, 20), 100, dtype=np.uint8)
+        pulse.add_to(data, sample_offset=-3)
+        self.assertEqual(data[0, 3], 255)
+        self.assertEqual(data[0, 2], 100)
+
+    def test_sparse_pulse_serialisation(self):
+        pulse = SparsePulse.from_params(300, 0.001, -1.0, 1400.0, 16, pulse_start_index=50, pulse_duration=4, pulse_amplitude=3)
+        record = json.loads(json.dumps(pulse.to_dict()))
+        self.assertEqual(record['window'], list(pulse.window()))
+        restored = SparsePulse.from_dict(record)
+        np.testing.assert_array_equal(restored.starts, pulse.starts)
+        np.testing.assert_allclose(restored.values, pulse.values)
+        self.assertEqual(restored.pulse_start_index, 50)
+
+    def test_smeared_pulse_without_smearing_matches_sparse_pulse(self):
+        pulse_params = {'pulse_start_index': 30, 'pulse_duration': 12, 'pulse_amplitude': 7, 'time_profile': np.random.normal(1, 0.1, 12)}
+        smeared = smeared_sparse_pulse(0, 0.001, -1.0, 1400.0, 8, **pulse_params)
+        plain = SparsePulse.from_params(0, 0.001, -1.0, 1400.0, 8, **pulse_params)
+        np.testing.assert_array_equal(smeared.starts, plain.starts)
+        np.testing.assert_allclose(smeared.values, plain.values, atol=1e-12)
+
+    def test_smeared_pulse_matches_direct_convolution(self):
+        DM, tsamp, foff, fch1, nchans = 2000, 0.0001, -1.0, 800.0, 16
+        pulse_params = {'pulse_duration': 8, 'pulse_amplitude': 40, 'time_profile': np.hanning(8), 'scattering_time': 0.0005, 'reference_frequency': 800.0}
+        pulse = smeared_sparse_pulse(DM, tsamp, foff, fch1, nchans, **pulse_params)
+        boxcars, tails = smearing_kernels(DM, tsamp, foff, fch1, nchans, 0.0005, reference_frequency=800.0)
+        for chan in range(nchans):
+            expected = 40 * np.convolve(np.convolve(np.hanning(8), boxcars[chan]), tails[chan])
+            np.testing.assert_allclose(pulse.values[chan], expected, atol=1e-10)
+        # The fluence of every channel is kept
+        np.testing.assert_allclose(pulse.values.sum(axis=1), 40 * np.hanning(8).sum())
+
+    def test_smearing_kernels(self):
+        DM, tsamp, foff, fch1, nchans = 1000, 0.0001, -1.0, 800.0, 32
+        widths = intra_channel_smearing_times(DM, fch1, foff, nchans) / tsamp
+        boxcars, tails = smearing_kernels(DM, tsamp, foff, fch1, nchans, scattering_time=0.001, scattering_index=-4.0)
+        np.testing.assert_allclose(boxcars.sum(axis=1), 1)
+        np.testing.assert_allclose(tails.sum(axis=1), 1)
+        # Lower frequencies are smeared and scattered more
+        np.testing.assert_array_equal(np.count_nonzero(boxcars, axis=1), np.ceil(widths))
+        self.assertGreater(np.sum(tails[-1] * np.arange(tails.shape[1])), np.sum(tails[0] * np.arange(tails.shape[1])))
+        # The mean delay of the first channel is about its scattering time of 10 samples
+        self.assertAlmostEqual(np.sum(tails[0] * (np.arange(tails.shape[1]) + 0.5)), 10, delta=0.5)
+
+    def test_generate_smeared_pulse(self):
+        data = np.full((16, 3000), 100.0)
+        result = generate_smeared_pulse(data.copy(), 500, 0.0005, -2.0, 1000.0, pulse_start_index=200, pulse_duration=5, pulse_amplitude=100, scattering_time=0.002)
+        self.assertEqual(result.shape, data.shape)
+        self.assertLessEqual(result.max(), 255)
+        np.testing.assert_allclose(result.sum() - data.sum(), 16 * 500, rtol=1e-6)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,11 @@
 import unittest
 import numpy as np
 from spectralib.frb import generate_pulse, calculate_dispersion_offsets
-from spectralib.pulsar import generate_binary_pulsar, generate_solitary_pulsar, apparent_pulse_period
+import io
+import contextlib
+from spectralib.pulsar import generate_binary_pulsar, generate_solitary_pulsar, apparent_pulse_period, binary_pulse_arrival_indices, solitary_pulse_arrival_indices
+from spectralib.pulsar import draw_pulse_variability, add_variable_pulse_train
+from spectralib.frb import dispersed_pulse_spans, add_pulse_train
 
 class TestPulsar(unittest.TestCase):
 
@@ -20,6 +24,49 @@ class TestPulsar(unittest.TestCase):
         p_apparent = apparent_pulse_period(binary_params, time)
         self.assertIsNotNone(p_apparent)
 
+    def test_apparent_pulse_period_vectorised(self):
+        binary_params = {
+            'rest_period': 0.005,
+            'inclination': 0.5,
+            'orbital_period': 3600,
+            'start_phase': 0.2,
+            'companion_mass': 1.0,
+            'pulsar_mass': 1.4,
+            'eccentricity': 0.6,
+            'omega': 0.3
+        }
+        times = np.linspace(0, 7200, 101)
+        periods = apparent_pulse_period(binary_params, times)
+        self.assertEqual(periods.shape, times.shape)
+        expected = [apparent_pulse_period(binary_params, time) for time in times]
+        np.testing.assert_allclose(periods, expected, rtol=1e-12)
+
+    def test_binary_pulse_arrival_indices(self):
+        binary_params = {
+            'rest_period': 0.01,
+            'inclination': np.radians(45),
+            'orbital_period': 200,
+            'start_phase': 0,
+            'companion_mass': 1.4,
+            'pulsar_mass': 1.4,
+            'eccentricity': 0.1,
+            'omega': np.radians(90)
+        }
+        tsamp, nsamp, start_index = 0.000128, 200000, -500
+        indices = binary_pulse_arrival_indices(binary_params, tsamp, start_index, nsamp)
+
+        # Step through the pulses one apparent period at a time, as generate_binary_pulsar used to
+        expected = []
+        t = start_index * tsamp
+        while t < nsamp * tsamp:
+            expected.append(int(t / tsamp))
+            t += apparent_pulse_period(binary_params, t)
+
+        self.assertEqual(len(indices), len(expected))
+        self.assertEqual(indices[0], start_index)
+        self.assertTrue(np.all(indices < nsamp))
+        np.testing.assert_allclose(indices, expected, atol=3)
+
     def test_generate_binary_pulsar(self):
         data = np.zeros((64, 1024), dtype=np.uint8)
         DM = 100
@@ -41,7 +88,10 @@ class TestPulsar(unittest.TestCase):
             'pulse_amplitude': 50
         }
 
-        data_with_pulsar = generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, **pulse_params)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            data_with_pulsar = generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, **pulse_params)
+        self.assertEqual(output.getvalue(), "")
 
         self.assertIsNotNone(data_with_pulsar)
         self.assertEqual(data_with_pulsar.shape, data.shape)
@@ -62,5 +112,103 @@ class TestPulsar(unittest.TestCase):
         self.assertIsNotNone(data_with_pulsar)
         self.assertEqual(data_with_pulsar.shape, data.shape)
 
+    def test_solitary_pulse_arrival_indices(self):
+        tsamp, nsamp, start_index, rest_period = 0.000064, 100000, -37.0, 0.0031
+        expected = []
+        pulse = 0
+        pulse_start_time = start_index * tsamp
+        while pulse_start_time < nsamp * tsamp:
+            pulse_start_time = start_index * tsamp + pulse * rest_period
+            expected.append(int(pulse_start_time / tsamp))
+            pulse += 1
+        np.testing.assert_array_equal(solitary_pulse_arrival_indices(rest_period, tsamp, start_index, nsamp), expected)
+
+    def test_add_pulse_train_matches_generate_pulse(self):
+        nchans, nsamp = 32, 3000
+        DM, tsamp, foff, fch1 = 200, 0.001, -2.0, 1400.0
+        pulse_params = {
+            'pulse_duration': 40,
+            'pulse_amplitude': 5,
+            'time_profile': np.random.normal(1, 0.1, 40),
+            'freq_profile': np.random.normal(1, 0.1, nchans)
+        }
+        spans = dispersed_pulse_spans(DM, tsamp, foff, fch1, nchans, **pulse_params)
+        # Widely separated, overlapping and coincident pulses
+        for arrival_indices in [np.array([-300, 100, 900, 2950]), np.array([0, 15, 31, 500, 2000, 2010]), np.array([10, 10, 700])]:
+            data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+            original = data.copy()
+            expected = data.copy()
+            for pulse_start_index in arrival_indices:
+                expected = generate_pulse(expected, DM, tsamp, foff, fch1, pulse_start_index=pulse_start_index, **pulse_params)
+            result = add_pulse_train(data, spans, arrival_indices)
+            np.testing.assert_allclose(np.clip(result, 0, 255), expected)
+            # Small blocks split the train over several updates
+            blocked = add_pulse_train(original, spans, arrival_indices[::-1], block_size=nchans * 40)
+            np.testing.assert_allclose(blocked, result)
+
+    def test_add_pulse_train_saturates_integer_data(self):
+        nchans, nsamp = 8, 500
+        spans = dispersed_pulse_spans(50, 0.001, -2.0, 1400.0, nchans, pulse_duration=10, pulse_amplitude=100)
+        data = np.full((nchans, nsamp), 200, dtype=np.uint8)
+        add_pulse_train(data, spans, np.array([20, 20, 300]), amplitudes=np.array([0.5, 1.5, -3.0]))
+        self.assertEqual(data.dtype, np.uint8)
+        self.assertEqual(data[0, 20:30].tolist(), [255] * 10)
+        self.assertEqual(data[0, 300:310].tolist(), [0] * 10)
+        self.assertEqual(data[0, 100], 200)
+
+    def test_generate_solitary_pulsar_matches_pulse_loop(self):
+        nchans, nsamp = 32, 5000
+        DM, tsamp, foff, fch1, rest_period = 150, 0.001, -2.0, 1400.0, 0.0173
+        pulse_params = {'pulse_duration': 30, 'pulse_amplitude': 3}
+        data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+        offsets = calculate_dispersion_offsets(DM, fch1, foff, nchans, tsamp)
+        expected = data.copy()
+        for pulse_start_index in solitary_pulse_arrival_indices(rest_period, tsamp, -max(offsets), nsamp):
+            expected = generate_pulse(expected, DM, tsamp, foff, fch1, pulse_start_index=pulse_start_index, **pulse_params)
+        np.testing.assert_allclose(generate_solitary_pulsar(data, DM, tsamp, foff, fch1, rest_period, **pulse_params), expected)
+
+    def test_draw_pulse_variability(self):
+        pulses = draw_pulse_variability(20000, rng=1, amplitude_modulation=0.5, jitter=2, nulling_probability=0.2, mode_probabilities=[3, 1])
+        self.assertAlmostEqual(np.mean(pulses['nulled']), 0.2, delta=0.02)
+        self.assertTrue(np.all(pulses['amplitudes'][pulses['nulled']] == 0))
+        active = pulses['amplitudes'][~pulses['nulled']]
+        self.assertAlmostEqual(np.mean(active), 1, delta=0.03)
+        self.assertAlmostEqual(np.std(active), 0.5, delta=0.05)
+        self.assertAlmostEqual(np.std(pulses['jitter']), 2, delta=0.1)
+        self.assertEqual(pulses['jitter'].dtype, np.int64)
+        self.assertAlmostEqual(np.mean(pulses['modes'] == 0), 0.75, delta=0.02)
+        # The same seed draws the same pulses
+        again = draw_pulse_variability(20000, rng=1, amplitude_modulation=0.5, jitter=2, nulling_probability=0.2, mode_probabilities=[3, 1])
+        for key in pulses:
+            np.testing.assert_array_equal(pulses[key], again[key])
+
+    def test_add_variable_pulse_train_matches_pulse_loop(self):
+        nchans, nsamp = 16, 4000
+        DM, tsamp, foff, fch1 = 100, 0.001, -2.0, 1400.0
+        pulse_params = {'pulse_amplitude': 5}
+        mode_time_profiles = [np.ones(10), np.linspace(1, 0, 25)]
+        variability = {'amplitude_modulation': 0.3, 'jitter': 3, 'nulling_probability': 0.3, 'mode_time_profiles': mode_time_profiles}
+        arrival_indices = np.arange(-50, nsamp, 97)
+        data = np.zeros((nchans, nsamp))
+        result = add_variable_pulse_train(data, DM, tsamp, foff, fch1, arrival_indices, variability, np.random.default_rng(7), **pulse_params)
+
+        # Replay the same draws one pulse at a time
+        pulses = draw_pulse_variability(len(arrival_indices), rng=np.random.default_rng(7), amplitude_modulation=0.3, jitter=3, nulling_probability=0.3, mode_probabilities=[1, 1])
+        expected = np.zeros((nchans, nsamp))
+        for index, amplitude, mode in zip(arrival_indices + pulses['jitter'], pulses['amplitudes'], pulses['modes']):
+            if amplitude == 0:
+                continue
+            profile = mode_time_profiles[mode]
+            expected = generate_pulse(expected, DM, tsamp, foff, fch1, pulse_start_index=index, pulse_duration=len(profile), time_profile=profile, pulse_amplitude=5 * amplitude)
+        np.testing.assert_allclose(result, expected)
+
+    def test_generate_solitary_pulsar_nulling(self):
+        nchans, nsamp = 16, 2000
+        data = np.full((nchans, nsamp), 100.0)
+        result = generate_solitary_pulsar(data.copy(), 50, 0.001, -2.0, 1400.0, 0.05, variability={'nulling_probability': 1.0}, rng=0, pulse_duration=5, pulse_amplitude=10)
+        np.testing.assert_array_equal(result, data)
+        result = generate_solitary_pulsar(data.copy(), 50, 0.001, -2.0, 1400.0, 0.05, variability={'nulling_probability': 0.0}, rng=0, pulse_duration=5, pulse_amplitude=10)
+        np.testing.assert_array_equal(result, generate_solitary_pulsar(data.copy(), 50, 0.001, -2.0, 1400.0, 0.05, pulse_duration=5, pulse_amplitude=10))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+from spectralib.quantise import nbits_to_dtype, nbits_range, clip_to_nbits, finalise, quantise
+from spectralib.frb import generate_pulse
+from spectralib.rfi import generate_rfi, generate_rfi_scene, add_wandering_baseline
+from spectralib.frb import generate_high_resolution_pulse
+import io
+import contextlib
+
+class TestQuantise(unittest.TestCase):
+
+    def test_nbits_range(self):
+        self.assertEqual(nbits_range(8), (0, 255))
+        self.assertEqual(nbits_range(16), (0, 65535))
+        self.assertEqual(nbits_to_dtype(32), np.uint32)
+        with self.assertRaises(ValueError):
+            nbits_range(4)
+
+    def test_clip_to_nbits_keeps_dtype(self):
+        data = np.array([-5, 100, 300, 70000], dtype=np.float32)
+        np.testing.assert_array_equal(clip_to_nbits(data), [0, 100, 255, 255])
+        np.testing.assert_array_equal(clip_to_nbits(data, 16), [0, 100, 300, 65535])
+        self.assertEqual(clip_to_nbits(data).dtype, np.float32)
+
+    def test_generators_keep_float32_and_nbits_range(self):
+        data = np.full((16, 500), 1000, dtype=np.float32)
+        data = generate_pulse(data, 50, 0.001, -2.0, 1400.0, pulse_amplitude=200, pulse_duration=10, nbits=16)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data.max(), 1200)
+        data = generate_rfi_scene(data, [{'ispersistent': True, 'RFIamplitude': 70000}], nbits=16)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data.max(), 65535)
+        data = add_wandering_baseline(data, wanderingbaselineamplitude=1, wanderingbaselineperiod=10)
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data.max(), 255)
+
+    def test_in_place_chain_matches_clipped_chain(self):
+        data = np.random.normal(127, 18, size=(32, 2000)).astype(np.float32)
+        np.random.seed(1)
+        expected = data.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = generate_pulse(expected, 100, 0.001, -2.0, 1400.0, pulse_start_index=100, pulse_duration=20, pulse_amplitude=50)
+            expected = generate_high_resolution_pulse(expected, 100, 0.001, -2.0, 1400.0, 4, pulse_start_index=900, pulse_duration=20, pulse_amplitude=50)
+            expected = generate_rfi(expected, ispersistent=True, freqchanswidth=3, RFIamplitude=150)
+            expected = add_wandering_baseline(expected, custom_baseline=np.full(2000, 3.0))
+
+        np.random.seed(1)
+        result = data.copy()
+        buffer = result
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = generate_pulse(result, 100, 0.001, -2.0, 1400.0, out=result, pulse_start_index=100, pulse_duration=20, pulse_amplitude=50)
+            result = generate_high_resolution_pulse(result, 100, 0.001, -2.0, 1400.0, 4, out=result, pulse_start_index=900, pulse_duration=20, pulse_amplitude=50)
+            result = generate_rfi(result, out=result, ispersistent=True, freqchanswidth=3, RFIamplitude=150)
+            result = add_wandering_baseline(result, out=result, custom_baseline=np.full(2000, 3.0))
+        # Nothing is clipped or copied until the final step
+        self.assertIs(result, buffer)
+        self.assertGreater(result.max(), 255)
+        self.assertIs(finalise(result), buffer)
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    def test_out_leaves_data_unchanged(self):
+        data = np.full((8, 100), 100, dtype=np.float32)
+        out = np.empty_like(data)
+        result = generate_pulse(data, 10, 0.001, -2.0, 1400.0, out=out, pulse_duration=5, pulse_amplitude=500)
+        self.assertIs(result, out)
+        self.assertTrue(np.all(data == 100))
+        self.assertEqual(out.max(), 600)
+
+    def test_quantise_rounds_and_clips(self):
+        data = np.array([[-3.2, 0.4, 0.6, 254.5, 300.0, 1000.7]])
+        np.testing.assert_array_equal(quantise(data, block_nsamp=4), [[0, 0, 1, 254, 255, 255]])
+        self.assertEqual(quantise(data).dtype, np.uint8)
+        np.testing.assert_array_equal(quantise(data, nbits=16), [[0, 0, 1, 254, 300, 1001]])
+
+if __name__ == '__main__':
+    unittest.main()
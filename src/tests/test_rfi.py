@@ -1,6 +1,11 @@
 import numpy as np
 import unittest
 from spectralib.rfi import generate_rfi, add_wandering_baseline
+from spectralib.rfi import compile_rfi_scene, apply_rfi_scene, generate_rfi_scene
+from spectralib.rfi import moving_average, WanderingBaselineGenerator
+import io
+import contextlib
+import tracemalloc
 
 class TestRFI(unittest.TestCase):
     
@@ -13,6 +18,38 @@ class TestRFI(unittest.TestCase):
         self.assertEqual(self.data.shape, rfi_data.shape, "Data shapes don't match after RFI generation")
         self.assertNotEqual(np.sum(self.data), np.sum(rfi_data), "Data is not changed after RFI generation")
 
+    def test_generate_rfi_uint8(self):
+        data = np.full((8, 400), 100, np.uint8)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rfi_data = generate_rfi(data, ispersistent=True, RFIamplitude=200)
+        self.assertEqual(rfi_data.dtype, np.uint8)
+        # The RFI saturates at 255 instead of wrapping around
+        np.testing.assert_array_equal(rfi_data, np.full((8, 400), 255, np.uint8))
+
+    def test_integer_out(self):
+        data = np.full((8, 400), 250, np.uint8)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = generate_rfi(data, out=data, ispersistent=True, RFIamplitude=10)
+        self.assertIs(result, data)
+        np.testing.assert_array_equal(data, 255)
+
+        baseline = np.linspace(-300, 300, 400)
+        result = add_wandering_baseline(data, out=data, custom_baseline=baseline)
+        self.assertIs(result, data)
+        np.testing.assert_array_equal(data, np.broadcast_to(np.clip(np.rint(255 + baseline), 0, 255), data.shape))
+
+    def test_add_wandering_baseline_in_place_float(self):
+        data = np.zeros((64, 50000), np.float32)
+        baseline = np.linspace(-5, 5, 50000)
+        tracemalloc.start()
+        result = add_wandering_baseline(data, out=data, custom_baseline=baseline)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertIs(result, data)
+        np.testing.assert_allclose(data, np.broadcast_to(baseline, data.shape).astype(np.float32))
+        # No full-size temporary is made
+        self.assertLess(peak, data.nbytes // 4)
+
     def test_add_wandering_baseline(self):
         wanderingbaselineamplitude = 30
         wanderingbaselineperiod = 1000
@@ -21,5 +58,57 @@ class TestRFI(unittest.TestCase):
         self.assertEqual(self.data.shape, wb_data.shape, "Data shapes don't match after wandering baseline addition")
         self.assertNotEqual(np.sum(datacopy), np.sum(wb_data), "Data is not changed after wandering baseline addition")
 
+    def test_apply_rfi_scene_matches_interval_loop(self):
+        nchans, nsamp = 16, 2000
+        events = [
+            {'freqchanswidth': 3, 'ispersistent': True, 'RFIamplitude': 20},
+            {'freqchanswidth': 5, 'onlength': 7, 'dutycycle': 30, 'doesrepeat': True, 'numrepeats': 100, 'RFIamplitude': 10},
+            {'onlength': 13, 'dutycycle': 10, 'ispersistent': True, 'doesrepeat': True, 'RFIamplitude': 5},
+            {'onlength': 40, 'RFIamplitude': 50},
+        ]
+        table = compile_rfi_scene(events, nchans, nsamp, rng=np.random.default_rng(3))
+        data = np.zeros((nchans, nsamp))
+        expected = np.zeros((nchans, nsamp))
+        for event in table:
+            for i in range(event['count']):
+                start = event['first'] + i * event['period']
+                expected[event['chan_start']:event['chan_end'], start:start + event['width']] += event['amplitude']
+        np.testing.assert_array_equal(apply_rfi_scene(data, table), expected)
+        self.assertEqual(table[2]['count'], int(np.ceil((nsamp - 13) / 130)))
+
+    def test_generate_rfi_scene_matches_generate_rfi(self):
+        events = [
+            {'freqchanswidth': 2, 'ispersistent': True, 'RFIamplitude': 30},
+            {'freqchanswidth': 4, 'onlength': 3, 'dutycycle': 25, 'doesrepeat': True, 'numrepeats': 6, 'RFIamplitude': 60},
+            {'onlength': 2, 'RFIamplitude': 90},
+        ]
+        np.random.seed(11)
+        scene = generate_rfi_scene(self.data.copy(), events)
+        np.random.seed(11)
+        expected = self.data.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for event in events:
+                expected = generate_rfi(expected, **event)
+        np.testing.assert_allclose(scene, expected)
+        self.assertTrue(np.all((scene >= 0) & (scene <= 255)))
+
+    def test_add_wandering_baseline_matches_moving_average_loop(self):
+        nchans, nsamp, period = 4, 500, 37
+        data = np.full((nchans, nsamp), 127.0)
+        np.random.seed(5)
+        noise = np.random.normal(0, 10, nsamp + period)
+        expected = np.array([np.mean(noise[i:i + period]) for i in range(nsamp)])
+        np.random.seed(5)
+        result = add_wandering_baseline(data, wanderingbaselineamplitude=10, wanderingbaselineperiod=period)
+        for chan in range(nchans):
+            np.testing.assert_allclose(result[chan], 127 + expected)
+
+    def test_wandering_baseline_generator_is_continuous(self):
+        period = 50
+        generator = WanderingBaselineGenerator(3, period, rng=1)
+        blocks = np.concatenate([generator.next_block(n) for n in (7, 100, 1, 333)])
+        expected = moving_average(np.random.default_rng(1).normal(0, 3, period - 1 + 441), period)
+        np.testing.assert_allclose(blocks, expected)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,220 @@
+import unittest
+import numpy as np
+from spectralib.frb import generate_pulse
+from spectralib.dedisperse import dedisperse_filterbank_data_multi_dm
+from spectralib.search import boxcar_filter, running_baseline_and_rms, cluster_candidates, single_pulse_search, SINGLE_PULSE_CANDIDATE_DTYPE
+from spectralib.search import whiten_power_spectrum, harmonic_sum, periodicity_search
+from spectralib.search import acceleration_resampling_indices, acceleration_search, SPEED_OF_LIGHT
+from spectralib.search import ffa_transform, ffa_search
+from spectralib.filterbank import dedisperse_filterbank_data_to_timeseries
+from spectralib.pulsar import generate_solitary_pulsar, generate_binary_pulsar, apparent_pulse_period
+
+class TestSinglePulseSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.nchans, self.nsamp = 64, 8000
+        self.tsamp = 0.001
+        self.foff = -1.0
+        self.fch1 = 1400.0
+        self.data = np.random.normal(0, 18, size=(self.nchans, self.nsamp)) + 127
+
+    def test_boxcar_filter(self):
+        time_series = np.random.normal(0, 1, 1000)
+        filtered = boxcar_filter(time_series, 8)
+        self.assertEqual(len(filtered), 1000 - 8 + 1)
+        self.assertAlmostEqual(filtered[0], np.mean(time_series[:8]))
+
+    def test_running_baseline_and_rms(self):
+        time_series = np.random.normal(0, 3, size=(2, 20000)) + np.linspace(0, 100, 20000)
+        baseline, rms = running_baseline_and_rms(time_series, 500)
+        self.assertEqual(baseline.shape, time_series.shape)
+        np.testing.assert_allclose(baseline, np.linspace(0, 100, 20000)[np.newaxis, :].repeat(2, axis=0), atol=2.5)
+        np.testing.assert_allclose(rms, 3, rtol=0.25)
+
+    def test_cluster_candidates(self):
+        samples = np.array([100, 102, 104, 500, 501, 100])
+        DM_indices = np.array([3, 4, 4, 3, 20, 30])
+        labels = cluster_candidates(samples, DM_indices, time_tolerance=2, DM_tolerance=1)
+        self.assertEqual(len(set(labels[:3])), 1)
+        self.assertEqual(len(set(labels)), 4)
+
+    def test_cluster_candidates_matches_pairwise_clustering(self):
+        rng = np.random.default_rng(3)
+        samples = rng.integers(0, 2000, 400)
+        DM_indices = rng.integers(0, 50, 400)
+        # Reference: connected components of the full pairwise friendship matrix
+        friends = (np.abs(samples[:, np.newaxis] - samples[np.newaxis, :]) <= 5) & (np.abs(DM_indices[:, np.newaxis] - DM_indices[np.newaxis, :]) <= 2)
+        reachable = friends.copy()
+        while True:
+            grown = (reachable.astype(np.int64) @ friends.astype(np.int64)) > 0
+            if np.array_equal(grown, reachable):
+                break
+            reachable = grown
+        labels = cluster_candidates(samples, DM_indices, time_tolerance=5, DM_tolerance=2)
+        np.testing.assert_array_equal(labels[:, np.newaxis] == labels[np.newaxis, :], reachable)
+        self.assertEqual(len(cluster_candidates(np.zeros(0, np.int64), np.zeros(0, np.int64), 5)), 0)
+
+    def test_single_pulse_search_finds_injected_pulse(self):
+        DM = 400
+        data = generate_pulse(self.data, DM, self.tsamp, self.foff, self.fch1, pulse_start_index=5000, pulse_duration=8, pulse_amplitude=40)
+        DMs = np.arange(0, 800, 20)
+        dm_time = dedisperse_filterbank_data_multi_dm(data, DMs, self.tsamp, self.foff, self.fch1)
+        candidates = single_pulse_search(dm_time, DMs, self.tsamp, threshold=8)
+        self.assertGreaterEqual(len(candidates), 1)
+        best = candidates[0]
+        self.assertAlmostEqual(best["DM"], DM, delta=40)
+        self.assertLessEqual(abs(best["sample"] - 5000), 8)
+        self.assertAlmostEqual(best["time"], best["sample"] * self.tsamp)
+        self.assertGreater(best["snr"], 20)
+        self.assertGreater(best["members"], 1)
+
+    def test_single_pulse_search_noise(self):
+        dm_time = np.random.normal(0, 1, size=(4, 10000))
+        candidates = single_pulse_search(dm_time, np.arange(4), self.tsamp, threshold=7)
+        self.assertEqual(len(candidates), 0)
+        self.assertIn("snr", candidates.dtype.names)
+
+    def test_single_pulse_search_widths_longer_than_data(self):
+        candidates = single_pulse_search(np.random.normal(0, 1, size=(2, 100)), np.arange(2), self.tsamp, widths=[128, 256])
+        self.assertEqual(len(candidates), 0)
+        self.assertEqual(candidates.dtype, SINGLE_PULSE_CANDIDATE_DTYPE)
+
+class TestPeriodicitySearch(unittest.TestCase):
+
+    def test_whiten_power_spectrum(self):
+        spectrum = np.fft.rfft(np.random.normal(0, 1, 2 ** 14) + np.cumsum(np.random.normal(0, 0.1, 2 ** 14)))
+        power = whiten_power_spectrum(np.abs(spectrum) ** 2)
+        self.assertEqual(power[0], 0)
+        self.assertAlmostEqual(np.mean(power[1000:]), 1, delta=0.1)
+
+    def test_harmonic_sum(self):
+        power = np.zeros((1, 1024), dtype=np.float32)
+        power[0, 50::50] = 1
+        stages = harmonic_sum(power, nharmonics=16)
+        self.assertEqual([n for n, _ in stages], [1, 2, 4, 8, 16])
+        for n, summed in stages:
+            # The fundamental at bin 50 is at index 50 * n of the stage with n harmonics
+            self.assertEqual(summed[0, 50 * n], n)
+
+    def test_periodicity_search_finds_pulsar(self):
+        nchans, nsamp = 32, 2 ** 15
+        tsamp, foff, fch1 = 0.001, -2.0, 1400.0
+        DM, period = 100, 0.2537
+        data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+        data = generate_solitary_pulsar(data, DM, tsamp, foff, fch1, period, pulse_duration=8, pulse_amplitude=15)
+
+        DMs = np.array([0, 50, 100, 150])
+        dm_time = dedisperse_filterbank_data_multi_dm(data, DMs, tsamp, foff, fch1)
+        candidates = periodicity_search(dm_time, tsamp, DMs=DMs, nharmonics=16, batch_size=3)
+        self.assertGreaterEqual(len(candidates), 1)
+        best = candidates[0]
+        self.assertEqual(best["DM"], DM)
+        self.assertAlmostEqual(best["frequency"], 1 / period, delta=1 / (nsamp * tsamp))
+        self.assertTrue(np.all(np.diff(candidates["sigma"]) <= 0))
+
+    def test_periodicity_search_noise(self):
+        candidates = periodicity_search(np.random.normal(0, 1, size=(2, 2 ** 14)), 0.001, threshold=8)
+        self.assertEqual(len(candidates), 0)
+
+
+class TestAccelerationSearch(unittest.TestCase):
+
+    def test_acceleration_resampling_indices(self):
+        indices = acceleration_resampling_indices(1000, 0.001, [0, 1e7])
+        self.assertEqual(indices.shape, (2, 1000))
+        np.testing.assert_array_equal(indices[0], np.arange(1000))
+        self.assertEqual(indices[1, 500], 500)
+        self.assertTrue(np.all((indices >= 0) & (indices < 1000)))
+
+    def test_acceleration_search_recovers_acceleration(self):
+        nsamp, tsamp = 2 ** 17, 0.0005
+        frequency, acceleration = 200.0, 3000.0
+        centred_time = np.arange(nsamp) * tsamp - nsamp * tsamp / 2
+        phase = frequency * (centred_time - acceleration * centred_time ** 2 / (2 * SPEED_OF_LIGHT))
+        time_series = np.random.normal(0, 1, nsamp) + 0.5 * (phase % 1 < 0.05)
+
+        accelerations = np.arange(-5000, 5001, 500)
+        candidates = acceleration_search(time_series, tsamp, accelerations, nharmonics=8, batch_size=7, nworkers=2)
+        best = candidates[0]
+        self.assertAlmostEqual(best["acceleration"], acceleration, delta=500)
+        # The strongest detection can be a subharmonic of the pulse frequency
+        harmonic = frequency / best["frequency"]
+        self.assertGreaterEqual(round(harmonic), 1)
+        self.assertAlmostEqual(best["frequency"] * round(harmonic), frequency, delta=2 / (nsamp * tsamp))
+
+        unaccelerated = periodicity_search(time_series, tsamp, nharmonics=8)
+        self.assertTrue(len(unaccelerated) == 0 or unaccelerated[0]["sigma"] < best["sigma"])
+
+    def test_acceleration_search_recovers_binary_pulsar(self):
+        nchans, nsamp = 16, 2 ** 17
+        tsamp, foff, fch1, DM = 0.0005, -4.0, 1400.0, 50
+        # A 30 minute orbit seen near its largest line of sight acceleration, about 1900 m/s^2
+        binary_params = {
+            'rest_period': 0.005,
+            'inclination': np.pi / 2,
+            'orbital_period': 1800.0,
+            'start_phase': 0.25,
+            'companion_mass': 1.4,
+            'pulsar_mass': 1.4,
+            'eccentricity': 0.0,
+            'omega': 0.0
+        }
+        data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+        data = generate_binary_pulsar(data, DM, tsamp, foff, fch1, binary_params, pulse_duration=2, pulse_amplitude=3)
+        time_series = dedisperse_filterbank_data_to_timeseries(data, DM, tsamp, foff, fch1)
+
+        # Apparent pulse frequency and line of sight acceleration at the middle of the observation
+        middle = nsamp * tsamp / 2
+        frequency = 1 / apparent_pulse_period(binary_params, middle)
+        velocity = SPEED_OF_LIGHT * (apparent_pulse_period(binary_params, np.array([middle - 1, middle + 1])) / binary_params['rest_period'] - 1)
+        acceleration = (velocity[1] - velocity[0]) / 2
+
+        def frequency_error(candidate):
+            # The strongest detection can be a subharmonic of the pulse frequency
+            return abs(candidate["frequency"] * round(frequency / candidate["frequency"]) - frequency)
+
+        accelerated = acceleration_search(time_series, tsamp, np.arange(-5000, 5001, 250), nharmonics=8, nworkers=1)[0]
+        unaccelerated = periodicity_search(time_series, tsamp, nharmonics=8)[0]
+        self.assertAlmostEqual(accelerated["acceleration"], acceleration, delta=500)
+        self.assertLess(frequency_error(accelerated), 0.5 / (nsamp * tsamp))
+        self.assertLessEqual(frequency_error(accelerated), frequency_error(unaccelerated))
+        self.assertGreater(accelerated["sigma"], 1.2 * unaccelerated["sigma"])
+
+
+class TestFFASearch(unittest.TestCase):
+
+    def test_ffa_transform(self):
+        for nrows in [2, 5, 8, 16, 33]:
+            for drift in [0, nrows - 1]:
+                folded = np.zeros((nrows, 50))
+                folded[np.arange(nrows), 10 + drift * np.arange(nrows) // (nrows - 1)] = 1
+                transform = ffa_transform(folded)
+                self.assertEqual(transform.shape, folded.shape)
+                self.assertEqual(transform[drift, 10], nrows)
+
+    def test_ffa_search_finds_long_period_pulsar(self):
+        nchans, nsamp = 32, 2 ** 16
+        tsamp, foff, fch1 = 0.001, -2.0, 1400.0
+        DM, period = 100, 1.0
+        data = np.random.normal(0, 18, size=(nchans, nsamp)) + 127
+        data = generate_solitary_pulsar(data, DM, tsamp, foff, fch1, period, pulse_duration=20, pulse_amplitude=5)
+        time_series = dedisperse_filterbank_data_to_timeseries(data, DM, tsamp, foff, fch1)
+
+        periodogram = ffa_search(time_series, tsamp, 0.5, 2.0)
+        self.assertTrue(np.all(np.diff(periodogram["period"]) >= 0))
+        self.assertGreaterEqual(periodogram["period"][0], 0.5)
+        self.assertLessEqual(periodogram["period"][-1], 2.0)
+        best = periodogram[np.argmax(periodogram["snr"])]
+        self.assertAlmostEqual(best["period"], period, delta=0.002)
+        self.assertGreater(best["snr"], 10)
+
+    def test_ffa_search_period_shorter_than_bins_min(self):
+        time_series = np.random.normal(0, 1, 4096)
+        with self.assertRaises(ValueError):
+            ffa_search(time_series, 0.001, 0.032, 0.2)
+        periodogram = ffa_search(time_series, 0.001, 0.032, 0.2, bins_min=32)
+        self.assertAlmostEqual(periodogram["period"][0], 0.032)
+
+
+if __name__ == '__main__':
+    unittest.main()